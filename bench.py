@@ -0,0 +1,207 @@
+'''
+bench.py
+Benchmarks for the calculation, redraw, and startup paths of the program.
+Times:
+    calculate     - RunSim.calculate of a window (the GUI's compute path),
+                    per call
+    engineCalculate - engine.calculate on its own, without a window
+    getCal        - Person.getCal (remembered) and Person.calcCal (worked out)
+    update        - Driver.update
+    updateGraph   - a full updateGraph redraw of the window on the Agg backend
+    sliderDrag    - a scripted drag of the distance slider (1,000 events)
+    import        - cold import of graphMain in a new python process
+    startup       - cold start to a drawn RunSim window (Agg) in a new process
+    firstFrame    - RunSim.firstFrame of a fastStart window (Agg) in a new
+                    process, from when graphMain was loaded to the graphs drawn
+
+The results are written to a JSON file, and can be compared with an earlier
+run to catch regressions:
+    >> python3 bench.py -o new.json --compare old.json
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def timeCalls(fn, number, repeat=5):
+    ''' Calls fn number times, repeat times over, and returns a dictionary
+    of statistics of the seconds per call across the repeats.'''
+    perCall = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            fn()
+        perCall.append((time.perf_counter() - start) / number)
+    return {'number':number, 'repeat':repeat, 'mean':statistics.mean(perCall),
+            'median':statistics.median(perCall), 'min':min(perCall),
+            'max':max(perCall)}
+
+
+def timeProcess(code, repeat=5):
+    ''' Runs code in a new python process repeat times and returns a
+    dictionary of statistics of the seconds it took.'''
+    env = dict(os.environ, MPLBACKEND='Agg')
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env,
+                    check=True, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return {'number':1, 'repeat':repeat, 'mean':statistics.mean(seconds),
+            'median':statistics.median(seconds), 'min':min(seconds),
+            'max':max(seconds)}
+
+
+def timeFirstFrame(repeat=5):
+    ''' Starts a fastStart RunSim window repeat times, each in a new python
+    process, and returns a dictionary of statistics of its firstFrame.'''
+    env = dict(os.environ, MPLBACKEND='Agg')
+    code = 'import graphMain; print(graphMain.RunSim(fastStart=True, ' \
+           'startTime=graphMain.START_TIME).firstFrame)'
+    seconds = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env,
+                    check=True, capture_output=True, text=True).stdout
+        seconds.append(float(out.split()[-1]))
+    return {'number':1, 'repeat':repeat, 'mean':statistics.mean(seconds),
+            'median':statistics.median(seconds), 'min':min(seconds),
+            'max':max(seconds)}
+
+
+def benchCompute(results, quick):
+    ''' Benchmarks of the calculations, which don't need matplotlib.'''
+    import engine
+    from modes import Driver, Biker, Walker, Person
+
+    scale = 10 if quick else 1
+    d, b, w = Driver(), Biker(), Walker()
+    results['engineCalculate'] = timeCalls(lambda: engine.calculate(d, b, w,
+                12.5, 3), 20000 // scale)
+
+    p = Person('biker')
+    results['getCal'] = timeCalls(p.getCal, 100000 // scale)
+    results['calcCal'] = timeCalls(p.calcCal, 100000 // scale)
+    results['update'] = timeCalls(d.update, 100000 // scale)
+
+
+def benchGUI(results, quick):
+    ''' Benchmarks of the window, drawn with the Agg backend.'''
+    import matplotlib
+    matplotlib.use('Agg')
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    import graphMain
+
+    sim = graphMain.RunSim()
+    sim.fig.canvas.draw()
+
+    # What the GUI runs for every change, with its own mode objects
+    results['calculate'] = timeCalls(sim.calculate, 2000 if quick else 20000)
+
+    def redraw():
+        sim.updateGraph(full=True)
+    results['updateGraph'] = timeCalls(redraw, 2 if quick else 10, 3)
+
+    # Every event is its own frame, so each one is recalculated and drawn
+    events = 100 if quick else 1000
+    def drag():
+        for i in range(events):
+            sim.slideDist.set_val(1 + 50.0*i/events)
+            sim.scheduler.flush()
+    drag = timeCalls(drag, 1, 1)
+    drag['events'] = events
+    drag['fps'] = events / drag['mean']
+    results['sliderDrag'] = drag
+
+
+def benchStartup(results, quick):
+    ''' Benchmarks of cold startup, each in a new python process.'''
+    repeat = 2 if quick else 5
+    results['import'] = timeProcess('import graphMain', repeat)
+    results['startup'] = timeProcess('import graphMain; '
+                'graphMain.RunSim().fig.canvas.draw()', repeat)
+    results['firstFrame'] = timeFirstFrame(repeat)
+
+
+def getInfo():
+    ''' Returns details of where and what was benchmarked.'''
+    info = {'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python':platform.python_version(), 'platform':platform.platform()}
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE,
+                    capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for module in ('numpy', 'matplotlib'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            pass
+    return info
+
+
+def compare(new, old, threshold):
+    ''' Prints how each benchmark changed from an old run, and returns the
+    names of those that got slower by more than threshold (e.g. 0.1 = 10%).
+    The fastest repeat is compared, since it is the least affected by
+    whatever else the machine was doing.'''
+    slower = []
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            continue
+        ratio = result['min'] / old['results'][name]['min']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  <-- slower'
+            slower.append(name)
+        print('%-16s %10.3g s -> %10.3g s  (x%.2f)%s' % (name,
+                    old['results'][name]['min'], result['min'], ratio,
+                    flag))
+    return slower
+
+
+def main(argv=None):
+    ''' Parses the command line, runs the benchmarks, and writes the
+    results. Exits with status 1 if a comparison finds regressions.'''
+    parser = argparse.ArgumentParser(description='Benchmark the program.')
+    parser.add_argument('-o', '--output', default='bench_results.json',
+                help='JSON file for the results (default: bench_results.json)')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                help='slowdown counted as a regression (default: 0.1)')
+    parser.add_argument('--only', nargs='+',
+                choices=('compute', 'gui', 'startup'),
+                default=['compute', 'gui', 'startup'],
+                help='groups of benchmarks to run (default: all)')
+    parser.add_argument('--quick', action='store_true',
+                help='fewer repetitions, for a fast check')
+    args = parser.parse_args(argv)
+
+    results = {}
+    groups = {'compute':benchCompute, 'gui':benchGUI, 'startup':benchStartup}
+    for group in args.only:
+        groups[group](results, args.quick)
+
+    run = {'info':getInfo(), 'results':results}
+    with open(args.output, 'w') as f:
+        json.dump(run, f, indent=2)
+    for name, result in results.items():
+        print('%-16s median %10.3g s  min %10.3g s' % (name, result['median'],
+                    result['min']))
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(run, old, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+'''
+breakeven.py
+Works out where one mode starts to beat another, instead of dragging the
+distance slider until the bars swap. Everything RunSim.calculate works out
+is a number per mile times the miles travelled, so the generalized cost
+(see modechoice.getScores) of each mode is a straight line in the miles,
+and where two lines cross can be solved for exactly:
+    >> python3 breakeven.py driver biker --value-of-time 15 \
+           --trip-minutes driver=8 --trip-cost driver=3 -o crossover.csv
+
+With nothing but the per-mile costs, the lines all start at 0, so one mode
+is cheaper at every distance, and what decides it is how much time is
+worth: breakEvenValueOfTime gives the $/hour at which two modes cost the
+same. Adding what each trip costs whatever its length (e.g. minutes spent
+parking or locking up the bike, a parking fee) gives a break-even
+distance, and adding what a mode costs however many trips are made (e.g.
+buying a bike) gives a break-even number of trips.
+
+getSurface works any of these out over a grid of two settings (car
+category, spending, sex, weight, height, age, value of time, calorie
+value, distance) with one call to engine.calculateBatch, for plotting
+(--plot draws it with matplotlib).
+'''
+import argparse
+import csv
+import sys
+import numpy as np
+import engine
+import modechoice
+
+# The settings a surface can be drawn over, and their defaults
+SETTINGS = {'cat':'average', 'bikeSpend':100.0, 'shoeSpend':37.5, 'sex':'M',
+            'weight':None, 'height':None, 'age':None, 'valueOfTime':0.0,
+            'calValue':0.0, 'dist':1.0}
+
+# What can be solved for
+METRICS = ('dist', 'trips', 'valueOfTime')
+
+
+def getRates(modes=engine.MODES, cat='average', bikeSpend=100.0,
+             shoeSpend=37.5, sex='M', weight=None, height=None, age=None,
+             valueOfTime=0.0, calValue=0.0, **ignored):
+    ''' Returns (slope, calc): the generalized cost ($/mile) of each mode
+    (rows x modes), and engine.calculateBatch's results for 1 mile, which
+    are the per-mile time, cost, calories and CO2. The parameters may be
+    scalars or arrays with one value per row.'''
+    calc = engine.calculateBatch(1.0, 1, cat, bikeSpend, shoeSpend, sex,
+                weight, height, age, modes=modes)
+    n = np.broadcast(*[np.asarray(v) for v in (calc['time'][:, 0],
+                valueOfTime, calValue)]).shape[0]
+    if n != len(calc['time']):
+        calc = {k:np.broadcast_to(v, (n,) + v.shape[1:]) for k, v in
+                calc.items()}
+    return modechoice.getScores(calc, valueOfTime, calValue), calc
+
+
+def getIntercepts(modes, valueOfTime=0.0, tripMinutes=None, tripCost=None):
+    ''' Returns the generalized cost ($) of each trip in each mode that
+    doesn't depend on its length (rows or 1 x modes). tripMinutes and
+    tripCost are dictionaries ({mode: minutes or $ per trip}).'''
+    minutes = np.array([(tripMinutes or {}).get(m, 0.0) for m in modes])
+    cost = np.array([(tripCost or {}).get(m, 0.0) for m in modes])
+    return cost + modechoice.asColumn(valueOfTime) * minutes / 60
+
+
+def breakEvenDistance(slope, intercept, i, j):
+    ''' Returns the miles per trip at which modes i and j (columns of slope
+    and intercept) cost the same, or nan where one is cheaper at every
+    distance. Beyond it, the mode with the smaller slope is cheaper.'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist = ((intercept[:, j] - intercept[:, i])
+                / (slope[:, i] - slope[:, j]))
+    return np.where(np.isfinite(dist) & (dist > 0), dist, np.nan)
+
+
+def breakEvenTrips(slope, intercept, i, j, dist, fixed=None, modes=None):
+    ''' Returns the number of trips of dist miles after which modes i and j
+    have cost the same, counting fixed costs ({mode: $}) that are paid
+    however many trips are made, or nan where one is cheaper for any
+    number of trips. After it, the mode that costs less per trip is
+    cheaper.'''
+    fixed = fixed or {}
+    perTrip = intercept + slope * modechoice.asColumn(dist)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        trips = ((fixed.get(modes[j], 0.0) - fixed.get(modes[i], 0.0))
+                 / (perTrip[:, i] - perTrip[:, j]))
+    return np.where(np.isfinite(trips) & (trips > 0), trips, np.nan)
+
+
+def breakEvenValueOfTime(calc, i, j, calValue=0.0):
+    ''' Returns the value of time ($/hour) at which modes i and j cost the
+    same per mile, or nan where one is cheaper for every value of time.
+    Above it, the faster mode is cheaper.'''
+    other = calc['cost'] - modechoice.asColumn(calValue) * calc['cal']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = ((other[:, j] - other[:, i])
+                 / (calc['time'][:, i] - calc['time'][:, j]))
+    return np.where(np.isfinite(value) & (value >= 0), value, np.nan)
+
+
+def solve(metric, pair, modes=engine.MODES, tripMinutes=None, tripCost=None,
+          fixed=None, **settings):
+    ''' Returns the break-even metric (one of METRICS) of the two modes of
+    pair for settings (see SETTINGS, scalars or arrays), one value per row.'''
+    i, j = modes.index(pair[0]), modes.index(pair[1])
+    values = dict(SETTINGS)
+    values.update(settings)
+    slope, calc = getRates(modes, **values)
+    if metric == 'valueOfTime':
+        return breakEvenValueOfTime(calc, i, j, values['calValue'])
+    intercept = getIntercepts(modes, values['valueOfTime'], tripMinutes,
+                tripCost)
+    if metric == 'dist':
+        return breakEvenDistance(slope, intercept, i, j)
+    if metric == 'trips':
+        return breakEvenTrips(slope, intercept, i, j, values['dist'], fixed,
+                    modes)
+    raise ValueError('Unknown metric: %s (use one of %s)' % (metric,
+                ', '.join(METRICS)))
+
+
+def getSurface(metric, pair, xName, xValues, yName, yValues, **kwargs):
+    ''' Returns the break-even metric (see solve) for every combination of
+    the values of two settings, as an array of len(yValues) rows and
+    len(xValues) columns. The other settings are given as keywords.'''
+    for name in (xName, yName):
+        if name not in SETTINGS:
+            raise ValueError('Unknown setting: %s (use one of %s)' % (name,
+                        ', '.join(SETTINGS)))
+    y, x = np.meshgrid(np.arange(len(yValues)), np.arange(len(xValues)),
+                indexing='ij')
+    kwargs[xName] = np.asarray(xValues)[x.ravel()]
+    kwargs[yName] = np.asarray(yValues)[y.ravel()]
+    return solve(metric, pair, **kwargs).reshape(x.shape)
+
+
+def getAxisValues(name, values):
+    ''' Returns the values of a setting for an axis of a surface, from the
+    command line: car categories, sexes, or numbers (start stop count).'''
+    if name == 'cat':
+        return list(values or engine.CATEGORIES)
+    if name == 'sex':
+        return list(values or ('M', 'F'))
+    if not values and name in ('bikeSpend', 'shoeSpend'):
+        return list(engine.SPEND_BRACKETS.values())
+    if not values or len(values) != 3:
+        raise ValueError('Give %s as: start stop count' % name)
+    return np.linspace(float(values[0]), float(values[1]), int(values[2]))
+
+
+def getLabel(value):
+    ''' Returns the text of a value of a setting, for the output.'''
+    return value if isinstance(value, str) else '%g' % value
+
+
+def parsePairs(items):
+    ''' Returns {mode: number} from command line items like driver=5.'''
+    pairs = {}
+    for item in items or ():
+        mode, _, value = item.partition('=')
+        pairs[mode] = float(value)
+    return pairs
+
+
+def main(argv=None):
+    ''' Parses the command line, works out a break-even surface, and writes
+    it as CSV (a row per y value, a column per x value) or a plot.'''
+    parser = argparse.ArgumentParser(description='Work out where one mode '
+                'starts to beat another over a grid of two settings.')
+    parser.add_argument('modes', nargs=2, choices=engine.MODES)
+    parser.add_argument('--metric', choices=METRICS, default=None,
+                help='what to solve for (default: dist if there are trip '
+                'costs, else valueOfTime)')
+    parser.add_argument('-x', default='cat', choices=sorted(SETTINGS),
+                help='setting along x (default: cat)')
+    parser.add_argument('-y', default='bikeSpend', choices=sorted(SETTINGS),
+                help='setting along y (default: bikeSpend)')
+    parser.add_argument('--x-values', nargs='*', help='categories or sexes, '
+                'or start stop count')
+    parser.add_argument('--y-values', nargs='*')
+    parser.add_argument('--value-of-time', type=float, default=0.0,
+                help='$/hour (default: 0)')
+    parser.add_argument('--cal-value', type=float, default=0.0,
+                help='$/calorie burned (default: 0)')
+    parser.add_argument('--dist', type=float, default=1.0,
+                help='miles per trip, for --metric trips (default: 1)')
+    parser.add_argument('--trip-minutes', nargs='*', metavar='MODE=MIN',
+                help='minutes each trip takes whatever its length')
+    parser.add_argument('--trip-cost', nargs='*', metavar='MODE=$',
+                help='$ each trip costs whatever its length')
+    parser.add_argument('--fixed', nargs='*', metavar='MODE=$',
+                help='$ a mode costs however many trips are made')
+    parser.add_argument('-o', '--output', help='CSV file (default: stdout)')
+    parser.add_argument('--plot', help='image file to draw the surface in')
+    args = parser.parse_args(argv)
+
+    tripMinutes = parsePairs(args.trip_minutes)
+    tripCost = parsePairs(args.trip_cost)
+    metric = args.metric or ('dist' if tripMinutes or tripCost
+                             else 'valueOfTime')
+    xValues = getAxisValues(args.x, args.x_values)
+    yValues = getAxisValues(args.y, args.y_values)
+    settings = {'valueOfTime':args.value_of_time, 'calValue':args.cal_value,
+                'dist':args.dist}
+    surface = getSurface(metric, args.modes, args.x, xValues, args.y,
+                yValues, tripMinutes=tripMinutes, tripCost=tripCost,
+                fixed=parsePairs(args.fixed), **settings)
+
+    out = sys.stdout if args.output is None else open(args.output, 'w',
+                newline='')
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['%s\\%s' % (args.y, args.x)] + [getLabel(x)
+                        for x in xValues])
+        for y, row in zip(yValues, surface):
+            writer.writerow([getLabel(y)] + ['%.6g' % v for v in row])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(figsize=(8, 5))
+        image = ax.imshow(surface, aspect='auto', origin='lower',
+                    cmap='viridis')
+        ax.set_xticks(range(len(xValues)), [getLabel(x) for x in xValues],
+                    rotation=45, ha='right')
+        ax.set_yticks(range(len(yValues)), [getLabel(y) for y in yValues])
+        ax.set_xlabel(args.x)
+        ax.set_ylabel(args.y)
+        ax.set_title('Break-even %s: %s vs %s' % (metric, *args.modes))
+        fig.colorbar(image)
+        fig.tight_layout()
+        fig.savefig(args.plot)
+
+if __name__ == "__main__":
+    main()
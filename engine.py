@@ -0,0 +1,222 @@
+'''
+engine.py
+The calculations behind the program, kept apart from the GUI in graphMain so
+they can be used without importing matplotlib. The calculate function does
+the calculating for RunSim (a single distance and number of trips). The batch
+functions accept NumPy arrays of trips (one row per trip) and return columnar
+NumPy results, so millions of rows can be scored without any per-row python
+code.
+
+The numbers (speeds, AAA costs, Harris–Benedict coefficients, unit
+conversions) are the same ones used by the Driver, Biker, Walker and Person
+classes in the modes module, so the results match what the GUI shows. The
+modes themselves are declared in the registry module, and the batch
+functions can work out any of the registered modes, all in one array
+operation.
+
+Results are worked out in base units only (hours, dollars, calories, lbs of
+CO2) and returned as units.Results, which converts them to the other units
+(minutes, audiobooks, coffees, trees, and any registered later) only when
+those are asked for.
+'''
+import numpy as np
+import registry
+import units
+from modes import Driver
+
+# Order of the columns in every per-mode result by default: [0]=driver,
+# [1]=biker, [2]=walker (the same order as the lists in RunSim.calculate's
+# calcDict). calculateBatch can be given other registered modes.
+MODES = ('driver', 'biker', 'walker')
+
+# Unit conversions used by RunSim.calculate (see the units module)
+HOURS_PER_AUDIOBOOK = units.HOURS_PER_AUDIOBOOK
+DOLLARS_PER_COFFEE = units.DOLLARS_PER_COFFEE
+LBS_CO2_PER_TREE = units.LBS_CO2_PER_TREE
+
+# Activity multipliers for the Harris–Benedict equation (see Person.getCal)
+ACT_MULT = registry.ACT_MULT
+# The same multipliers as an array, indexed by activity level code
+ACT_LEVELS = tuple(ACT_MULT)
+ACT_MULT_TABLE = np.array([ACT_MULT[a] for a in ACT_LEVELS])
+
+# Harris–Benedict coefficients (see Person.getBMR), one row per sex:
+# [constant, weight, height, age]
+BMR_COEF = {'M':[66, 6.23, 12.7, -6.76], 'F':[655.1, 4.35, 4.7, -4.7]}
+
+# Default weight (lbs), height (in) and age for each sex (see Person.setSex)
+SEX_DEFAULTS = {'M':[195.5, 69.3, 21], 'F':[162.9, 63.8, 21]}
+
+# Spending brackets offered in the GUI for bike parts/maintenance ($/year)
+# and for a new pair of shoes, with the $ amount used for each
+SPEND_BRACKETS = {'$0-25':12.5, '$25-50':37.5, '$50-100':75, '$100-150':125,
+                  '$150-200':175, '>$200':250}
+
+# Car categories, in the order of the integer codes accepted for 'cat'
+_driver = Driver()
+CATEGORIES = tuple(_driver.catDict)
+# One row per category: [gas($/mile), maint($/mile), tires($/mile), MPG]
+CAT_TABLE = np.array([_driver.catDict[c][:4] for c in CATEGORIES])
+
+
+def calculate(d, b, w, dist, trips):
+    ''' Uses attributes of a driver, biker, and walker object to calculate
+    values for time, cost, calorie burn, and CO2 emitted in various units
+    for a distance (miles) travelled a number of times. This information is
+    returned in the handy-dandy dictionary: calcDict.'''
+    return calculateModes((d, b, w), dist, trips)
+
+
+def calculateModes(modes, dist, trips):
+    ''' The same as calculate, for any list of mode objects (see
+    modes.makeMode), the first of which must be the driver. The lists in
+    calcDict have one entry per mode, in the same order.'''
+
+    # Dictionary that holds calculations for different categories in the form
+    # of lists, where [0]=driver, [1]=biker, [2]=walker, and then any others.
+    # Only base units are held; the others (time-mins, time-audio,
+    # cost-coffee, CO2-tree) are converted from these when asked for.
+    calcDict = units.Results({'time':[],'cost':[], 'cal':[], 'cal-hour':[],
+    'cal-sansBMR':[], 'CO2-mode':[], 'CO2':0.0})
+
+    miles = dist*trips
+    calHour = [m.person.getCal() for m in modes]
+
+    # Time in hours
+    calcDict['time'] = [miles / m.getMPH() for m in modes]
+
+    # Cost in US dollars
+    calcDict['cost'] = [m.getCost()*miles for m in modes]
+
+    # Total calories burned
+    calcDict['cal'] = [c*t for c, t in zip(calHour, calcDict['time'])]
+
+    #Cal burned per hour
+    calcDict['cal-hour'] = calHour
+
+    # CO2 emissions of each mode in lbs
+    calcDict['CO2-mode'] = [m.getCO2()*miles for m in modes]
+
+    # CO2 emissions in lbs (of driving, so not emitted by not driving)
+    calcDict['CO2'] = calcDict['CO2-mode'][0]
+
+    return calcDict
+
+
+def catCodes(cat):
+    ''' Accepts an array of car categories, either as names from
+    Driver.catDict ('average', 'smallSedan', ...) or as integer codes
+    (indexes into CATEGORIES), and returns an array of integer codes.
+    Only the unique names are looked up, so this is cheap for large arrays.'''
+    cat = np.asarray(cat)
+    if cat.dtype.kind in 'iu':
+        if cat.size and (cat.min() < 0 or cat.max() >= len(CATEGORIES)):
+            raise ValueError('Car category code out of range')
+        return cat
+    names, inverse = np.unique(cat, return_inverse=True)
+    lookup = {c:i for i, c in enumerate(CATEGORIES)}
+    try:
+        codes = np.array([lookup[str(n)] for n in names], dtype=np.intp)
+    except KeyError as e:
+        raise ValueError('Unknown car category: %s' % e.args[0])
+    return codes[inverse].reshape(cat.shape)
+
+
+def isMale(sex):
+    ''' Accepts an array of sexes ('M' or 'F') and returns a boolean
+    array that is True where the sex is 'M'. Boolean input is returned
+    as is (True meaning male).'''
+    sex = np.asarray(sex)
+    if sex.dtype == bool:
+        return sex
+    male = (sex == 'M')
+    if not np.all(male | (sex == 'F')):
+        raise ValueError("Sex must be 'M' or 'F'")
+    return male
+
+
+def getBMR(male, weight, height, age):
+    ''' Vectorized Harris–Benedict equation (see Person.getBMR). Accepts a
+    boolean array (True for male) and arrays of weight, height, and age, and
+    returns the basal metabolic rate (cal/day) of each row.'''
+    m, f = BMR_COEF['M'], BMR_COEF['F']
+    return (np.where(male, m[0], f[0]) + np.where(male, m[1], f[1])*weight
+            + np.where(male, m[2], f[2])*height + np.where(male, m[3], f[3])*age)
+
+
+def calculateBatch(dist, trips=1, cat='average', bikeSpend=100.0,
+                   shoeSpend=37.5, sex='M', weight=None, height=None, age=None,
+                   bikeMiles=1500.0, shoeMiles=1000.0, mpg=None, modes=MODES):
+    ''' Batch version of RunSim.calculate. Every parameter may be a scalar
+    or a 1-d array with one value per row, and they are broadcast together:
+        dist, trips         - miles per trip and number of trips
+        cat                 - car category (name or code, see catCodes)
+        bikeSpend/bikeMiles - $/year on bike parts and miles biked per year
+        shoeSpend/shoeMiles - $ for a pair of shoes and miles they last
+        sex                 - 'M' or 'F' (or booleans, True for male)
+        weight/height/age   - if None, the defaults for the sex are used
+        mpg                 - if given, used for CO2 instead of the MPG of
+                              the car category (e.g. from vehicles.py)
+    modes are the names of the registered modes to work out (see the
+    registry module); the other modes are worked out from their ModeSpecs.
+    Returns a units.Results with the same keys as calcDict. The per-mode entries
+    are arrays of shape (rows, len(modes)) whose columns follow modes, and
+    'CO2' and 'CO2-tree' (of driving) are arrays of shape (rows,).'''
+    modes = tuple(modes)
+    tables = registry.getTables(modes)
+    # The person's attributes and mpg are broadcast with the rest, with nan
+    # standing in for None until the rows (and their sexes) are known
+    given = (weight, height, age, mpg)
+    (dist, trips, codes, bikeSpend, shoeSpend, male, bikeMiles, shoeMiles,
+     weight, height, age, mpg) = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(dist, dtype=float)), trips, catCodes(cat),
+        bikeSpend, shoeSpend, isMale(sex), bikeMiles, shoeMiles,
+        *[np.nan if v is None else np.asarray(v, dtype=float) for v in given])
+
+    # Fill in the defaults for the sex where no custom value was given
+    if given[0] is None:
+        weight = np.where(male, SEX_DEFAULTS['M'][0], SEX_DEFAULTS['F'][0])
+    if given[1] is None:
+        height = np.where(male, SEX_DEFAULTS['M'][1], SEX_DEFAULTS['F'][1])
+    if given[2] is None:
+        age = np.where(male, SEX_DEFAULTS['M'][2], SEX_DEFAULTS['F'][2])
+
+    miles = dist*trips
+    catRows = CAT_TABLE[codes]
+    if given[3] is None:
+        mpg = catRows[:, 3]
+    carCO2 = Driver.LBS_CO2_PER_GAL / mpg
+
+    # Cost of each mode in $/mile, one column per mode: the cost declared
+    # for it, plus the car's for the modes that use one. The biker's and
+    # walker's come from the spending given here instead.
+    perMile = np.tile(tables['perMile'], (len(miles), 1))
+    perMile[:, tables['usesCar']] += catRows[:, :3].sum(axis=1)[:, None]
+    if 'biker' in modes:
+        perMile[:, modes.index('biker')] = bikeSpend/bikeMiles
+    if 'walker' in modes:
+        perMile[:, modes.index('walker')] = shoeSpend/shoeMiles
+
+    calHour = getBMR(male, weight, height, age)[:, None] * tables['actMult'] / 24
+
+    calc = evaluate(miles, tables['mph'], perMile, calHour, carCO2)
+    CO2PerMile = tables['CO2PerMile'] + np.outer(carCO2, tables['usesCar'])
+    calc['CO2-mode'] = CO2PerMile * miles[:, None]
+    return calc
+
+
+def evaluate(miles, mph, perMile, calHour, CO2PerMile):
+    ''' The arithmetic shared by the batch functions. Accepts an array of
+    miles travelled (dist*trips) with shape (rows,), and the speed (MPH),
+    cost ($/mile) and calorie burn (cal/hour) of each mode, each of shape
+    (rows, 3) or (3,), and the driver's CO2 (lbs/mile) of shape (rows,)
+    or scalar. Returns the units.Results described in calculateBatch (only
+    the base units are worked out here).'''
+    time = miles[:, None] / mph
+    cost = perMile * miles[:, None]
+    CO2 = CO2PerMile * miles
+    if np.shape(calHour) != time.shape:
+        calHour = np.broadcast_to(calHour, time.shape).copy()
+
+    return units.Results({'time':time, 'cost':cost, 'cal':calHour*time,
+                          'cal-hour':calHour, 'CO2':CO2})
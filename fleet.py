@@ -0,0 +1,219 @@
+'''
+fleet.py
+A yearly CO2 inventory of a fleet of vehicles, from a (possibly multi-GB)
+vehicle registry CSV instead of the single car of Driver.getCO2. For
+example:
+    >> python3 fleet.py registry.csv --by owner --by fuel -o inventory.csv
+
+The registry needs a header row with these columns (others are ignored,
+but can be grouped by):
+    model     - car model, looked up in data/carMPG.csv (see vehicles.py)
+    miles     - miles driven in a year
+    fuel      - optional, a name in FUELS (blank means gasoline)
+    mpg       - optional, MPG used instead of the model's
+    category  - optional, Driver.catDict category whose MPG is used for
+                models that aren't in the car data (default 'average')
+
+Each row's MPG comes from its mpg column, else its model, else its
+category, and is scaled by its fuel's mpgFactor; its CO2 is the miles over
+the MPG times its fuel's lbs of CO2 per gallon. Fuels with 0 lbs of CO2
+per gallon (electric) aren't burned by the gallon, so their gallons are 0.
+Miles must be finite and not negative.
+
+Like triplog.py, the registry is read in chunks of a fixed number of rows,
+everything in a chunk is worked out at once with numpy (model names are
+only looked up once per chunk for each name), and totals are kept per
+group with triplog.GroupTotals, so memory use depends on the chunk size
+and the number of groups, not on the size of the registry.
+'''
+import argparse
+import sys
+import time
+import numpy as np
+import engine
+import triplog
+import units
+import vehicles
+from modes import Driver
+
+# Fuels: (lbs of CO2 per gallon, MPG compared to gasoline). Gasoline is the
+# EPA's 19.6 used by Driver. Diesel is 22.4 lbs/gal (EIA). E85 is 85%
+# ethanol at 12.7 lbs/gal (EIA) and gets about 25% fewer miles per gallon
+# (fueleconomy.gov). Electric counts only what comes out of the tailpipe,
+# and, like any fuel with 0 lbs/gal, no gallons.
+FUELS = {'gasoline':(Driver.LBS_CO2_PER_GAL, 1.0), 'diesel':(22.4, 1.0),
+         'e85':(0.85*12.7 + 0.15*Driver.LBS_CO2_PER_GAL, 0.75),
+         'electric':(0.0, 1.0)}
+
+# The totals kept for each group, in output order
+TOTALS = ('vehicles', 'miles', 'gallons', 'CO2', 'CO2-tree', 'unknownModels')
+
+# The MPG of every category, indexed by category code
+CAT_MPG = engine.CAT_TABLE[:, 3]
+
+
+def getFuelCodes(fuels, names):
+    ''' Accepts an array of fuel names and returns an array of their codes
+    (indexes into names). Blank means gasoline.'''
+    fuels = np.char.lower(np.char.strip(np.asarray(fuels, dtype=str)))
+    fuels = np.where(fuels == '', 'gasoline', fuels)
+    uniq, inverse = np.unique(fuels, return_inverse=True)
+    lookup = {f:i for i, f in enumerate(names)}
+    try:
+        codes = np.array([lookup[f] for f in uniq.tolist()], dtype=np.intp)
+    except KeyError as e:
+        raise ValueError('Unknown fuel: %s' % e.args[0])
+    return codes[inverse.ravel()]
+
+
+def getMPGs(table, models, fallback):
+    ''' Returns (mpg, known): the MPG of every model in an array from the
+    VehicleTable table, and whether it was found. Models that aren't in
+    the table get the MPG in fallback (an array, one per row).'''
+    names, inverse = np.unique(np.asarray(models, dtype=str),
+                return_inverse=True)
+    rows = np.array([table.index.get(vehicles.normalize(m), -1)
+                     for m in names.tolist()], dtype=np.intp)[inverse.ravel()]
+    known = rows >= 0
+    return np.where(known, table.mpg[rows], fallback), known
+
+
+def evaluateChunk(chunk, table, fuels=FUELS):
+    ''' Works out the totals (see TOTALS) of every vehicle in a chunk of
+    the registry. Returns a units.Results of arrays with one value per
+    vehicle (CO2-tree is converted from CO2 when asked for).'''
+    miles = np.array(chunk['miles'], dtype=float)
+    bad = ~np.isfinite(miles) | (miles < 0)
+    if np.any(bad):
+        raise ValueError('Miles out of range: %s' % miles[bad][0])
+    n = len(miles)
+    names = list(fuels)
+    fuel = getFuelCodes(chunk['fuel'] if 'fuel' in chunk else ['']*n, names)
+    lbsPerGal, mpgFactor = np.array([fuels[f] for f in names]).T
+
+    if 'category' in chunk:
+        cat = np.char.strip(np.array(chunk['category']))
+        cat = np.where(cat == '', 'average', cat)
+    else:
+        cat = 'average'
+    fallback = np.broadcast_to(CAT_MPG[engine.catCodes(cat)], (n,))
+    mpg, known = getMPGs(table, chunk['model'], fallback)
+    if 'mpg' in chunk:
+        given = np.char.strip(np.array(chunk['mpg']))
+        custom = given != ''
+        mpg = np.where(custom, np.where(custom, given, '1').astype(float), mpg)
+        known |= custom
+    mpg = mpg * mpgFactor[fuel]
+    if np.any(mpg <= 0):
+        raise ValueError('MPG must be more than 0')
+
+    # Fuels with no CO2 per gallon (electric) don't burn any gallons
+    gallons = np.where(lbsPerGal[fuel] > 0, miles / mpg, 0.0)
+    return units.Results({'vehicles':np.ones(n), 'miles':miles,
+                          'gallons':gallons, 'CO2':gallons * lbsPerGal[fuel],
+                          'unknownModels':(~known).astype(float)})
+
+
+def inventory(lines, groupBy=('fuel',), chunkSize=100000, table=None,
+              fuels=FUELS):
+    ''' Reads a registry from an iterable of lines and returns ({grouping:
+    triplog.GroupTotals}, number of rows read). Rows missing a column that
+    is grouped by are put in a group called 'all'; blank fuels are
+    'gasoline'.'''
+    table = table or vehicles.loadVehicles()
+    groups = {g:triplog.GroupTotals(TOTALS) for g in groupBy}
+    nRows = 0
+    for chunk in triplog.readChunks(lines, chunkSize, ('model', 'miles'),
+                'Registry'):
+        totals = evaluateChunk(chunk, table, fuels)
+        n = len(totals['miles'])
+        for g in groupBy:
+            if g in chunk:
+                keys = np.char.strip(np.array(chunk[g]))
+                if g == 'fuel':
+                    keys = np.char.lower(keys)
+                    keys = np.where(keys == '', 'gasoline', keys)
+            else:
+                keys = np.full(n, 'all')
+            groups[g].add(keys, totals)
+        nRows += n
+    return groups, nRows
+
+
+def makeRegistry(rng, n, table=None):
+    ''' Yields the lines of a random registry of n vehicles, for trying out
+    the inventory.'''
+    table = table or vehicles.loadVehicles()
+    models = np.array(table.models + ['Unknown Car'])
+    fuels = np.array(list(FUELS))
+    yield 'owner,model,miles,fuel\n'
+    for lo in range(0, n, 100000):
+        m = min(100000, n - lo)
+        owner = rng.integers(0, 1000, m)
+        model = rng.choice(models, m)
+        miles = np.round(rng.gamma(4.0, 3400.0, m))
+        fuel = rng.choice(fuels, m, p=(0.85, 0.08, 0.03, 0.04))
+        for row in zip(owner.tolist(), model.tolist(), miles.tolist(),
+                       fuel.tolist()):
+            yield 'o%d,%s,%g,%s\n' % row
+
+
+def main(argv=None):
+    ''' Parses the command line, works out the inventory, writes the totals,
+    and reports throughput on stderr.'''
+    parser = argparse.ArgumentParser(description='Add up the yearly CO2 of '
+                'the vehicles in a registry CSV.')
+    parser.add_argument('registry', nargs='?', help="registry CSV ('-' for "
+                'stdin; default: random vehicles, see --random)')
+    parser.add_argument('--random', type=int, default=1000000,
+                help='number of random vehicles if no registry is given')
+    parser.add_argument('--by', action='append', help='column to total by '
+                '(repeatable, default: fuel)')
+    parser.add_argument('--fuel', action='append', default=[],
+                metavar='NAME=LBS[:FACTOR]', help='add or change a fuel: lbs '
+                'of CO2 per gallon, and MPG compared to gasoline')
+    parser.add_argument('-o', '--output', help='CSV file for the totals '
+                '(default: stdout)')
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                help='rows read and evaluated at a time (default: 100000)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fuels = dict(FUELS)
+    for item in args.fuel:
+        name, _, value = item.partition('=')
+        lbs, _, factor = value.partition(':')
+        fuels[name.strip().lower()] = (float(lbs), float(factor or 1.0))
+
+    start = time.perf_counter()
+    if args.registry is None:
+        registry = makeRegistry(np.random.default_rng(args.seed), args.random)
+    elif args.registry == '-':
+        registry = sys.stdin
+    else:
+        registry = open(args.registry, newline='')
+    try:
+        groups, nRows = inventory(registry, [g.lower() for g in args.by or
+                    ('fuel',)], args.chunk_size, fuels=fuels)
+    finally:
+        if args.registry not in (None, '-'):
+            registry.close()
+
+    out = sys.stdout if args.output is None else open(args.output, 'w',
+                newline='')
+    try:
+        triplog.writeTotals(groups, out, TOTALS)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    seconds = time.perf_counter() - start
+    msg = '%d vehicles in %.2f s (%.0f rows/s)' % (nRows, seconds,
+                nRows / seconds if seconds else 0)
+    peak = triplog.getPeakRSS()
+    if peak is not None:
+        msg += ', peak RSS %.1f MB' % peak
+    print(msg, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
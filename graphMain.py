@@ -14,37 +14,145 @@ Most of the code here has been highly modified and customized from those
 examples, but where my code closely resembles another's it is clearly noted.
 '''
 from modes import *
+import engine
+import registry
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider, RadioButtons, Button
-from matplotlib.figure import Figure
-
-plt.xkcd()  # Styles the graphing window in the xkcd style!!
-mpl.rcParams['toolbar'] = 'None'    # Disables matplotlib toolbar
+import collections
+import sys
+import time
+
+# When this module was loaded, the start of the clock for time-to-first-frame
+START_TIME = time.perf_counter()
+
+# Matplotlib is only imported (by loadPlotting) once a RunSim window is built,
+# so the calculations in engine can be used without loading the plotting stack.
+plt = None
+Slider = RadioButtons = Button = None
+
+def loadPlotting():
+    ''' Imports matplotlib and its widgets into this module and applies the
+    program's style. Only does the work the first time it is called.'''
+    global plt, Slider, RadioButtons, Button
+    if plt is None:
+        import matplotlib as mpl
+        import matplotlib.pyplot as pyplot
+        from matplotlib.widgets import Slider, RadioButtons, Button
+
+        pyplot.xkcd()  # Styles the graphing window in the xkcd style!!
+        mpl.rcParams['toolbar'] = 'None'    # Disables matplotlib toolbar
+        mpl.rcParams['font.family'] = getFontFamilies(mpl.rcParams['font.family'])
+        plt = pyplot
+
+def getFontFamilies(families):
+    ''' Returns the font families from the list that are installed. The xkcd
+    style asks for several handwriting fonts, and every one that's missing
+    is looked for (and warned about) again for each new size and weight of
+    text, which slows down the first draw. matplotlib already keeps the list
+    of installed fonts in its own cache, so checking it here is cheap.'''
+    from matplotlib import font_manager
+    installed = {f.name for f in font_manager.fontManager.ttflist}
+    generic = {'serif', 'sans-serif', 'cursive', 'fantasy', 'monospace'}
+    found = [f for f in families if f in installed or f in generic]
+    return found or ['sans-serif']
+
+class FrameCounter:
+    ''' Keeps the times of the most recent redraws of the window so the
+    number of frames per second can be measured, for example while
+    a slider is being dragged.'''
+
+    def __init__(self, size=30, maxGap=0.5):
+        ''' size is how many frames to average over. If no frame is drawn
+        for maxGap seconds, the old frames are forgotten, so pauses between
+        drags do not count against the frame rate.'''
+        self.times = collections.deque(maxlen=size)
+        self.maxGap = maxGap
+
+    def tick(self):
+        ''' Records that a frame was just drawn.'''
+        now = time.perf_counter()
+        if self.times and now - self.times[-1] > self.maxGap:
+            self.times.clear()
+        self.times.append(now)
+
+    def getFPS(self):
+        ''' Returns the frames per second over the recorded frames.'''
+        if len(self.times) < 2:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+class RenderScheduler:
+    ''' Coalesces bursts of widget events into one recalculation and one
+    redraw per frame. Widget callbacks call schedule, which only marks the
+    graphs as dirty and starts a single-shot timer (if one isn't already
+    running). When the timer fires, flush calls render once for all the
+    events that arrived in the meantime. Backends without an event loop
+    (like Agg) never fire the timer, so flush can also be called directly.'''
+
+    def __init__(self, canvas, render, interval=16):
+        ''' render is called as render(full) and should recalculate and
+        redraw; full is True if any of the events needed a full redraw.
+        interval is the length of a frame in milliseconds (~60 fps).'''
+        self.render = render
+        self.dirty = False
+        self.full = False
+        self.pending = False
+        self.renders = 0    # Number of times render has been called
+        self.timer = canvas.new_timer(interval=interval)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.flush)
+
+    def schedule(self, full=False):
+        ''' Marks the graphs as needing an update (and a full redraw of
+        the figure if full is True) at the end of the current frame.'''
+        self.dirty = True
+        self.full = self.full or full
+        if not self.pending:
+            self.pending = True
+            self.timer.start()
+
+    def flush(self):
+        ''' Does the scheduled update now, if there is one.'''
+        self.pending = False
+        if self.dirty:
+            full = self.full
+            self.dirty = False
+            self.full = False
+            self.renders += 1
+            self.render(full)
 
 class RunSim:
     ''' This class is the core of the program. It uses matplotlib to gather
     user input and dispaly results, and also preforms requisite calculations.'''
 
-    def __init__(self):
+    def __init__(self, showFPS=False, recorder=None, fastStart=False,
+                 startTime=None):
         ''' The constructor creates instances of the walker, biker, and driver
         objects from the 'modes' module, sets a default distance and trip
         number, and then calculates the time, cost, calories,
         and CO2 emissions for all modes of tranit. Then it sets up graphs
         for displaying the information, as well as sliders, buttons, and
-        RadioButtons for gathering user input. The functions that those
-        buttons execute are defined internally.
+        RadioButtons for gathering user input (see buildWidgets). If showFPS
+        is True, the number of redraws per second is shown in the corner of
+        the window. If an instrument.Recorder is given as recorder, the widget
+        callbacks and the calculating and drawing stages are recorded by it.
+
+        If fastStart is True, the window is shown with just the graphs, and
+        the widgets are built once the first frame is on screen (this needs
+        a backend with an event loop). The seconds from startTime (a
+        time.perf_counter value, default: now) until the first frame was
+        drawn are kept in firstFrame.
         '''
-        # Create instances of the driver, biker, and walker objects
-        # Whose instance variables will be used heavily in calculations.
-        self.d = Driver()
-        self.b = Biker()
-        self.w = Walker()
+        self.startTime = time.perf_counter() if startTime is None else startTime
+        self.firstFrame = None
+        loadPlotting()
 
-        # Default vaulues
-        self.dist = 1
-        self.trips = 1
+        # Wrap the stages of an update so the recorder sees them
+        self.recorder = recorder
+        for name in ('calculate', 'makeGraph', 'showInfo', 'updateGraph',
+                'redraw', 'drawAnimated', 'buildWidgets'):
+            setattr(self, name, self.probe(getattr(self, name)))
+
+        self.initModel()
 
         # Do initial calculations (calcualte returns calcDict)
         self.calcDict = self.calculate()
@@ -52,6 +160,9 @@ class RunSim:
         # Create figure object which we will place everything on
         # of dimensions 14" by 10"
         self.fig = plt.figure(figsize=(14,10))
+        canvas = self.fig.canvas
+        canvas.draw = self.probe(canvas.draw, 'draw')
+        canvas.blit = self.probe(canvas.blit, 'blit')
 
         # Create 4 axes objects evenly spaced in a column. These will
         # hold the four graphs/figures (time, cost, calories, and CO2.)
@@ -64,7 +175,64 @@ class RunSim:
         self.fig.subplots_adjust(left = .74, right = .94, bottom = .18,
                     top=.98,hspace=.25)
 
-        ### Set up Buttons, RadioButtons, Sliders and their fcns! ###
+        # Build the bars and text once; updates only change their values
+        self.initGraphs()
+
+        # Background (everything but the animated artists) for blitting,
+        # cached after every full draw of the figure
+        self.background = None
+        self.frames = FrameCounter()
+        self.fpsText = None
+        if showFPS:
+            self.fpsText = self.fig.text(.01, .01, '', fontsize=9,
+                        animated=True)
+            self.animated.append(self.fpsText)
+
+        # The widgets don't redraw the figure themselves. Their callbacks
+        # ask the scheduler, which does one recalculation and redraw per
+        # frame no matter how many events arrive in it.
+        self.scheduler = RenderScheduler(self.fig.canvas, self.updateGraph)
+
+        # Cache the background for blitting whenever the figure is drawn
+        self.fig.canvas.mpl_connect('draw_event', self.onDraw)
+
+        # The graphs are what people look at first, so with fastStart the
+        # widgets wait until the first frame has been drawn
+        self.sliders = []
+        self.widgetTimer = None
+        if fastStart:
+            self.widgetTimer = self.fig.canvas.new_timer(interval=0)
+            self.widgetTimer.single_shot = True
+            self.widgetTimer.add_callback(self.showWidgets)
+        else:
+            self.buildWidgets()
+
+        # These keep the current drawing current.
+        self.updateGraph()
+        plt.show()
+
+    def initModel(self):
+        ''' Sets up what is calculated, apart from the figure: the mode
+        objects and the default distance and number of trips. Also used by
+        report.Report, so both start from the same state.'''
+
+        # Create instances of the driver, biker, and walker objects
+        # Whose instance variables will be used heavily in calculations.
+        self.d = Driver()
+        self.b = Biker()
+        self.w = Walker()
+        # Any other modes declared in the registry module get bars too
+        self.modeObjs = [self.d, self.b, self.w] + [makeMode(m, self.d)
+                    for m in registry.getNames() if m not in engine.MODES]
+
+        # Default vaulues
+        self.dist = 1
+        self.trips = 1
+
+    def buildWidgets(self):
+        ''' Sets up the sliders, buttons, and RadioButtons for gathering user
+        input. The functions that those buttons execute are defined
+        internally.'''
 
         # The structure of setting up the temporary rax axes, then making
         # the RadioButton, then defining it's function, then adding the
@@ -96,59 +264,60 @@ class RunSim:
             return [xRax, yRax, widthRax, heightRax]
 
         # Unit Change RadioButton 1: Change Time Units
-        rax = plt.axes(getRadioPosList(self.ax1), axisbg=axcolor)
+        rax = plt.axes(getRadioPosList(self.ax1), facecolor=axcolor)
         self.radioTime = RadioButtons(rax, ('Hours', 'Minutes', 'Audiobooks'))
         def timeChange(label):
-            self.updateGraph()
-            plt.draw()
-        self.radioTime.on_clicked(timeChange)
+            self.scheduler.schedule(full=True)
+        self.radioTime.on_clicked(self.probe(timeChange))
 
         # Unit Change RadioButton 2: Change Money Units
-        rax = plt.axes(getRadioPosList(self.ax2), axisbg=axcolor)
+        rax = plt.axes(getRadioPosList(self.ax2), facecolor=axcolor)
         self.radioCost = RadioButtons(rax, ('Dollars', 'Coffees'))
         def costChange(label):
-            self.updateGraph()
-            plt.draw()
-        self.radioCost.on_clicked(costChange)
+            self.scheduler.schedule(full=True)
+        self.radioCost.on_clicked(self.probe(costChange))
 
         # Unit Change RadioButton 3: Change calorie burn units
-        rax = plt.axes(getRadioPosList(self.ax3), axisbg=axcolor)
+        rax = plt.axes(getRadioPosList(self.ax3), facecolor=axcolor)
         self.radioCal = RadioButtons(rax, ('Cal (total)', 'Cal (/hour)'))
         def calChange(label):
-            self.updateGraph()
-            plt.draw()
-        self.radioCal.on_clicked(calChange)
+            self.scheduler.schedule(full=True)
+        self.radioCal.on_clicked(self.probe(calChange))
 
         # Unit Change RadioButton 4: Change CO2 Emissions Units
-        rax = plt.axes(getRadioPosList(self.ax4), axisbg=axcolor)
+        rax = plt.axes(getRadioPosList(self.ax4), facecolor=axcolor)
         self.radioCO2 = RadioButtons(rax, ('CO2 (lbs)', 'CO2 (trees)'))
         def CO2Change(label):
-            self.updateGraph()
-            plt.draw()
-        self.radioCO2.on_clicked(CO2Change)
+            self.scheduler.schedule(full=True)
+        self.radioCO2.on_clicked(self.probe(CO2Change))
 
         # Sliders 1 and 2: Distnace and Number of Trips
         # Axes and instance of slider for distance control
-        axslideDist = plt.axes([0.17, 0.10, 0.77, 0.03], axisbg=axcolor)
+        axslideDist = plt.axes([0.17, 0.10, 0.77, 0.03], facecolor=axcolor)
         self.slideDist = Slider(axslideDist, 'Distance (miles)', 0.0, 100.0,
                     valinit=self.dist, valfmt='%4.2f')
         # Axes and instance of slider for number of trips control
-        axslideTrip = plt.axes([0.17, 0.05, 0.77, 0.03], axisbg=axcolor)
+        axslideTrip = plt.axes([0.17, 0.05, 0.77, 0.03], facecolor=axcolor)
         self.slideTrip = Slider(axslideTrip, 'Trips', 0.0, 100.0,
                     valinit=self.trips, valfmt='%4.2f')
+        # The sliders are redrawn by blitting (see redraw), not by
+        # redrawing the whole figure every time they move. Their value
+        # text sits outside their axes, so it is animated on its own.
+        for slider in (self.slideDist, self.slideTrip):
+            slider.drawon = False
+            slider.valtext.set_animated(True)
         # Function for updating values after either slider is moved.
         def sliderUpdate(val):
             self.trips = self.slideTrip.val
             self.dist = self.slideDist.val
-            self.calcDict = self.calculate()
-            self.updateGraph()
-        self.slideTrip.on_changed(sliderUpdate)
-        self.slideDist.on_changed(sliderUpdate)
+            self.scheduler.schedule()
+        self.slideTrip.on_changed(self.probe(sliderUpdate))
+        self.slideDist.on_changed(self.probe(sliderUpdate))
 
         axcolor = 'gold'
 
         # Customization RadioButton 1: Car - Car Type
-        rax = plt.axes([.06, .72, .15, 0.2], axisbg=axcolor)
+        rax = plt.axes([.06, .72, .15, 0.2], facecolor=axcolor)
         rax.text(0, 1.15, "Customize Driving Info", fontsize=11)
         rax.text(0,1.05, "Car Type", fontsize=11)
         self.radioCarType = RadioButtons(rax, ('Average','Small Sedan',
@@ -171,92 +340,67 @@ class RunSim:
                 self.d.setCat('minivan')
             else:
                 print('Error!')
-            self.updateGraph()
-            plt.draw()
-        self.radioCarType.on_clicked(carTypeChange)
+            self.scheduler.schedule(full=True)
+        self.radioCarType.on_clicked(self.probe(carTypeChange))
 
         # Customization RadioButton 2: Bike - Spend on Bike
-        rax = plt.axes([.26, .72, .15, 0.2], axisbg=axcolor)
+        rax = plt.axes([.26, .72, .15, 0.2], facecolor=axcolor)
         rax.text(0, 1.15, "Customize Biking Info:", fontsize=11)
         rax.text(0,1.05, "Spend on parts/maintenance ($/year)", fontsize=11)
-        self.radioBikeSpend = RadioButtons(rax, ('$0-25','$25-50',
-            '$50-100', '$100-150', '$150-200', '>$200'), active=2)
+        self.radioBikeSpend = RadioButtons(rax, tuple(engine.SPEND_BRACKETS),
+            active=2)
         def bikeSpendChange(label):
             ''' Adjusts instance of biker object based on selected spending,
             using the biker object's setSpend fcn. Then updates graph.'''
-            if label == '$0-25':
-                self.b.setSpend(12.5)
-            elif label == '$25-50':
-                self.b.setSpend(37.5)
-            elif label == '$50-100':
-                self.b.setSpend(75)
-            elif label == ('$100-150'):
-                self.b.setSpend(125)
-            elif label == '$150-200':
-                self.b.setSpend(175)
-            elif label == '>$200':
-                self.b.setSpend(250)
+            if label in engine.SPEND_BRACKETS:
+                self.b.setSpend(engine.SPEND_BRACKETS[label])
             else:
                 print('Error!')
-            self.updateGraph()
-            plt.draw()
-        self.radioBikeSpend.on_clicked(bikeSpendChange)
+            self.scheduler.schedule(full=True)
+        self.radioBikeSpend.on_clicked(self.probe(bikeSpendChange))
 
         # Customization RadioButton 3: Walk - Spend on Shoes
-        rax = plt.axes([.06, .424, .15, 0.2], axisbg=axcolor)
+        rax = plt.axes([.06, .424, .15, 0.2], facecolor=axcolor)
         rax.text(0, 1.15, "Customize Walking Info:", fontsize=11)
         rax.text(0,1.05, "Spend on a new pair of shoes", fontsize=11)
-        self.radioWalkSpend = RadioButtons(rax, ('$0-25','$25-50',
-            '$50-100', '$100-150', '$150-200', '>$200'), active=1)
+        self.radioWalkSpend = RadioButtons(rax, tuple(engine.SPEND_BRACKETS),
+            active=1)
         def walkSpendChange(label):
             ''' Changes instance of walker object based on spending.'''
-            if label == '$0-25':
-                self.w.setSpend(12.5)
-            elif label == '$25-50':
-                self.w.setSpend(37.5)
-            elif label == '$50-100':
-                self.w.setSpend(75)
-            elif label == ('$100-150'):
-                self.w.setSpend(125)
-            elif label == '$150-200':
-                self.w.setSpend(175)
-            elif label == '>$200':
-                self.w.setSpend(250)
+            if label in engine.SPEND_BRACKETS:
+                self.w.setSpend(engine.SPEND_BRACKETS[label])
             else:
                 print('Error!')
-            self.updateGraph()
-            plt.draw()
-        self.radioWalkSpend.on_clicked(walkSpendChange)
+            self.scheduler.schedule(full=True)
+        self.radioWalkSpend.on_clicked(self.probe(walkSpendChange))
 
         # Customization RadioButton 4: Person - Sex
-        rax = plt.axes([.26, .424, .15, 0.2], axisbg=axcolor)
+        rax = plt.axes([.26, .424, .15, 0.2], facecolor=axcolor)
         rax.text(0, 1.15, "Customize Calorie Burn Info:", fontsize=11)
         rax.text(0,1.05, "Sex", fontsize=11)
         self.radioPersonSex = RadioButtons(rax, ('Male','Female'), active=0)
         def personSexChange(label):
             ''' Changes the sex of the person instance of the current instnace
-            of the driver, biker, and walker objects. So much OOP!!!!'''
+            of the driver, biker, walker (and any other mode) objects.
+            So much OOP!!!!'''
             if label == 'Male':
-                self.d.person.setSex('M', True)
-                self.b.person.setSex('M', True)
-                self.w.person.setSex('M', True)
+                for m in self.modeObjs:
+                    m.person.setSex('M', True)
             elif label == 'Female':
-                self.d.person.setSex('F', True)
-                self.b.person.setSex('F', True)
-                self.w.person.setSex('F', True)
+                for m in self.modeObjs:
+                    m.person.setSex('F', True)
             else:
                 print('Error!')
-            self.updateGraph()
-            plt.draw()
-        self.radioPersonSex.on_clicked(personSexChange)
+            self.scheduler.schedule(full=True)
+        self.radioPersonSex.on_clicked(self.probe(personSexChange))
 
         # Reset Button
         axReset = plt.axes([0.17, 0.25, 0.15, 0.10])
-        bReset = Button(axReset, 'Reset Defaults')
+        self.bReset = Button(axReset, 'Reset Defaults')
         def resetDefaults(event):
-            ''' Resets all buttons/sliders to their default position,
-            which triggers recalculations and redrawing of the
-            graphs. This function is a little slow.'''
+            ''' Resets all buttons/sliders to their default position.
+            Each one schedules a recalculation, but the scheduler
+            coalesces them into a single recalculation and redraw.'''
             self.slideDist.set_val(1)
             self.slideTrip.set_val(1)
             self.radioTime.set_active(0)
@@ -267,174 +411,257 @@ class RunSim:
             self.radioBikeSpend.set_active(2)
             self.radioWalkSpend.set_active(1)
             self.radioPersonSex.set_active(0)
-            plt.draw()
-        bReset.on_clicked(resetDefaults)
-
-        # These keep the current drawing current.
-        self.updateGraph()
-        plt.show()
+            self.scheduler.schedule(full=True)
+        self.bReset.on_clicked(self.probe(resetDefaults))
+
+        # The sliders are blitted along with the graphs, and nothing is
+        # drawn by the widgets themselves (see the scheduler in __init__)
+        self.sliders = [self.slideDist, self.slideTrip]
+        for radio in (self.radioTime, self.radioCost, self.radioCal,
+                self.radioCO2, self.radioCarType, self.radioBikeSpend,
+                self.radioWalkSpend, self.radioPersonSex):
+            radio.drawon = False
+
+    def showWidgets(self):
+        ''' Builds the widgets after the first frame (with fastStart) and
+        redraws the figure to show them.'''
+        self.buildWidgets()
+        self.redraw(full=True)
+
+    def probe(self, fn, name=None):
+        ''' Returns fn wrapped so calls to it are recorded by the recorder
+        (under name, default the name of fn). Without a recorder, returns fn
+        itself, so there is no cost when instrumentation is off.'''
+        if self.recorder is None:
+            return fn
+        return self.recorder.wrap(fn, name)
 
     def calculate(self):
-        ''' This function does all the calculating behind the program. It uses
-        attributes of the driver, walker, and biker object's to calculate
-        values for time, cost, calorie burn, and CO2 emitted in various units.
-        This information is stored in the handy-dandy dictionary: calcDict.'''
-
-        # Dictionary that holds calculations for different categories in the form
-        # of lists, where [0]=driver, [1]=biker, [2]=walker
-        calcDict = {'time':[],'cost':[], 'cal':[],'time-mins':[], 'time-audio':[],
-        'cost-coffee':[], 'cal-hour':[], 'cal-sansBMR':[],
-        'CO2':0.0, 'CO2-tree':0.0}
-
-        # Time in hours
-        calcDict['time'].append(self.dist*self.trips / self.d.getMPH())
-        calcDict['time'].append(self.dist*self.trips / self.b.getMPH())
-        calcDict['time'].append(self.dist*self.trips / self.w.getMPH())
-
-        # Cost in US dollars
-        calcDict['cost'].append(self.d.getCost()*self.dist*self.trips)
-        calcDict['cost'].append(self.b.getCost()*self.dist*self.trips)
-        calcDict['cost'].append(self.w.getCost()*self.dist*self.trips)
-
-        # Total calories burned
-        calcDict['cal'].append(self.d.person.getCal()*calcDict['time'][0])
-        calcDict['cal'].append(self.b.person.getCal()*calcDict['time'][1])
-        calcDict['cal'].append(self.w.person.getCal()*calcDict['time'][2])
-
-        ## Alternative units for above categories
-
-        # Time in audiobooks (based on avg len of 12.59 hours)
-        # Note: avg length determined from sample of 25 bestsellers on Audible.com
-        calcDict['time-mins'].append(calcDict['time'][0]*60)
-        calcDict['time-mins'].append(calcDict['time'][1]*60)
-        calcDict['time-mins'].append(calcDict['time'][2]*60)
-
-        # Time in audiobooks (based on avg len of 12.59 hours)
-        # Note: avg length determined from sample of 25 bestsellers on Audible.com
-        calcDict['time-audio'].append(calcDict['time'][0]/12.59)
-        calcDict['time-audio'].append(calcDict['time'][1]/12.59)
-        calcDict['time-audio'].append(calcDict['time'][2]/12.59)
-
-        #Cost in terms of coffee at blue Mondays burned per hour
-        calcDict['cost-coffee'].append(calcDict['cost'][0]/2.60)
-        calcDict['cost-coffee'].append(calcDict['cost'][1]/2.60)
-        calcDict['cost-coffee'].append(calcDict['cost'][2]/2.60)
-
-        #Cal burned per hour
-        calcDict['cal-hour'].append(self.d.person.getCal())
-        calcDict['cal-hour'].append(self.b.person.getCal())
-        calcDict['cal-hour'].append(self.w.person.getCal())
-
-        # CO2 emissions in lbs
-        calcDict['CO2'] = self.d.getCO2()*(self.dist*self.trips)
-
-        # CO2 emissions in terms of trees planted
-        # A single tree planted thru americanforests.org sequesters 911 pounds of CO2
-        # This value reflects the number of trees one should plant to sequester the carbon
-        # emitted by driving
-        calcDict['CO2-tree'] = (calcDict['CO2'] / 911)
-
-        return calcDict
-
-    def makeGraph(self, ax, data, ylab):
-        ''' makeGraph is called by updateGraph and redraws the 3 graphs
-        every time it is called. The x labels are always the same but the
-        y values are passed in as 'data'. '''
-
-        ax.clear()
-
-        N = 3                   # 3 divisions of x axis
-        maxNum = max(data)      # determine max y value
-
+        ''' This function does all the calculating behind the program. It passes
+        the driver, walker, and biker objects and the current distance and trip
+        number to engine.calculateModes (along with any other registered
+        modes), which calculates values for time, cost, calorie burn, and
+        CO2 emitted in various units. This information is returned in the
+        handy-dandy dictionary: calcDict.'''
+        return engine.calculateModes(self.modeObjs, self.dist, self.trips)
+
+    def initGraphs(self):
+        ''' Builds the bars, tick labels and text for the 3 graphs and the
+        CO2 panel once. After that makeGraph and showInfo only change their
+        heights, limits and text, rather than clearing and rebuilding the
+        axes. The bars and the text that changes are animated, so they can
+        be redrawn by blitting over a cached background (see redraw).'''
+
+        # One bar per mode, labelled and colored as declared in registry
+        specs = [registry.getMode(m.person.mode) for m in self.modeObjs]
+        N = len(specs)          # N divisions of x axis
         ind = np.arange(N)      # the x locations for the groups
         width = 0.5             # the width of the bars
 
-        ## the bars
-        rects1 = ax.bar(ind, data, width, color=['cyan','yellow','magenta'])
+        # Holds every artist that gets redrawn when blitting
+        self.animated = []
+        # {ax: (bars, labels above bars)} for the 3 bar graphs
+        self.barArtists = {}
 
-        # axes and labels
-        ax.set_xlim(-.1,len(ind)-.4)
-        ax.set_ylim(0,maxNum+(maxNum/10)*2)
+        for ax in (self.ax1, self.ax2, self.ax3):
+            ## the bars
+            rects = ax.bar(ind, [0]*N, width, color=[s.color for s in specs],
+                        animated=True)
 
-        xTickMarks = ['Drive','Bike','Walk']
-        ax.set_xticks(ind+(width/2))
-        xtickNames = ax.set_xticklabels(xTickMarks)
-        ax.set_ylabel(ylab)
+            # axes and labels
+            ax.set_xlim(-.1,len(ind)-.4)
+            ax.set_ylim(0,1)
 
-        def autolabel(rects):
-            ''' Adds labels above bars. Code adapted from matplotlib demo code:
-            http://matplotlib.org/examples/api/barchart_demo.html'''
-            # attach some text labels
-            for rect in rects:
-                height = rect.get_height()
-                ax.text(rect.get_x() + rect.get_width()/2., 1.05*height,
-                        '%4.2f' % (height), fontsize=11,
-                        ha='center', va='bottom')
+            xTickMarks = [s.label for s in specs]
+            ax.set_xticks(ind+(width/2))
+            xtickNames = ax.set_xticklabels(xTickMarks)
 
-        autolabel(rects1)
+            # Labels above bars. Adapted from matplotlib demo code:
+            # http://matplotlib.org/examples/api/barchart_demo.html
+            labels = [ax.text(rect.get_x() + rect.get_width()/2., 0, '',
+                        fontsize=11, ha='center', va='bottom', animated=True)
+                        for rect in rects]
 
-    def showInfo(self, ax, data, msg):
-        ''' The forth subplot (axes) holds text instead of a bar plot
-        and it gets updated using this function.'''
-
-        # Erase any existing information to avoid redrawing
-        ax.clear()
+            self.barArtists[ax] = (rects, labels)
+            self.animated.extend(rects)
+            self.animated.extend(labels)
 
-        # Remove labels
+        # The forth subplot (axes) holds text instead of a bar plot
+        ax = self.ax4
         ax.set_xticklabels('')
         ax.set_yticklabels('')
-
         ax.text(.08, .70, "By not driving...", fontsize=11)
+        self.infoValue = ax.text(.4, .45, '', style='italic',
+            bbox={'facecolor':'lightgreen', 'alpha':0.65, 'pad':10},
+            animated=True)
+        self.infoMsg = ax.text(.08, .20, '', fontsize=11)
+        self.animated.append(self.infoValue)
 
-        ax.text(.4, .45, '%4.2f' % (data), style='italic',
-            bbox={'facecolor':'lightgreen', 'alpha':0.65, 'pad':10})
-        ax.text(.08, .20, msg, fontsize=11)
+    def makeGraph(self, ax, data, ylab):
+        ''' makeGraph is called by updateGraph and updates one of the 3 graphs
+        every time it is called. The x labels are always the same but the
+        y values are passed in as 'data'. Only the bar heights and labels
+        change, unless the bars no longer fit (or have shrunk to a small
+        part of the graph) or the units change. Returns True in that case,
+        because then the axes need to be redrawn too, not just the bars.'''
+
+        rects, labels = self.barArtists[ax]
+        for rect, label, height in zip(rects, labels, data):
+            rect.set_height(height)
+            label.set_y(1.05*height)
+            label.set_text('%4.2f' % (height))
+
+        changed = False
+
+        maxNum = max(data)      # determine max y value
+        top = maxNum+(maxNum/10)*2
+        yMax = ax.get_ylim()[1]
+        if maxNum > 0 and (top > yMax or 3*top < yMax):
+            # Leave the bars room to grow so dragging a slider does
+            # not change the limits (and redraw the axes) every step
+            ax.set_ylim(0,1.5*top)
+            changed = True
+
+        if ax.get_ylabel() != ylab:
+            ax.set_ylabel(ylab)
+            changed = True
 
-    def updateGraph(self):
+        return changed
+
+    def showInfo(self, ax, data, msg):
+        ''' The forth subplot (axes) holds text instead of a bar plot
+        and it gets updated using this function. Returns True if the
+        message (which is not animated) changed and needs a full redraw.'''
+        self.infoValue.set_text('%4.2f' % (data))
+        if self.infoMsg.get_text() != msg:
+            self.infoMsg.set_text(msg)
+            return True
+        return False
+
+    def onDraw(self, event):
+        ''' Called by matplotlib after the whole figure has been drawn.
+        Caches the background (which leaves out the animated artists)
+        for blitting, then draws the animated artists on top of it. After
+        the first frame, starts building the widgets if they were put off.'''
+        canvas = self.fig.canvas
+        if getattr(canvas, 'supports_blit', True):
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        self.frames.tick()
+        self.drawAnimated()
+        if self.firstFrame is None:
+            self.firstFrame = time.perf_counter() - self.startTime
+            if self.recorder is not None:
+                self.recorder.record('firstFrame', self.firstFrame)
+            if self.widgetTimer is not None:
+                self.widgetTimer.start()
+
+    def drawAnimated(self):
+        ''' Draws the bars, their labels, the CO2 text, and the sliders
+        (which are not animated, but move while being dragged).'''
+        if self.fpsText is not None:
+            self.fpsText.set_text('%4.1f fps' % self.frames.getFPS())
+        for artist in self.animated:
+            self.fig.draw_artist(artist)
+        for slider in self.sliders:
+            self.fig.draw_artist(slider.ax)
+            self.fig.draw_artist(slider.valtext)
+
+    def redraw(self, full=False):
+        ''' Puts the updated graphs on screen. If only the bars and text
+        changed, the cached background is restored and the animated artists
+        are drawn over it and blitted, which is much faster than redrawing
+        the whole xkcd-styled figure. Otherwise (or when there is nothing
+        cached yet) the whole figure is redrawn.'''
+        canvas = self.fig.canvas
+        if full or self.background is None:
+            canvas.draw_idle()
+        else:
+            canvas.restore_region(self.background)
+            self.frames.tick()
+            self.drawAnimated()
+            canvas.blit(self.fig.bbox)
+
+    def getFPS(self):
+        ''' Returns how many times per second the graphs have been redrawn
+        recently, e.g. while a slider is dragged.'''
+        return self.frames.getFPS()
+
+    def getUnits(self):
+        ''' Returns the units selected for the time, cost, calorie, and CO2
+        graphs (the defaults if the widgets haven't been built yet).'''
+        if not self.sliders:
+            return 'Hours', 'Dollars', 'Cal (total)', 'CO2 (lbs)'
+        return (self.radioTime.value_selected, self.radioCost.value_selected,
+                self.radioCal.value_selected, self.radioCO2.value_selected)
+
+    def updateGraph(self, full=False):
         ''' This is called whenever the graph needs to be updated. It calls
         self.calculate to make sure self.calcDate is up to date and it uses
         the values of the radio buttons and sliders as well as the values stored
         in calcDict to determine which y values to pass into makeGraph to
-        make the 3 graphs and which values to pass to showInfo.'''
+        make the 3 graphs and which values to pass to showInfo. Then it
+        redraws the graphs (the whole figure if full is True).'''
 
         self.calcDict = self.calculate()
-
-        if self.radioTime.value_selected == 'Hours':
-            self.makeGraph(self.ax1, self.calcDict['time'], 'Time (Hours)')
-        elif self.radioTime.value_selected == 'Minutes':
-            self.makeGraph(self.ax1, self.calcDict['time-mins'], 'Time (Minutes)')
-        elif self.radioTime.value_selected == 'Audiobooks':
-            self.makeGraph(self.ax1, self.calcDict['time-audio'], 'Time (Audiobooks)')
-
-        if self.radioCost.value_selected == 'Dollars':
-            self.makeGraph(self.ax2, self.calcDict['cost'], 'Cost ($)')
-        elif self.radioCost.value_selected == 'Coffees':
-            self.makeGraph(self.ax2, self.calcDict['cost-coffee'], 'Cost (Coffees)')
+        timeUnit, costUnit, calUnit, CO2Unit = self.getUnits()
+
+        if timeUnit == 'Hours':
+            full |= self.makeGraph(self.ax1, self.calcDict['time'], 'Time (Hours)')
+        elif timeUnit == 'Minutes':
+            full |= self.makeGraph(self.ax1, self.calcDict['time-mins'], 'Time (Minutes)')
+        elif timeUnit == 'Audiobooks':
+            full |= self.makeGraph(self.ax1, self.calcDict['time-audio'], 'Time (Audiobooks)')
+
+        if costUnit == 'Dollars':
+            full |= self.makeGraph(self.ax2, self.calcDict['cost'], 'Cost ($)')
+        elif costUnit == 'Coffees':
+            full |= self.makeGraph(self.ax2, self.calcDict['cost-coffee'], 'Cost (Coffees)')
         else:
             print('Error!')
 
-        if self.radioCal.value_selected == 'Cal (total)':
-            self.makeGraph(self.ax3, self.calcDict['cal'], 'Calories (total)')
-        elif self.radioCal.value_selected == 'Cal (/hour)':
-            self.makeGraph(self.ax3, self.calcDict['cal-hour'], 'Calories (/hour)')
+        if calUnit == 'Cal (total)':
+            full |= self.makeGraph(self.ax3, self.calcDict['cal'], 'Calories (total)')
+        elif calUnit == 'Cal (/hour)':
+            full |= self.makeGraph(self.ax3, self.calcDict['cal-hour'], 'Calories (/hour)')
         else:
             print('Error!')
 
-        if self.radioCO2.value_selected == 'CO2 (lbs)':
-            self.showInfo(self.ax4, self.calcDict['CO2'], 'Pounds of CO2 not emitted')
-        elif self.radioCO2.value_selected == 'CO2 (trees)':
-            self.showInfo(self.ax4, self.calcDict['CO2-tree'], 'Trees planted!')
+        if CO2Unit == 'CO2 (lbs)':
+            full |= self.showInfo(self.ax4, self.calcDict['CO2'], 'Pounds of CO2 not emitted')
+        elif CO2Unit == 'CO2 (trees)':
+            full |= self.showInfo(self.ax4, self.calcDict['CO2-tree'], 'Trees planted!')
         else:
             print('Error!')
 
-def main():
+        self.redraw(full)
+
+def main(showFPS=False, instrumentPath=None, showStartup=False,
+         allocations=False):
     ''' The main function (and the bit of code beneath)
     makes the program runable from the command line
     by simply typing the name of this module. All the function does is create
     a new instance of the RunSim class, which will build and keep live
-    the matplotlib window, graphs, and user interface.'''
-
-    newSim = RunSim()
+    the matplotlib window, graphs, and user interface. Running the module
+    with --fps shows the redraw rate in the window. With --instrument, the
+    time spent in each callback and stage is written to instrumentPath
+    (instrument.json) and summarized when the program exits;
+    --instrument-allocations records the memory each one allocates too
+    (allocations). With --startup, the time it took to draw the first frame
+    is printed when it exits.'''
+
+    recorder = None
+    if instrumentPath:
+        import instrument
+        recorder = instrument.Recorder(allocations)
+        recorder.dumpAtExit(instrumentPath)
+
+    newSim = RunSim(showFPS, recorder, fastStart=True, startTime=START_TIME)
+    if showStartup and newSim.firstFrame is not None:
+        print('First frame drawn %.3f s after start' % newSim.firstFrame,
+              file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
+    allocations = '--instrument-allocations' in sys.argv[1:]
+    main('--fps' in sys.argv[1:],
+         'instrument.json' if allocations or '--instrument' in sys.argv[1:]
+         else None, '--startup' in sys.argv[1:], allocations)
@@ -0,0 +1,127 @@
+'''
+instrument.py
+Optional instrumentation, for finding out where the time goes when the
+window is slow to respond. A Recorder wraps functions (the GUI's widget
+callbacks and the calculate, makeGraph, showInfo, and drawing stages) and
+records for each one how many times it was called, a histogram of how long
+the calls took, and (optionally) how much memory they allocated.
+
+Nothing is wrapped unless a Recorder is given to RunSim, so when
+instrumentation is off it costs nothing. The numbers can be read while the
+program runs (getReport, getSummary) and written to a JSON file on exit:
+    >> python3 graphMain.py --instrument
+    >> python3 graphMain.py --instrument-allocations   (with memory too)
+'''
+import atexit
+import functools
+import json
+import time
+import tracemalloc
+
+# Latency histogram buckets: bucket i holds calls taking up to 2**i
+# microseconds, and the last bucket holds anything slower
+BUCKETS = 25
+
+
+class Stat:
+    ''' The numbers recorded for one wrapped function.'''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0        # Seconds, all calls together
+        self.max = 0.0          # Seconds, slowest call
+        self.histogram = [0]*BUCKETS
+        self.allocated = 0      # Bytes, net over all calls
+        self.maxAllocated = 0   # Bytes, most allocated by one call
+
+    def add(self, seconds, allocated):
+        ''' Records one call.'''
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        bucket = min(int(seconds*1e6).bit_length(), BUCKETS - 1)
+        self.histogram[bucket] += 1
+        self.allocated += allocated
+        self.maxAllocated = max(self.maxAllocated, allocated)
+
+    def getReport(self):
+        ''' Returns the numbers as a dictionary (the histogram only lists
+        buckets that were used, labelled with their upper bound).'''
+        histogram = {}
+        for i, n in enumerate(self.histogram):
+            if n:
+                label = '>%dus' % 2**(i-1) if i == BUCKETS - 1 else '<=%dus' % 2**i
+                histogram[label] = n
+        return {'count':self.count, 'total':self.total,
+                'mean':self.total / self.count if self.count else 0.0,
+                'max':self.max, 'histogram':histogram,
+                'allocated':self.allocated, 'maxAllocated':self.maxAllocated}
+
+
+class Recorder:
+    ''' Records calls to the functions it wraps. If allocations is True,
+    tracemalloc is started and the memory each call allocates is recorded
+    too (this makes everything noticeably slower). Recording can be paused
+    by setting enabled to False.'''
+
+    def __init__(self, allocations=False):
+        self.stats = {}     # {name: Stat}
+        self.enabled = True
+        self.allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wrap(self, fn, name=None):
+        ''' Returns a function that calls fn and records the call under
+        name (default: the name of fn).'''
+        stat = self.stats.setdefault(name or fn.__name__, Stat())
+
+        @functools.wraps(fn)
+        def recorded(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            memory = tracemalloc.get_traced_memory()[0] if self.allocations else 0
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if self.allocations:
+                    memory = tracemalloc.get_traced_memory()[0] - memory
+                stat.add(seconds, memory)
+        return recorded
+
+    def record(self, name, seconds, allocated=0):
+        ''' Records one event that wasn't a call to a wrapped function,
+        e.g. how long it took to draw the first frame.'''
+        if self.enabled:
+            self.stats.setdefault(name, Stat()).add(seconds, allocated)
+
+    def getReport(self):
+        ''' Returns {name: numbers} for every wrapped function.'''
+        return {name:stat.getReport() for name, stat in self.stats.items()}
+
+    def getSummary(self):
+        ''' Returns a table of the numbers, slowest total first.'''
+        lines = ['%-18s %8s %10s %10s %10s %12s' % ('name', 'calls',
+                    'total (s)', 'mean (ms)', 'max (ms)', 'alloc (KB)')]
+        for name, stat in sorted(self.stats.items(),
+                                 key=lambda item: -item[1].total):
+            mean = stat.total / stat.count if stat.count else 0.0
+            lines.append('%-18s %8d %10.3f %10.3f %10.3f %12.1f' % (name,
+                    stat.count, stat.total, mean*1000, stat.max*1000,
+                    stat.allocated / 1024))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        ''' Writes the report to a JSON file.'''
+        with open(path, 'w') as f:
+            json.dump(self.getReport(), f, indent=2)
+
+    def dumpAtExit(self, path):
+        ''' Writes the report to a JSON file, and prints the summary, when
+        the program exits.'''
+        def dump():
+            self.dump(path)
+            print(self.getSummary())
+        atexit.register(dump)
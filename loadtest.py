@@ -0,0 +1,181 @@
+'''
+loadtest.py
+Load test for service.py. Starts the service (or uses one that is already
+running, with --url), then sends requests from many connections at once and
+reports the requests per second and the p50/p99 latency:
+    >> python3 loadtest.py --requests 20000 --connections 32 --batch 10
+
+Scenarios are drawn at random from a pool of --distinct scenarios, so the
+size of the pool sets how often the service's cache is hit.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import engine
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def makeScenarios(n, seed=0):
+    ''' Returns a list of n random scenarios.'''
+    rng = random.Random(seed)
+    return [{'dist':round(rng.uniform(0, 100), 2), 'trips':rng.randint(1, 100),
+             'cat':rng.choice(engine.CATEGORIES),
+             'bikeSpend':rng.choice(list(engine.SPEND_BRACKETS)),
+             'shoeSpend':rng.choice(list(engine.SPEND_BRACKETS)),
+             'sex':rng.choice('MF')} for i in range(n)]
+
+
+def makeRequest(host, path, obj):
+    ''' Returns the bytes of an HTTP POST request sending obj as JSON.'''
+    body = json.dumps(obj).encode()
+    return ('POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n'
+            'Content-Length: %d\r\n\r\n' % (path, host, len(body))).encode() + body
+
+
+async def readResponse(reader):
+    ''' Reads one HTTP response and returns (status, body).'''
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def runClient(host, port, requests, latencies, errors):
+    ''' Sends the requests one after another over one connection,
+    recording the seconds each one took.'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request in requests:
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, body = await readResponse(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def getStats(host, port):
+    ''' Returns the service's /stats.'''
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(('GET /stats HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n'
+                  '\r\n' % host).encode())
+    status, body = await readResponse(reader)
+    writer.close()
+    return json.loads(body)
+
+
+async def loadTest(host, port, nRequests=10000, connections=16, batch=1,
+                   distinct=1000, seed=0):
+    ''' Sends nRequests requests (each with batch scenarios) spread over
+    connections connections, and returns a dictionary of the results.'''
+    rng = random.Random(seed)
+    pool = makeScenarios(distinct, seed)
+    requests = []
+    for i in range(nRequests):
+        scenarios = [rng.choice(pool) for j in range(batch)]
+        obj = scenarios[0] if batch == 1 else {'scenarios':scenarios}
+        requests.append(makeRequest(host, '/calculate', obj))
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[runClient(host, port, requests[i::connections],
+                latencies, errors) for i in range(connections)])
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(p/100 * len(latencies)), len(latencies) - 1)]
+    return {'requests':nRequests, 'scenarios':nRequests*batch,
+            'errors':len(errors), 'seconds':seconds,
+            'rps':nRequests / seconds, 'scenariosPerSecond':nRequests*batch / seconds,
+            'mean':statistics.mean(latencies), 'p50':percentile(50),
+            'p90':percentile(90), 'p99':percentile(99), 'max':latencies[-1],
+            'stats':await getStats(host, port)}
+
+
+def getFreePort():
+    ''' Returns a TCP port nothing is listening on.'''
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def startService(port, cacheSize):
+    ''' Starts service.py in a new process and waits until it answers.'''
+    process = subprocess.Popen([sys.executable, os.path.join(HERE,
+                'service.py'), '--port', str(port), '--cache-size',
+                str(cacheSize)], stderr=subprocess.DEVNULL)
+    for i in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('The service did not start')
+
+
+def main(argv=None):
+    ''' Parses the command line, runs the load test, and prints the results.'''
+    parser = argparse.ArgumentParser(description='Load test service.py.')
+    parser.add_argument('--url', help='address of a running service, e.g. '
+                'http://127.0.0.1:8080 (default: start one)')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--batch', type=int, default=1,
+                help='scenarios per request (default: 1)')
+    parser.add_argument('--distinct', type=int, default=1000,
+                help='size of the pool of scenarios (default: 1000)')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                help='cache size of the service started (default: 100000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', getFreePort()
+        process = startService(port, args.cache_size)
+    try:
+        results = asyncio.run(loadTest(host, port, args.requests,
+                    args.connections, args.batch, args.distinct, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print('%d requests (%d scenarios) in %.2f s, %d errors' % (
+          results['requests'], results['scenarios'], results['seconds'],
+          results['errors']))
+    print('%.0f requests/s, %.0f scenarios/s' % (results['rps'],
+          results['scenariosPerSecond']))
+    print('latency ms: mean %.2f  p50 %.2f  p90 %.2f  p99 %.2f  max %.2f' % tuple(
+          1000*results[k] for k in ('mean', 'p50', 'p90', 'p99', 'max')))
+    print('cache hit rate %.1f%%' % (100*results['stats']['cache']['hitRate']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+'''
+modechoice.py
+Picks the best mode for every trip, instead of reading it off the bars of
+the GUI. Each trip (or traveller) can have its own constraints:
+    maxTime      - most hours the trip may take
+    valueOfTime  - what an hour is worth to the traveller ($/hour)
+    maxCO2       - most CO2 (lbs) the trip may emit
+    calValue     - what a calorie burned is worth ($/cal, default 0)
+Of the modes that meet maxTime and maxCO2, the one with the lowest
+generalized cost (cost + valueOfTime*time - calValue*cal) is chosen. Also
+worked out is the Pareto frontier of every trip: the modes that no other
+mode beats on time, cost, and CO2 while burning at least as many calories.
+For example:
+    >> python3 modechoice.py trips.csv --value-of-time 15 -o choices.csv
+    >> python3 modechoice.py --random 1000000 --max-time 0.75 --max-co2 5
+    >> python3 modechoice.py trips.csv --modes driver walker
+
+A trips CSV has a header row and a distance column (miles). It may also
+have user, trips, category, sex, maxTime, valueOfTime, maxCO2, and calValue
+columns; where it doesn't, the values from the command line are used. A
+store made by tripstore.py can be given instead. Every registered mode
+(see the registry module) is considered unless --modes picks some of them.
+
+Trips are read and worked out a chunk at a time: the per-mode results come
+from engine.calculateBatch, and the choice and frontier are worked out for
+the whole chunk with array masks and argmin, so memory use depends on the
+chunk size, not the number of trips.
+'''
+import argparse
+import csv
+import os
+import sys
+import time
+import numpy as np
+import engine
+import registry
+
+# Values compared for the Pareto frontier: lower is better for the first
+# ones, higher is better for the last
+MINIMIZE = ('time', 'cost', 'CO2-mode')
+MAXIMIZE = ('cal',)
+
+# Constraint columns of a trips CSV, and their defaults
+CONSTRAINTS = {'maxTime':np.inf, 'valueOfTime':0.0, 'maxCO2':np.inf,
+               'calValue':0.0}
+
+
+def asColumn(value):
+    ''' Returns a scalar or 1-d array as a column (shape (rows or 1, 1)),
+    to be broadcast against per-mode arrays.'''
+    return np.reshape(np.asarray(value, dtype=float), (-1, 1))
+
+
+def getScores(calc, valueOfTime=0.0, calValue=0.0):
+    ''' Returns the generalized cost ($) of every mode of every row of
+    calc (engine.calculateBatch's results): cost + valueOfTime*time -
+    calValue*cal. valueOfTime and calValue may be scalars or arrays with
+    one value per row.'''
+    return (calc['cost'] + asColumn(valueOfTime)*calc['time']
+            - asColumn(calValue)*calc['cal'])
+
+
+def chooseModes(calc, maxTime=np.inf, valueOfTime=0.0, maxCO2=np.inf,
+                calValue=0.0):
+    ''' Chooses the mode of every row of calc (engine.calculateBatch's
+    results) with the lowest generalized cost (see getScores) out of the
+    ones taking at most maxTime hours and emitting at most maxCO2 lbs. The
+    constraints may be scalars or arrays with one value per row. Returns
+    (choice, score): the column of the mode chosen for each row (-1 where
+    no mode meets the constraints) and its generalized cost (nan there).'''
+    scores = getScores(calc, valueOfTime, calValue)
+    feasible = ((calc['time'] <= asColumn(maxTime))
+                & (calc['CO2-mode'] <= asColumn(maxCO2)))
+    scores = np.where(feasible, scores, np.inf)
+    choice = np.argmin(scores, axis=1)
+    score = scores[np.arange(len(choice)), choice]
+    none = ~feasible.any(axis=1)
+    choice[none] = -1
+    score[none] = np.nan
+    return choice, score
+
+
+def paretoFrontier(calc, minimize=MINIMIZE, maximize=MAXIMIZE):
+    ''' Returns a boolean array (rows x modes) that is True for the modes
+    of each row of calc that are on its Pareto frontier: the ones no other
+    mode of the row dominates (is at least as good at all of minimize and
+    maximize, and better at one). Uses rows x modes x modes x values
+    of memory, so calc should be a chunk of rows.'''
+    values = np.stack([calc[n] for n in minimize]
+                      + [-calc[n] for n in maximize], axis=-1)
+    mode, other = values[:, :, None, :], values[:, None, :, :]
+    dominated = (np.all(other <= mode, axis=-1)
+                 & np.any(other < mode, axis=-1)).any(axis=2)
+    return ~dominated
+
+
+def getLabels(modes):
+    ''' Returns an array with the text of every possible frontier of modes
+    (e.g. 'driver;walker'), indexed by the frontier as a bit mask.'''
+    return np.array([';'.join(m for i, m in enumerate(modes) if mask >> i & 1)
+                     for mask in range(2**len(modes))], dtype=object)
+
+
+def optimizeChunk(chunk, modes=engine.MODES, **defaults):
+    ''' Works out a chunk of trips: a dictionary of columns (distance, and
+    optionally trips, category, sex, and the CONSTRAINTS; defaults are
+    used for missing constraints). Returns (calc, choice, score, frontier)
+    as from engine.calculateBatch, chooseModes, and paretoFrontier.'''
+    calc = engine.calculateBatch(chunk['distance'], chunk.get('trips', 1.0),
+                chunk.get('category', 'average'), sex=chunk.get('sex', 'M'),
+                modes=modes)
+    constraints = {name:chunk.get(name, defaults.get(name, default))
+                   for name, default in CONSTRAINTS.items()}
+    choice, score = chooseModes(calc, **constraints)
+    return calc, choice, score, paretoFrontier(calc)
+
+
+def readCSV(lines, chunkSize=100000):
+    ''' Reads a trips CSV from an iterable of lines and yields chunks of
+    it as dictionaries of arrays.'''
+    reader = csv.reader(lines)
+    header = [h.strip() for h in next(reader)]
+    if 'distance' not in header:
+        raise ValueError('Trips file has no distance column')
+    numbers = ('distance', 'trips') + tuple(CONSTRAINTS)
+    rows = []
+    for row in reader:
+        if not row:
+            continue
+        # A short row would cut every column of its chunk to its length
+        if len(row) < len(header):
+            raise ValueError('Trips file line %d has %d columns, the header '
+                             'has %d' % (reader.line_num, len(row), len(header)))
+        rows.append(row)
+        if len(rows) >= chunkSize:
+            yield getColumns(header, rows, numbers)
+            rows = []
+    if rows:
+        yield getColumns(header, rows, numbers)
+
+
+def getColumns(header, rows, numbers):
+    ''' Returns a dictionary of arrays from CSV rows. Blank car categories
+    are 'average', and blank constraints get their defaults.'''
+    chunk = {}
+    for name, column in zip(header, zip(*rows)):
+        column = np.char.strip(np.array(column))
+        # (np.where, as assigning into column would cut the defaults to
+        # the width of its strings)
+        if name in CONSTRAINTS:
+            column = np.where(column == '', str(CONSTRAINTS[name]), column)
+        elif name == 'category':
+            column = np.where(column == '', 'average', column)
+        chunk[name] = column.astype(float) if name in numbers else column
+    return chunk
+
+
+def readStore(path, chunkSize=100000):
+    ''' Yields chunks of the trips in a store made by tripstore.py.'''
+    import tripstore
+    spec, columns = tripstore.openStore(path)
+    users = np.array(tripstore.readUsers(path), dtype=object)
+    for lo in range(0, spec['rows'], chunkSize):
+        yield {'user':users[columns['user'][lo:lo+chunkSize]],
+               'distance':columns['distance'][lo:lo+chunkSize],
+               'trips':columns['trips'][lo:lo+chunkSize],
+               'category':columns['category'][lo:lo+chunkSize]}
+
+
+def makeTrips(rng, n, chunkSize=100000):
+    ''' Yields chunks of n random trips, for trying out the optimizer.'''
+    for lo in range(0, n, chunkSize):
+        m = min(chunkSize, n - lo)
+        yield {'user':np.arange(lo, lo + m).astype(str),
+               'distance':np.round(rng.gamma(2.0, 2.0, m), 2),
+               'category':rng.integers(0, len(engine.CATEGORIES), m),
+               'sex':rng.choice(['M', 'F'], m)}
+
+
+def main(argv=None):
+    ''' Parses the command line, chooses the mode of every trip, writes the
+    choices, and prints how many trips each mode was chosen for.'''
+    parser = argparse.ArgumentParser(description='Choose the best mode of '
+                'every trip under time, cost, and CO2 constraints.')
+    parser.add_argument('trips', nargs='?', help='trips CSV, or a directory '
+                'made by tripstore.py')
+    parser.add_argument('--random', type=int, default=1000000,
+                help='number of random trips if no file is given')
+    parser.add_argument('--max-time', type=float, default=np.inf,
+                help='most hours a trip may take')
+    parser.add_argument('--value-of-time', type=float, default=0.0,
+                help='what an hour is worth ($/hour)')
+    parser.add_argument('--max-co2', type=float, default=np.inf,
+                help='most CO2 a trip may emit (lbs)')
+    parser.add_argument('--cal-value', type=float, default=0.0,
+                help='what a calorie burned is worth ($/cal)')
+    parser.add_argument('--modes', nargs='+', choices=registry.getNames(),
+                help='registered modes to choose from (default: all of them)')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-o', '--output', help='CSV file for the choice of '
+                'every trip')
+    args = parser.parse_args(argv)
+
+    f = None
+    if args.trips is None:
+        chunks = makeTrips(np.random.default_rng(args.seed), args.random,
+                    args.chunk_size)
+    elif os.path.isdir(args.trips):
+        chunks = readStore(args.trips, args.chunk_size)
+    else:
+        f = open(args.trips, newline='')
+        chunks = readCSV(f, args.chunk_size)
+    defaults = {'maxTime':args.max_time, 'valueOfTime':args.value_of_time,
+                'maxCO2':args.max_co2, 'calValue':args.cal_value}
+    out = None if args.output is None else open(args.output, 'w', newline='')
+    modes = registry.getNames() if args.modes is None else tuple(args.modes)
+    names = np.array(list(modes) + ['none'], dtype=object)
+    labels = getLabels(modes)
+    bits = 2**np.arange(len(modes))
+    counts = np.zeros(len(modes) + 1, dtype=np.int64)
+    n = 0
+    start = time.perf_counter()
+    try:
+        if out is not None:
+            writer = csv.writer(out)
+            writer.writerow(['user', 'mode', 'score', 'time', 'cost', 'cal',
+                        'CO2', 'frontier'])
+        for chunk in chunks:
+            calc, choice, score, frontier = optimizeChunk(chunk, modes,
+                        **defaults)
+            # -1 (no mode) is counted in the last place, with names
+            counts += np.bincount(choice % len(names), minlength=len(names))
+            m = len(choice)
+            if out is not None:
+                rows = np.arange(m)
+                picked = {k:np.where(choice >= 0, calc[k][rows, choice],
+                          np.nan) for k in ('time', 'cost', 'cal', 'CO2-mode')}
+                users = chunk.get('user', np.arange(n, n + m))
+                writer.writerows(zip(users, names[choice],
+                            *[np.char.mod('%.6g', v) for v in (score,
+                            picked['time'], picked['cost'], picked['cal'],
+                            picked['CO2-mode'])],
+                            labels[frontier @ bits]))
+            n += m
+    finally:
+        if out is not None:
+            out.close()
+        if f is not None:
+            f.close()
+    seconds = time.perf_counter() - start
+    print('%d trips in %.2f s (%.0f trips/s)' % (n, seconds,
+          n / seconds if seconds else 0), file=sys.stderr)
+    for name, count in zip(names, counts):
+        print('%-8s %12d  %5.1f%%' % (name, count, 100*count / max(n, 1)))
+
+if __name__ == "__main__":
+    main()
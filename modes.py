@@ -10,24 +10,100 @@ of using that mode of transit in $/mile.
 -Each has a getMPH method that returns the average speed
 of that mode of transit (in MPH)
 
--Driver object has a getCO2 method that returns amnt
-of CO2 used in lbs/mile
+-Each has a getCO2 method that returns amnt
+of CO2 used in lbs/mile (only the driver's isn't 0)
+
+-Default speeds, costs, and activity levels come from the modes declared
+in the registry module. Modes registered there with no class of their own
+(e-bikes, transit...) are made as Commuter objects (see makeMode).
+
+-Derived values (BMR, cal/hour, $/mile, CO2/mile) are remembered until
+one of their inputs is changed through a setter (see the Memo class).
 
 NOTE: Many of the setter methods that exist here are never used when
 the GUI is run thru the graphMain module. Even though they are not used,
 I left them in because I believe they are all functional and could easily be
 used if a slightly more comprehensive GUI were implemented.
 '''
+import contextlib
+import registry
+
+class Memo:
+    ''' The Driver, Biker, Walker, and Person classes inherit from Memo so
+    they can remember derived values (BMR, cal/hour, $/mile, CO2/mile)
+    instead of working them out on every call. A remembered value is
+    forgotten when one of its inputs is changed through a setter, along with
+    any values that depend on it (listed in memoDeps). Counts of cache hits
+    and misses are kept for each object.'''
+
+    # {value: values that are worked out from it}
+    memoDeps = {}
+
+    def initMemo(self):
+        ''' Sets up an empty memo. Called by the constructors.'''
+        self.memo = {}
+        self.batching = 0       # How many batchUpdate blocks we are in
+        self.stale = False      # True if update was put off by a batch
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+    def remember(self, name, compute):
+        ''' Returns the remembered value called name. If there isn't one,
+        compute is called to work it out, and the result is remembered.'''
+        if name in self.memo:
+            self.cacheHits += 1
+        else:
+            self.cacheMisses += 1
+            self.memo[name] = compute()
+        return self.memo[name]
+
+    def forget(self, *names):
+        ''' Forgets the remembered values called names, and any values
+        that depend on them.'''
+        for name in names:
+            self.memo.pop(name, None)
+            self.forget(*self.memoDeps.get(name, ()))
+
+    @contextlib.contextmanager
+    def batchUpdate(self):
+        ''' Context manager for applying several setters at once, e.g.
+            with driver.batchUpdate():
+                driver.setGasPrice(2.5)
+                driver.setMPG(31)
+        The update the setters would each trigger is done once, when
+        the block ends. Values read inside the block may be out of date.'''
+        self.batching += 1
+        try:
+            yield self
+        finally:
+            self.batching -= 1
+            if not self.batching and self.stale:
+                self.stale = False
+                self.update()
+
+    def update(self):
+        ''' Recalculates anything that isn't worked out on demand. Most
+        classes work everything out on demand, so by default it does nothing.'''
+        pass
+
+    def getCacheStats(self):
+        ''' Returns the number of cache hits and misses for this object.'''
+        return {'hits':self.cacheHits, 'misses':self.cacheMisses}
 
-class Driver:
+class Driver(Memo):
     ''' The driver object knows and can set and return values related to
     calculations for the driver, including speed, cost, and CO2 emissions'''
+    # Lbs of CO2 emitted per gallon of gas burned (EPA)
+    LBS_CO2_PER_GAL = 19.6
+
     def __init__(self):
         '''Constructor set's default values for instance variables.'''
+        self.initMemo()
+
         # Default Values
         self.cat = "average"    # Category of car (others listed in dict below)
         self.miles = 13476.00   # Miles driven in a year (initialized US avg)
-        self.MPH = 29.4         # Avg speed MN (infinitemonkeycorps.net)
+        self.MPH = registry.getMode('driver').mph  # Avg speed (see registry)
         self.person = Person("driver")  # Used for determining calorie burn
 
         # Custom values
@@ -54,17 +130,18 @@ class Driver:
 
     def reset(self):
         ''' Resets driver object to default values'''
-        self.cat = "average"    # Category of car
-        self.update()
-        self.miles = 13476.00   # Miles driven in a year (initialized US avg)
-
-        self.gasPrice = None     # Cost of gas ($/mile)
-        self.MPG = None         # Fuel eff. of your car (miles/gal)
-        self.gasSpend = None     # What you spend on gas ($/year)
-        self.maintSpend = None   # What you spend on maintenance ($/year)
-        self.tireSpend = None   # What you spend on tire ($/year)
-
-        self.update()
+        with self.batchUpdate():
+            self.cat = "average"    # Category of car
+            self.update()
+            self.miles = 13476.00   # Miles driven in a year (initialized US avg)
+
+            self.gasPrice = None     # Cost of gas ($/mile)
+            self.MPG = None         # Fuel eff. of your car (miles/gal)
+            self.gasSpend = None     # What you spend on gas ($/year)
+            self.maintSpend = None   # What you spend on maintenance ($/year)
+            self.tireSpend = None   # What you spend on tire ($/year)
+
+            self.update()
         self.person.reset()
 
     def setCat(self, catInput):
@@ -75,6 +152,18 @@ class Driver:
         self.cat = catInput
         self.update()
 
+    def setModel(self, modelInput):
+        ''' Accepts the name of a car model listed in data/carMPG.csv
+        (e.g. 'Honda Civic') and sets the driver's category and MPG to
+        those of that model, then updates. Raises KeyError if the model
+        isn't listed.'''
+        import vehicles
+        table = vehicles.loadVehicles()
+        row = table.find(modelInput)
+        with self.batchUpdate():
+            self.setCat(table.getCat(modelInput))
+            self.setMPG(table.mpg[row])
+
     def setGasPrice(self, gasPriceInput):
         ''' Accepts a gas price as input and adjusts driver object's instance
         variable accordingly, then updates. In the update function, the gas
@@ -119,7 +208,6 @@ class Driver:
         on maintenance each year, and adjusts the driver object's
         tireSpend instance variable accordingly.'''
         self.tireSpend = float(tireSpendInput)
-        self.setMiles()
         self.update()
 
     def update(self):
@@ -129,7 +217,13 @@ class Driver:
         together when the getCost fcn is called, to provide
         an overall cost in $ per mile.  Determines if custom values
         have been set, and if not, uses default values based on
-        car category. '''
+        car category. Inside a batchUpdate block this is put off until
+        the block ends, so several setters only update once. '''
+        if self.batching:
+            self.stale = True
+            return
+        self.forget('cost', 'CO2')
+
         # Set gas cost based on custom or default values
         if self.gasPrice:
             if self.MPG:
@@ -156,39 +250,45 @@ class Driver:
     def getCost(self):
         ''' Returns the cost of driving the car object
             in $ per mile. '''
-        return sum(self.costDict.values())
+        return self.remember('cost', lambda: sum(self.costDict.values()))
 
     def getCO2(self):
         ''' Returns the CO2 emissions that result
         from driving the car, in pounds per mile'''
+        return self.remember('CO2', self.calcCO2)
+
+    def calcCO2(self):
+        ''' Works out the value returned by getCO2.'''
         # (19.6 lbs CO2 /gal) / (miles/gal)
         if self.MPG:
-            return 19.6 / self.MPG
+            return self.LBS_CO2_PER_GAL / self.MPG
         else:
-            return 19.6 / self.catDict[self.cat][3]
+            return self.LBS_CO2_PER_GAL / self.catDict[self.cat][3]
 
     def getMPH(self):
         '''Returns the avg MPH for this mode of transit'''
         return self.MPH
 
-class Biker:
+class Biker(Memo):
     ''' The driver object knows and can set and return values related to
     calculations for the biker, including speed and cost.'''
     def __init__(self):
         ''' Constructor that builds biker object which keeps track of the amnt
         spent on bike in parts and maintenance (in $ / year) and number of miles
         biked per year, to determine cost of biking in $ per mile.
-        Initial values based on report: http://www.vtpi.org/tca/tca0501.pdf'''
-        self.spend = 100.00    # Maintenace and parts ($/year)
-        self.miles = 1500.00   # miles biked / year
-        self.MPH = 11.5        # Avg speed in city (Livestrong)
+        Initial values based on report: http://www.vtpi.org/tca/tca0501.pdf
+        (see registry).'''
+        self.initMemo()
         self.person = Person("biker")
+        self.reset()
 
     def reset(self):
         ''' Set default values for biker object.'''
-        self.spend = 100.00    # Maintenace and parts ($/year)
-        self.miles = 1500.00   # miles biked / year
-        self.MPH = 11.5        # Avg speed in city (Livestrong)
+        spec = registry.getMode('biker')
+        self.spend = spec.spend         # Maintenace and parts ($/year)
+        self.miles = spec.spendMiles    # miles biked / year
+        self.MPH = spec.mph             # Avg speed in city (Livestrong)
+        self.forget('cost')
         self.person.reset()
 
     def setMiles(self, milesInput):
@@ -197,6 +297,7 @@ class Biker:
         together with what they spend in a year to determine the cost
         per mile of biking.'''
         self.miles = float(milesInput)
+        self.forget('cost')
 
     def setSpend(self, spendInput):
         ''' Takes a number and sets self.spend accordingly. This number
@@ -204,33 +305,40 @@ class Biker:
         and is used together with how many miles they bike in a year to determine
         the cost per mile of biking.'''
         self.spend = float(spendInput)
+        self.forget('cost')
 
     def getCost(self):
         ''' Returns cost per mile in $ for biking
         Based on cost of bike per year divided by miles biked in a year.'''
-        return (self.spend/self.miles)
+        return self.remember('cost', lambda: self.spend/self.miles)
+
+    def getCO2(self):
+        ''' Returns the CO2 emissions of biking, in pounds per mile.'''
+        return registry.getMode('biker').CO2PerMile
 
     def getMPH(self):
         '''Returns the avg MPH for this mode of transit'''
         return self.MPH
 
-class Walker:
+class Walker(Memo):
     ''' The driver object knows and can set and return values related to
     calculations for the walker, including speed and cost.'''
     def __init__(self):
         ''' Constructor that builds walker object which keeps track of the amt
         spent on new shoes and number of miles walked before replacing shoes.
-        Initial values based on: http://www.vtpi.org/tca/tca0501.pdf'''
-        self.spend = 37.5   # Cost of new pair of shoes ($/shoe)
-        self.miles = 1000.0 # Number of miles walked before shoes are replaced
-        self.MPH = 3.25     # Avg speed (the-fitness-walking-guide.com/)
+        Initial values based on: http://www.vtpi.org/tca/tca0501.pdf
+        (see registry).'''
+        self.initMemo()
         self.person = Person("walker") # Used to determine calorie burn
+        self.reset()
 
     def reset(self):
         ''' Reset default values.'''
-        self.spend = 37.5   # Cost of new pair of shoes ($/shoe)
-        self.miles = 1000.0 # Number of miles walked before shoes are replaced
-        self.MPH = 3.25     # Avg speed (the-fitness-walking-guide.com/)
+        spec = registry.getMode('walker')
+        self.spend = spec.spend         # Cost of new pair of shoes ($/shoe)
+        self.miles = spec.spendMiles    # Miles walked before shoes are replaced
+        self.MPH = spec.mph             # Avg speed (the-fitness-walking-guide.com/)
+        self.forget('cost')
         self.person.reset()
 
     def setMiles(self, milesInput):
@@ -238,22 +346,84 @@ class Walker:
         These value is the number of miles the user walks before buying a
         new pair of shoes.'''
         self.miles = float(milesInput)
+        self.forget('cost')
 
     def setSpend(self, spendInput):
         ''' Takes in a value representing how much the user spends on a new
         pair of walking shoes and sets self.spend accordingly.'''
         self.spend = float(spendInput)
+        self.forget('cost')
 
     def getCost(self):
         ''' Returns cost per mile in $ for walking
         Based on cost of new shoes divided by miles walked until buying shoes'''
-        return self.spend/self.miles
+        return self.remember('cost', lambda: self.spend/self.miles)
+
+    def getCO2(self):
+        ''' Returns the CO2 emissions of walking, in pounds per mile.'''
+        return registry.getMode('walker').CO2PerMile
 
     def getMPH(self):
         '''Returns the avg MPH for this mode of transit'''
         return self.MPH
 
-class Person:
+class Commuter(Memo):
+    ''' A mode of transit declared in the registry module that has no class
+    of its own (an e-bike, transit, ...). Its speed, cost, CO2 emissions,
+    and activity level come from its ModeSpec. Like the biker's, its
+    spending and the miles it's spread over can be customized. If the mode
+    uses a car, the cost and CO2 of a Driver's car are added to its own.'''
+    def __init__(self, mode, driver=None):
+        ''' Accepts the name of a registered mode, and for a mode that uses
+        a car, the Driver whose car it is (default: a new Driver). Raises
+        KeyError if there isn't a mode by that name.'''
+        self.initMemo()
+        self.mode = mode
+        self.spec = registry.getMode(mode)
+        self.driver = None
+        if self.spec.usesCar:
+            self.driver = Driver() if driver is None else driver
+        self.person = Person(mode)
+        self.reset()
+
+    def reset(self):
+        ''' Sets the default values of the mode.'''
+        self.spend = self.spec.spend        # $ spent every self.miles miles
+        self.miles = self.spec.spendMiles
+        self.MPH = self.spec.mph
+        self.forget('cost')
+        self.person.reset()
+
+    def setMiles(self, milesInput):
+        ''' Sets the number of miles the spending is spread over.'''
+        self.miles = float(milesInput)
+        self.forget('cost')
+
+    def setSpend(self, spendInput):
+        ''' Sets how much is spent every self.miles miles.'''
+        self.spend = float(spendInput)
+        self.forget('cost')
+
+    def getCost(self):
+        ''' Returns cost per mile in $: the mode's cost per mile plus the
+        spending divided by the miles it's spread over (plus the car's).'''
+        cost = self.remember('cost',
+                    lambda: self.spec.costPerMile + self.spend/self.miles)
+        if self.driver is not None:
+            cost += self.driver.getCost()
+        return cost
+
+    def getCO2(self):
+        ''' Returns the CO2 emissions of the mode, in pounds per mile.'''
+        if self.driver is not None:
+            return self.spec.CO2PerMile + self.driver.getCO2()
+        return self.spec.CO2PerMile
+
+    def getMPH(self):
+        '''Returns the avg MPH for this mode of transit'''
+        return self.MPH
+
+class Person(Memo):
     ''' The person object is used to calculate calories. The driver, biker,
     and walker objects each create an instance of the person object, and pass
     'driver', 'biker', or 'walker', into the constructor as the mode of
@@ -262,10 +432,14 @@ class Person:
     height, and age, to determine a amount of calories burned per hour (using
     the Harris–Benedict equation).
     '''
+    # A new BMR means a new calorie burn
+    memoDeps = {'BMR':('cal',)}
+
     def __init__(self, mode):
         ''' Constructor for person object. The mode parameter refers
         to the mode of transit and expects either 'driver', 'biker' or
         walker.'    '''
+        self.initMemo()
         # Initiates to an avg adult US male, based on figures at
         # http://pediatrics.about.com/
         self.sex = "M"
@@ -309,23 +483,28 @@ class Person:
             else:
                 print("Error!")
 
+        self.forget('BMR')
+
     def setWeight(self, weightInput):
         ''' Accepts user's weight and sets instance variable accordingly.'''
         self.weight = float(weightInput)
+        self.forget('BMR')
 
     def setHeight(self, heightInput):
         ''' Accepts user's height and sets instance variable accordingly.'''
         self.height = float(heightInput)
+        self.forget('BMR')
 
     def setAge(self, ageInput):
         ''' Accepts user's age and sets instance variable accordingly.'''
         self.age = float(ageInput)
+        self.forget('BMR')
 
     def setActLevel(self, level):
         ''' Customize activity level to be no, light, moderate, or heavy.'''
-        if (level == "no" or level == "light" or level=="moderate"
-                        or level=="heavy"):
+        if level in registry.ACT_MULT:
             self.actLevel = level
+            self.forget('cal')
         else:
             print ("Error!")
 
@@ -335,20 +514,21 @@ class Person:
             respectively.) Acitivity level can be customized using the setActLevel
             method, for example, if the user bikes at a leisurely pace they could
             change actLevel to light for the biker's instance of the person
-            class. This fcn is used to set default values. '''
-            if self.mode == "driver":
-                return "no"
-            elif self.mode == "biker":
-                return "moderate"
-            elif self.mode == "walker":
-                return "light"
-            else:
+            class. This fcn is used to set default values. The activity level
+            of each mode is declared in the registry module.'''
+            try:
+                return registry.getMode(self.mode).actLevel
+            except KeyError:
                 print ("Error!")
 
     def getBMR(self):
         ''' Determines basal metabolic rate (BMR) using
         Harris–Benedict equation. This is the amount of resting calories
         a person burns in a day.'''
+        return self.remember('BMR', self.calcBMR)
+
+    def calcBMR(self):
+        ''' Works out the value returned by getBMR.'''
         if self.sex == 'M':
             BMR = 66+(6.23*self.weight)+(12.7*self.height)-(6.76*self.age)
         elif self.sex == 'F':
@@ -361,18 +541,26 @@ class Person:
         ''' Determines total calorie burn (cal/hour) using basal
         metabolic rate (BMR) and a multiplier determined by activity level.
         The product is divided by 24 to go from cal/day to cal/hour units.'''
-        if self.actLevel == "no":
-            # Acitivity multiplier for little or no exercise
-            calorieBurn = (1.2*self.getBMR()) / 24
-        elif self.actLevel == "light":
-            # Acitivity multiplier for light exercise
-            calorieBurn  = (1.375*self.getBMR()) / 24
-        elif self.actLevel == "moderate":
-            # Acitivity multiplier for moderate exercise
-            calorieBurn = (1.55*self.getBMR()) / 24
-        elif self.actLevel == "heavy":
-            # Acitivity multiplier for heavy exercise
-            calorieBurn = (1.725*self.getBMR()) / 24
+        return self.remember('cal', self.calcCal)
+
+    def calcCal(self):
+        ''' Works out the value returned by getCal.'''
+        # Acitivity multipliers (no, light, moderate, or heavy exercise)
+        # are listed in registry.ACT_MULT
+        if self.actLevel in registry.ACT_MULT:
+            calorieBurn = (registry.ACT_MULT[self.actLevel]*self.getBMR()) / 24
         else:
             print("Error!")
         return calorieBurn
+
+# The modes that have classes of their own
+MODE_CLASSES = {'driver':Driver, 'biker':Biker, 'walker':Walker}
+
+def makeMode(mode, driver=None):
+    ''' Returns a new object for a mode registered in the registry module:
+    a Driver, Biker, or Walker for those modes, otherwise a Commuter (using
+    driver's car, if the mode uses a car). Raises KeyError if no mode by
+    that name is registered.'''
+    if mode in MODE_CLASSES:
+        return MODE_CLASSES[mode]()
+    return Commuter(mode, driver)
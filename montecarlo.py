@@ -0,0 +1,229 @@
+'''
+montecarlo.py
+Monte Carlo uncertainty for the results of RunSim.calculate. The inputs in
+the modes module are point estimates (the speeds, AAA costs per mile, and
+the EPA's 19.6 lbs of CO2 per gallon). Here each of them is multiplied by a
+random factor drawn from a configurable distribution, and the results are
+worked out for a large number of samples with engine.evaluate.
+
+Samples are drawn and evaluated in batches, and each batch is folded into
+streaming accumulators (counts, sums, and fixed-bin histograms), so even a
+billion samples never have to be held in memory at once. The mean, standard
+deviation, and percentiles of every calcDict value are reported:
+    >> python3 montecarlo.py 100000000 --dist 5 --trips 10
+'''
+import argparse
+import numpy as np
+import engine
+from modes import Driver, Biker, Walker
+
+# The uncertain inputs, and the default distribution of the random factor
+# each one is multiplied by. A distribution is (kind, *arguments) where kind
+# is the name of a numpy Generator method, e.g. ('normal', mean, sd) or
+# ('triangular', left, mode, right); ('fixed', value) always gives value.
+DISTRIBUTIONS = {
+    'driverMPH':('triangular', 0.7, 1.0, 1.2),  # Traffic varies a lot
+    'bikerMPH':('triangular', 0.8, 1.0, 1.2),
+    'walkerMPH':('triangular', 0.85, 1.0, 1.15),
+    'gas':('normal', 1.0, 0.15),                # Gas prices move
+    'maint':('normal', 1.0, 0.10),
+    'tire':('normal', 1.0, 0.10),
+    'bikeCost':('triangular', 0.5, 1.0, 1.5),
+    'shoeCost':('triangular', 0.5, 1.0, 1.5),
+    'lbsCO2PerGal':('normal', 1.0, 0.02),
+}
+
+# Names of the values reported, per-mode ones as e.g. 'time[driver]'
+QUANTITIES = tuple('%s[%s]' % (k, m) for k in ('time', 'cost', 'cal',
+    'time-mins', 'time-audio', 'cost-coffee', 'cal-hour')
+    for m in engine.MODES) + ('CO2', 'CO2-tree')
+
+
+def drawFactors(rng, distributions, n):
+    ''' Returns {input: array of n random factors} using distributions.'''
+    factors = {}
+    for name, dist in distributions.items():
+        kind, args = dist[0], dist[1:]
+        if kind == 'fixed':
+            factors[name] = np.full(n, float(args[0]))
+        else:
+            factors[name] = getattr(rng, kind)(*args, size=n)
+    return factors
+
+
+def evaluateSamples(factors, dist, trips, cat, bikeSpend, shoeSpend, sex):
+    ''' Works out the results of one scenario for every sample of factors.
+    Returns an array with one row per sample and one column per name in
+    QUANTITIES.'''
+    d, b, w = Driver(), Biker(), Walker()
+    d.setCat(cat)
+    b.setSpend(bikeSpend)
+    w.setSpend(shoeSpend)
+    for m in (d, b, w):
+        m.person.setSex(sex, True)
+
+    mph = np.column_stack([d.getMPH() * factors['driverMPH'],
+                           b.getMPH() * factors['bikerMPH'],
+                           w.getMPH() * factors['walkerMPH']])
+    perMile = np.column_stack([d.costDict['gas'] * factors['gas']
+                               + d.costDict['maint'] * factors['maint']
+                               + d.costDict['tire'] * factors['tire'],
+                               b.getCost() * factors['bikeCost'],
+                               w.getCost() * factors['shoeCost']])
+    calHour = np.array([m.person.getCal() for m in (d, b, w)])
+    CO2PerMile = d.getCO2() * factors['lbsCO2PerGal']
+    miles = np.full(len(mph), float(dist*trips))
+
+    calc = engine.evaluate(miles, mph, perMile, calHour, CO2PerMile)
+    columns = [calc[k] for k in ('time', 'cost', 'cal', 'time-mins',
+               'time-audio', 'cost-coffee', 'cal-hour')]
+    return np.column_stack(columns + [calc['CO2'], calc['CO2-tree']])
+
+
+class StreamStats:
+    ''' Streaming statistics of several columns of numbers, added a batch
+    at a time. Keeps the count, mean, and variance (combined batch by batch
+    so they stay accurate), the minimum and maximum, and a histogram of each
+    column for percentiles. The histogram range is set from the first batch
+    (widened by half its span on each side); when later values fall outside
+    it, the range of that column is doubled (merging pairs of bins) until
+    they fit, so no values are clipped into the end bins.'''
+
+    def __init__(self, nColumns, bins=10000):
+        self.n = 0
+        self.mean = np.zeros(nColumns)
+        self.m2 = np.zeros(nColumns)    # Sum of squared differences from mean
+        self.min = np.full(nColumns, np.inf)
+        self.max = np.full(nColumns, -np.inf)
+        self.bins = bins + bins % 2     # Even, so bins can be merged in pairs
+        self.lo = self.hi = None
+        self.counts = np.zeros((nColumns, self.bins), dtype=np.int64)
+
+    def add(self, batch):
+        ''' Adds a batch (an array with one row per sample).'''
+        n = len(batch)
+        if not n:
+            return
+        mean = batch.mean(axis=0)
+        m2 = ((batch - mean)**2).sum(axis=0)
+        total = self.n + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta**2 * self.n * n / total
+        self.mean += delta * n / total
+        self.n = total
+        self.min = np.minimum(self.min, batch.min(axis=0))
+        self.max = np.maximum(self.max, batch.max(axis=0))
+
+        if self.lo is None:
+            span = self.max - self.min
+            span[span == 0] = np.maximum(np.abs(self.max[span == 0]), 1.0)
+            self.lo = self.min - span/2
+            self.hi = self.max + span/2
+        outside = (self.min < self.lo) | (self.max > self.hi)
+        for j in np.flatnonzero(outside & np.isfinite(self.min)
+                                & np.isfinite(self.max)):
+            self.widen(j)
+        # Bin every column at once by offsetting column j into bins of row j
+        scaled = (batch - self.lo) / (self.hi - self.lo) * self.bins
+        index = np.clip(scaled.astype(np.int64), 0, self.bins - 1)
+        index += np.arange(batch.shape[1]) * self.bins
+        self.counts += np.bincount(index.ravel(),
+                    minlength=self.counts.size).reshape(self.counts.shape)
+
+    def widen(self, j):
+        ''' Doubles the histogram range of column j, towards the side its
+        values fell outside of, until it covers its minimum and maximum.'''
+        half = self.bins // 2
+        while self.min[j] < self.lo[j] or self.max[j] > self.hi[j]:
+            merged = self.counts[j].reshape(half, 2).sum(axis=1)
+            span = self.hi[j] - self.lo[j]
+            self.counts[j] = 0
+            if self.min[j] < self.lo[j]:
+                self.counts[j, half:] = merged
+                self.lo[j] -= span
+            else:
+                self.counts[j, :half] = merged
+                self.hi[j] += span
+
+    def getStd(self):
+        ''' Returns the standard deviation of each column.'''
+        return np.sqrt(self.m2 / max(self.n - 1, 1))
+
+    def getPercentiles(self, percents):
+        ''' Returns an array (one row per percent, one column per column)
+        of percentiles, interpolated within the histogram bins.'''
+        if not self.n:
+            raise ValueError('No samples have been added')
+        cumulative = np.cumsum(self.counts, axis=1) / self.n
+        width = (self.hi - self.lo) / self.bins
+        out = np.empty((len(percents), len(self.mean)))
+        for i, p in enumerate(percents):
+            for j in range(len(self.mean)):
+                k = np.searchsorted(cumulative[j], p/100)
+                k = min(k, self.bins - 1)
+                below = cumulative[j, k-1] if k else 0.0
+                inBin = cumulative[j, k] - below
+                frac = (p/100 - below) / inBin if inBin else 0.5
+                out[i, j] = self.lo[j] + (k + frac) * width[j]
+        return np.clip(out, self.min, self.max)
+
+
+def runMonteCarlo(nSamples, dist=1, trips=1, cat='average', bikeSpend=100.0,
+                  shoeSpend=37.5, sex='M', distributions=None,
+                  percents=(5, 50, 95), batchSize=250000, seed=None,
+                  bins=10000):
+    ''' Draws nSamples samples of the uncertain inputs (DISTRIBUTIONS,
+    updated with any distributions given) for one scenario, and returns
+    {quantity: {'mean':, 'std':, 'min':, 'max':, 'p5':, ...}} for every
+    name in QUANTITIES. Samples are handled batchSize at a time.'''
+    if nSamples <= 0:
+        raise ValueError('nSamples must be more than 0')
+    dists = dict(DISTRIBUTIONS)
+    dists.update(distributions or {})
+    unknown = set(dists) - set(DISTRIBUTIONS)
+    if unknown:
+        raise ValueError('Unknown inputs: %s' % ', '.join(sorted(unknown)))
+
+    rng = np.random.default_rng(seed)
+    stats = StreamStats(len(QUANTITIES), bins)
+    left = int(nSamples)
+    while left > 0:
+        n = min(batchSize, left)
+        stats.add(evaluateSamples(drawFactors(rng, dists, n), dist, trips,
+                    cat, bikeSpend, shoeSpend, sex))
+        left -= n
+
+    pct = stats.getPercentiles(percents)
+    std = stats.getStd()
+    results = {}
+    for j, name in enumerate(QUANTITIES):
+        results[name] = {'mean':stats.mean[j], 'std':std[j],
+                         'min':stats.min[j], 'max':stats.max[j]}
+        for i, p in enumerate(percents):
+            results[name]['p%g' % p] = pct[i, j]
+    return results
+
+
+def main(argv=None):
+    ''' Parses the command line, runs the simulation, and prints a table.'''
+    parser = argparse.ArgumentParser(description='Monte Carlo uncertainty '
+                'of time, cost, calories, and CO2.')
+    parser.add_argument('samples', type=int, help='number of samples')
+    parser.add_argument('--dist', type=float, default=1, help='miles per trip')
+    parser.add_argument('--trips', type=float, default=1, help='trips')
+    parser.add_argument('--cat', default='average', choices=engine.CATEGORIES,
+                help='car category')
+    parser.add_argument('--sex', default='M', choices=('M', 'F'))
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    results = runMonteCarlo(args.samples, args.dist, args.trips, args.cat,
+                sex=args.sex, seed=args.seed)
+    print('%-22s %12s %12s %12s %12s %12s' % ('quantity', 'mean', 'std',
+                'p5', 'p50', 'p95'))
+    for name, r in results.items():
+        print('%-22s %12.4g %12.4g %12.4g %12.4g %12.4g' % (name, r['mean'],
+                    r['std'], r['p5'], r['p50'], r['p95']))
+
+if __name__ == "__main__":
+    main()
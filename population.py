@@ -0,0 +1,115 @@
+'''
+population.py
+A Population holds many people at once, for working out calorie burn for
+whole cohorts. Where the Person class in the modes module is one python
+object per person, a Population keeps each attribute (sex, weight, height,
+age, activity level) in its own contiguous NumPy array, using a few bytes
+per field per person, and works out BMR and cal/hour for everyone in one
+vectorized pass using the same Harris–Benedict coefficients as Person.
+'''
+import numpy as np
+import engine
+from modes import Person
+
+
+class Population:
+    ''' Columnar collection of people. Each attribute is an array with one
+    entry per person:
+        male     - bool (True for 'M', False for 'F')
+        weight   - float32, lbs
+        height   - float32, inches
+        age      - float32, years
+        actLevel - uint8 code, an index into engine.ACT_LEVELS
+    '''
+
+    def __init__(self, sex, weight=None, height=None, age=None,
+                 actLevel='no'):
+        ''' Accepts arrays (or scalars, which are broadcast) of sex ('M' or
+        'F', or booleans with True for male), weight, height, age, and
+        activity level ('no', 'light', 'moderate', 'heavy', or their codes).
+        Where weight, height, or age are None, the defaults for each
+        person's sex are used, like Person.setSex(sex, True) does.'''
+        male = np.atleast_1d(engine.isMale(sex))
+        defaults = [np.where(male, m, f) for m, f in
+                    zip(engine.SEX_DEFAULTS['M'], engine.SEX_DEFAULTS['F'])]
+        if weight is None:
+            weight = defaults[0]
+        if height is None:
+            height = defaults[1]
+        if age is None:
+            age = defaults[2]
+
+        male, weight, height, age, act = np.broadcast_arrays(male, weight,
+                    height, age, actCodes(actLevel))
+        # Weights and heights must be positive, and ages not negative
+        for name, value, positive in (('Weight', weight, True),
+                                      ('Height', height, True),
+                                      ('Age', age, False)):
+            value = np.asarray(value, dtype=float)
+            bad = ~np.isfinite(value) | (value <= 0 if positive else value < 0)
+            if np.any(bad):
+                raise ValueError('%s out of range: %s' % (name, value[bad][0]))
+        self.male = np.ascontiguousarray(male, dtype=bool)
+        self.weight = np.ascontiguousarray(weight, dtype=np.float32)
+        self.height = np.ascontiguousarray(height, dtype=np.float32)
+        self.age = np.ascontiguousarray(age, dtype=np.float32)
+        self.actLevel = np.ascontiguousarray(act, dtype=np.uint8)
+
+    @classmethod
+    def fromPeople(cls, people):
+        ''' Builds a Population from a list of Person objects.'''
+        return cls([p.sex for p in people], [p.weight for p in people],
+                   [p.height for p in people], [p.age for p in people],
+                   [p.actLevel for p in people])
+
+    def __len__(self):
+        return len(self.male)
+
+    def getPerson(self, i):
+        ''' Returns a Person object with the attributes of person i.'''
+        person = Person("driver")
+        person.setSex('M' if self.male[i] else 'F', False)
+        person.setWeight(self.weight[i])
+        person.setHeight(self.height[i])
+        person.setAge(self.age[i])
+        person.setActLevel(engine.ACT_LEVELS[self.actLevel[i]])
+        return person
+
+    def getBMR(self):
+        ''' Returns an array of everyone's basal metabolic rate (cal/day),
+        like Person.getBMR.'''
+        return engine.getBMR(self.male, self.weight, self.height, self.age)
+
+    def getCal(self, actLevel=None):
+        ''' Returns an array of everyone's calorie burn (cal/hour), like
+        Person.getCal. By default each person's own activity level is used;
+        passing actLevel (e.g. 'moderate') uses that level for everyone.'''
+        if actLevel is None:
+            mult = engine.ACT_MULT_TABLE[self.actLevel]
+        else:
+            mult = engine.ACT_MULT_TABLE[actCodes(actLevel)]
+        return self.getBMR() * mult / 24
+
+    def getNBytes(self):
+        ''' Returns the number of bytes used to store the attributes.'''
+        return (self.male.nbytes + self.weight.nbytes + self.height.nbytes
+                + self.age.nbytes + self.actLevel.nbytes)
+
+
+def actCodes(actLevel):
+    ''' Accepts activity levels ('no', 'light', 'moderate', 'heavy') or
+    their integer codes, and returns an array of codes (indexes into
+    engine.ACT_LEVELS).'''
+    actLevel = np.asarray(actLevel)
+    if actLevel.dtype.kind in 'iu':
+        if actLevel.size and (actLevel.min() < 0
+                              or actLevel.max() >= len(engine.ACT_LEVELS)):
+            raise ValueError('Activity level code out of range')
+        return actLevel
+    names, inverse = np.unique(actLevel, return_inverse=True)
+    lookup = {a:i for i, a in enumerate(engine.ACT_LEVELS)}
+    try:
+        codes = np.array([lookup[str(n)] for n in names], dtype=np.uint8)
+    except KeyError as e:
+        raise ValueError('Unknown activity level: %s' % e.args[0])
+    return codes[inverse].reshape(actLevel.shape)
@@ -0,0 +1,127 @@
+'''
+registry.py
+The modes of transit, declared as data. Each mode has a speed, an activity
+level (for calorie burn), a cost model, and emissions, so adding a mode
+(an e-bike, transit, a scooter) means registering it here rather than
+writing a new class and editing every place that lists the modes:
+    registry.registerMode(registry.ModeSpec('ebike', 'E-bike', mph=15.5,
+        actLevel='light', spend=150.0, spendMiles=1500.0,
+        costPerMile=0.005, CO2PerMile=0.02, color='orange'))
+
+The driver, biker, and walker are registered when this module is loaded,
+with the defaults used by the Driver, Biker, and Walker classes in the
+modes module. getTables turns any list of registered modes into arrays
+with one entry per mode, so engine can work out every mode in one array
+operation. This module doesn't import any of the others, so all of them
+can use it.
+'''
+import numpy as np
+
+# Activity multipliers for the Harris–Benedict equation (see Person.getCal)
+ACT_MULT = {'no':1.2, 'light':1.375, 'moderate':1.55, 'heavy':1.725}
+
+
+class ModeSpec:
+    ''' The data describing one mode of transit:
+        name        - name used in code and results (e.g. 'biker')
+        label       - name shown under its bar in the GUI (e.g. 'Bike')
+        mph         - average speed (miles/hour)
+        actLevel    - activity level while travelling (a key of ACT_MULT)
+        costPerMile - cost that is paid per mile ($/mile), e.g. a fare
+        spend       - money spent every spendMiles miles ($), e.g. on
+                      parts or shoes; spend/spendMiles is added to the cost
+        CO2PerMile  - CO2 emitted (lbs/mile)
+        usesCar     - if True, the cost and CO2 of the driver's car
+                      category are added to costPerMile and CO2PerMile
+        color       - color of its bar in the GUI
+    '''
+
+    def __init__(self, name, label, mph, actLevel, costPerMile=0.0,
+                 spend=0.0, spendMiles=1.0, CO2PerMile=0.0, usesCar=False,
+                 color='grey'):
+        if actLevel not in ACT_MULT:
+            raise ValueError('Unknown activity level: %s' % actLevel)
+        if mph <= 0 or spendMiles <= 0:
+            raise ValueError('mph and spendMiles must be more than 0')
+        self.name = name
+        self.label = label
+        self.mph = float(mph)
+        self.actLevel = actLevel
+        self.costPerMile = float(costPerMile)
+        self.spend = float(spend)
+        self.spendMiles = float(spendMiles)
+        self.CO2PerMile = float(CO2PerMile)
+        self.usesCar = bool(usesCar)
+        self.color = color
+
+    def getCost(self):
+        ''' Returns the cost ($/mile) of the mode, leaving out the car.'''
+        return self.costPerMile + self.spend/self.spendMiles
+
+
+# The registered modes, in the order they were registered ({name: ModeSpec})
+_modes = {}
+# Arrays made by getTables ({names: tables}), emptied when modes change
+_tables = {}
+
+
+def registerMode(spec, replace=False):
+    ''' Adds a mode (a ModeSpec). Raises ValueError if a mode with the same
+    name is registered, unless replace is True.'''
+    if spec.name in _modes and not replace:
+        raise ValueError('Mode already registered: %s' % spec.name)
+    _modes[spec.name] = spec
+    _tables.clear()
+
+
+def unregisterMode(name):
+    ''' Removes a mode. Raises KeyError if it isn't registered.'''
+    del _modes[name]
+    _tables.clear()
+
+
+def getMode(name):
+    ''' Returns the ModeSpec of a mode. Raises KeyError if it isn't
+    registered.'''
+    return _modes[name]
+
+
+def getNames():
+    ''' Returns the names of the registered modes, in order.'''
+    return tuple(_modes)
+
+
+def getTables(names=None):
+    ''' Returns arrays describing the modes called names (default: all of
+    them), with one entry per mode, in order:
+        mph, actMult, perMile ($/mile, leaving out the car),
+        CO2PerMile (lbs/mile, leaving out the car), usesCar (booleans)
+    The arrays are made once and shared, so they must not be changed.'''
+    names = getNames() if names is None else tuple(names)
+    if names not in _tables:
+        specs = [getMode(n) for n in names]
+        tables = {'mph':np.array([s.mph for s in specs]),
+                  'actMult':np.array([ACT_MULT[s.actLevel] for s in specs]),
+                  'perMile':np.array([s.getCost() for s in specs]),
+                  'CO2PerMile':np.array([s.CO2PerMile for s in specs]),
+                  'usesCar':np.array([s.usesCar for s in specs], dtype=bool)}
+        for table in tables.values():
+            table.flags.writeable = False
+        _tables[names] = tables
+    return _tables[names]
+
+
+# The built-in modes. The Driver, Biker, and Walker classes take their
+# defaults from these.
+# Avg speed MN (infinitemonkeycorps.net). The car's cost and CO2 come from
+# its category (Driver.catDict).
+registerMode(ModeSpec('driver', 'Drive', 29.4, 'no', usesCar=True,
+                      color='cyan'))
+# Avg speed in city (Livestrong). $100/year on maintenance and parts over
+# 1500 miles biked a year (http://www.vtpi.org/tca/tca0501.pdf)
+registerMode(ModeSpec('biker', 'Bike', 11.5, 'moderate', spend=100.0,
+                      spendMiles=1500.0, color='yellow'))
+# Avg speed (the-fitness-walking-guide.com/). A $37.50 pair of shoes lasts
+# 1000 miles (http://www.vtpi.org/tca/tca0501.pdf)
+registerMode(ModeSpec('walker', 'Walk', 3.25, 'light', spend=37.5,
+                      spendMiles=1000.0, color='magenta'))
@@ -0,0 +1,278 @@
+'''
+report.py
+Renders static PNG or SVG commute reports (the four panels of the RunSim
+window: time, cost, calories, and CO2) for a CSV of scenarios, one report
+per row, without opening a window. For example:
+    >> python3 report.py people.csv reports/ --format png
+
+The CSV needs a header row with any of these columns (missing ones use the
+RunSim defaults):
+    name       - name of the report file (default: report<row number>)
+    dist       - miles per trip
+    trips      - number of trips
+    cat        - car category from Driver.catDict
+    bikeSpend  - $/year on bike parts, or a spending bracket like '$50-100'
+    shoeSpend  - $ on a pair of shoes, or a spending bracket
+    sex        - M or F
+
+Each worker process builds one figure on the Agg backend and reuses it (and
+its bars and text) for every report, rather than building a new RunSim per
+person. For PNGs, everything that doesn't change between reports is drawn
+once and cached, and each report only draws the bars and text over it (the
+same blitting RunSim uses while a slider is dragged). The CSV is read and
+handed to the workers in chunks, so memory use stays flat however many
+reports there are.
+'''
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import engine
+import graphMain
+
+# The units shown on each panel, as in RunSim's unit RadioButtons
+UNITS = {'time':('Hours', 'Minutes', 'Audiobooks'),
+         'cost':('Dollars', 'Coffees'),
+         'cal':('Cal (total)', 'Cal (/hour)'),
+         'CO2':('CO2 (lbs)', 'CO2 (trees)')}
+DEFAULT_UNITS = ('Hours', 'Dollars', 'Cal (total)', 'CO2 (lbs)')
+
+FORMATS = ('png', 'svg')
+
+
+class Report(graphMain.RunSim):
+    ''' A figure with the four panels of RunSim, drawn off screen. Only the
+    graphs are built (no widgets), using RunSim's initModel and initGraphs,
+    and each call to render updates them with RunSim's makeGraph and
+    showInfo.'''
+
+    def __init__(self, fmt='png', units=DEFAULT_UNITS, dpi=80):
+        ''' fmt is 'png' or 'svg', units are the units of the time, cost,
+        calorie, and CO2 panels (see UNITS), dpi the resolution of PNGs.'''
+        if fmt not in FORMATS:
+            raise ValueError('Unknown format: %s' % fmt)
+        for panel, unit in zip(UNITS, units):
+            if unit not in UNITS[panel]:
+                raise ValueError('Unknown %s unit: %s' % (panel, unit))
+        graphMain.loadPlotting()
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fmt = fmt
+        self.units = tuple(units)
+        self.recorder = None
+        self.initModel()
+
+        # Not made with pyplot, so nothing keeps hold of the figure
+        self.fig = Figure(figsize=(4.5, 8), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax1 = self.fig.add_subplot(411)
+        self.ax2 = self.fig.add_subplot(412)
+        self.ax3 = self.fig.add_subplot(413)
+        self.ax4 = self.fig.add_subplot(414)
+        self.fig.subplots_adjust(left=.18, right=.95, bottom=.03, top=.93,
+                    hspace=.25)
+        self.initGraphs()
+
+        # The values are written above the bars, so the y axis doesn't need
+        # numbers. Without them the axes look the same in every report.
+        for ax in (self.ax1, self.ax2, self.ax3):
+            ax.set_yticks([])
+            ax.yaxis.labelpad = 12
+            n = len(self.modeObjs)
+            ax.set_xlim(-.6, n - .4)    # Room for the labels of the end bars
+            ax.set_xticks(range(n), [t.get_text()   # Under each bar
+                          for t in ax.get_xticklabels()])
+        self.title = self.fig.text(.5, .97, '', ha='center', va='center',
+                    fontsize=13, animated=True)
+        self.animated.append(self.title)
+        # The xkcd style strokes text with a white outline, which makes it
+        # be drawn as paths. Plain text is drawn from a glyph cache, much
+        # faster, and the changing text is most of what a report draws.
+        for artist in self.animated:
+            if hasattr(artist, 'get_text'):
+                artist.set_path_effects([])
+
+        # Everything but the animated artists, cached per choice of units
+        self.background = None
+        if fmt != 'png':
+            # Vector output can't be blitted, and savefig leaves out
+            # animated artists, so everything is drawn every time
+            for artist in self.animated:
+                artist.set_animated(False)
+
+    def getUnits(self):
+        ''' Returns the units of the time, cost, calorie, and CO2 panels.'''
+        return self.units
+
+    def redraw(self, full=False):
+        ''' Nothing is drawn until the report is saved (see render).'''
+
+    def setScenario(self, scenario):
+        ''' Sets the distance, trips, car category, spending, and sex from a
+        dictionary of them (see the columns at the top of this module).'''
+        self.dist = float(scenario.get('dist') or 1)
+        self.trips = float(scenario.get('trips') or 1)
+        self.d.setCat(scenario.get('cat') or 'average')
+        self.b.setSpend(getSpend(scenario.get('bikeSpend'), 100.0))
+        self.w.setSpend(getSpend(scenario.get('shoeSpend'), 37.5))
+        sex = (scenario.get('sex') or 'M').strip().upper()
+        engine.isMale(sex)
+        for m in self.modeObjs:
+            m.person.setSex(sex, True)
+
+    def render(self, scenario, path, title=''):
+        ''' Updates the graphs for a scenario and writes the report to path.'''
+        self.setScenario(scenario)
+        self.title.set_text(title)
+        # Start the y limits afresh, so a report doesn't depend on the
+        # ones rendered before it
+        for ax in (self.ax1, self.ax2, self.ax3):
+            ax.set_ylim(0, 1)
+        self.updateGraph()
+
+        if self.fmt != 'png':
+            self.fig.savefig(path, format=self.fmt)
+            return
+        if self.background is None:
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            self.canvas.restore_region(self.background)
+        for artist in self.animated:
+            self.fig.draw_artist(artist)
+        writePNG(path, np.asarray(self.canvas.buffer_rgba()), self.fig.dpi)
+
+
+def writePNG(path, rgba, dpi):
+    ''' Writes an RGBA image array to a PNG file (without the alpha,
+    since the figure is opaque).'''
+    from PIL import Image
+    image = Image.fromarray(rgba[..., :3])
+    image.save(path, 'png', dpi=(dpi, dpi), compress_level=1)
+
+
+def getSpend(value, default):
+    ''' Returns dollars from a number or a spending bracket label (like
+    '$50-100', see engine.SPEND_BRACKETS), or default if value is blank.'''
+    if value is None or str(value).strip() == '':
+        return default
+    value = str(value).strip()
+    if value in engine.SPEND_BRACKETS:
+        return engine.SPEND_BRACKETS[value]
+    return float(value)
+
+
+def getFileName(name):
+    ''' Returns name made safe to use as a file name.'''
+    return re.sub(r'[^\w.-]', '_', name.strip()) or 'report'
+
+
+def readScenarios(lines, chunkSize):
+    ''' Reads a CSV of scenarios from an iterable of lines and yields
+    lists of (name, scenario dictionary), chunkSize rows at a time.'''
+    chunk = []
+    for i, row in enumerate(csv.DictReader(lines)):
+        row = {k.strip():v for k, v in row.items() if k}
+        name = row.get('name') or 'report%06d' % i
+        chunk.append((name, row))
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Set in each worker process by initWorker
+_report = None
+
+def initWorker(fmt, units, dpi):
+    ''' Runs once in every worker process, to build its reused figure.'''
+    global _report
+    _report = Report(fmt, units, dpi)
+
+
+def renderChunk(outDir, chunk):
+    ''' Renders a chunk of (name, scenario) into outDir. Returns how many
+    reports were written.'''
+    for name, scenario in chunk:
+        path = os.path.join(outDir, '%s.%s' % (getFileName(name), _report.fmt))
+        _report.render(scenario, path, name)
+    return len(chunk)
+
+
+def runReports(lines, outDir, fmt='png', units=DEFAULT_UNITS, dpi=80,
+               workers=None, chunkSize=100, quiet=False):
+    ''' Renders a report into outDir for every scenario in a CSV (read from
+    an iterable of lines), using a pool of workers processes (default: one
+    per core). Only a few chunks per worker are read ahead of the ones
+    being rendered. Returns the number of reports written.'''
+    os.makedirs(outDir, exist_ok=True)
+    start = time.perf_counter()
+    nDone = 0
+
+    def finished(count):
+        if not quiet:
+            print('\r%d reports' % count, end='', file=sys.stderr)
+
+    if workers == 1:
+        initWorker(fmt, units, dpi)
+        for chunk in readScenarios(lines, chunkSize):
+            nDone += renderChunk(outDir, chunk)
+            finished(nDone)
+    else:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(workers, initializer=initWorker,
+                    initargs=(fmt, units, dpi)) as pool:
+            pending = set()
+            for chunk in readScenarios(lines, chunkSize):
+                if len(pending) >= 2*workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    nDone += sum(f.result() for f in done)
+                    finished(nDone)
+                pending.add(pool.submit(renderChunk, outDir, chunk))
+            for future in pending:
+                nDone += future.result()
+            finished(nDone)
+
+    if not quiet:
+        seconds = time.perf_counter() - start
+        print('\n%d reports in %.2f s (%.0f reports/s)' % (nDone, seconds,
+                    nDone / seconds if seconds else 0), file=sys.stderr)
+    return nDone
+
+
+def main(argv=None):
+    ''' Parses the command line and renders the reports.'''
+    parser = argparse.ArgumentParser(description='Render a time, cost, '
+                'calorie, and CO2 report for every scenario in a CSV.')
+    parser.add_argument('scenarios', help="CSV of scenarios ('-' for stdin)")
+    parser.add_argument('outDir', help='directory for the reports')
+    parser.add_argument('--format', choices=FORMATS, default='png')
+    parser.add_argument('--dpi', type=int, default=80,
+                help='resolution of PNG reports (default: 80)')
+    for panel, default in zip(UNITS, DEFAULT_UNITS):
+        parser.add_argument('--%s-unit' % panel.lower(), choices=UNITS[panel],
+                    default=default, help='units of the %s panel' % panel)
+    parser.add_argument('--workers', type=int, default=None,
+                help='worker processes (default: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=100,
+                help='reports per task handed to a worker (default: 100)')
+    args = parser.parse_args(argv)
+
+    units = (args.time_unit, args.cost_unit, args.cal_unit, args.co2_unit)
+    lines = sys.stdin if args.scenarios == '-' else open(args.scenarios,
+                newline='')
+    try:
+        runReports(lines, args.outDir, args.format, units, args.dpi,
+                   args.workers, args.chunk_size)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+if __name__ == "__main__":
+    main()
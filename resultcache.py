@@ -0,0 +1,373 @@
+'''
+resultcache.py
+A results cache kept on disk, so jobs that are run again and again (e.g.
+every night) over mostly the same scenarios don't work them out again. For
+example:
+    >> python3 resultcache.py scenarios.csv --cache results.db -o results.csv
+    >> python3 service.py --cache-dir /var/cache/bike-walk-drive
+
+Scenarios are the ones of service.py (dist, trips, cat, bikeSpend,
+shoeSpend, sex), normalized the same way. Each result is stored under a hash
+of its normalized scenario and of the reference data it was worked out with
+(the car categories of Driver.catDict, the registered modes, the
+Harris–Benedict numbers, and the unit conversions of the units module, like
+12.59/2.60/911), so when any of those change the old results are simply
+never found again, and are evicted in time.
+
+The cache is a SQLite database in WAL mode, so any number of processes can
+read it while one writes, and writers wait their turn (up to timeout
+seconds). Its size is bounded: when the stored results grow past maxBytes,
+the least recently used ones are deleted. Lookups and stores are done a
+batch of scenarios at a time. Lookups only read, so they never wait for the
+write lock: the times results were last used are noted in memory (to within
+TOUCH_AGE seconds) and written with the next store (or once TOUCH_LIMIT are
+noted, or on close). Results are stored as packed float64s (see Packer).
+'''
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import struct
+import sys
+import time
+import engine
+import registry
+import service
+import units
+from modes import Driver
+
+# Scenarios looked up or stored in one SQL statement (SQLite allows 999
+# parameters in older versions)
+SQL_CHUNK = 500
+
+# When full, results are evicted until the cache is this fraction of maxBytes
+EVICT_TO = 0.9
+
+# Hits kept before their last-used times are written without waiting for a put
+TOUCH_LIMIT = 10000
+
+# A hit only changes the last-used time of a result that is older than this
+# (seconds), so results that are hit again and again aren't rewritten each time
+TOUCH_AGE = 60.0
+
+
+def getDataVersion():
+    ''' Returns a hash of the reference data used to work out results, so a
+    change to any of it gives every scenario a new key.'''
+    modes = [vars(registry.getMode(m)) for m in registry.getNames()]
+    data = {'catDict':Driver().catDict, 'modes':modes,
+            'LBS_CO2_PER_GAL':Driver.LBS_CO2_PER_GAL,
+            'ACT_MULT':engine.ACT_MULT, 'BMR_COEF':engine.BMR_COEF,
+            'SEX_DEFAULTS':engine.SEX_DEFAULTS,
+            'units':{name:units.getUnit(name).describe()
+                     for name in units.getNames()}}
+    text = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class Packer:
+    ''' Packs result dictionaries with the same names and shapes as
+    example (numbers, or lists of numbers) into float64 bytes and back,
+    which is several times faster to read back than JSON.'''
+
+    def __init__(self, example):
+        self.layout = []    # (name, start, end), end is None for numbers
+        n = 0
+        for name, value in example.items():
+            if isinstance(value, list):
+                self.layout.append((name, n, n + len(value)))
+                n += len(value)
+            else:
+                self.layout.append((name, n, None))
+                n += 1
+        self.struct = struct.Struct('<%dd' % n)
+
+    def describe(self):
+        ''' Returns the layout as text, to tell packers apart.'''
+        return repr(self.layout)
+
+    def pack(self, result):
+        values = []
+        for name, start, end in self.layout:
+            if name not in result:
+                raise ValueError('Result does not match the layout: %s' % name)
+            value = result[name]
+            if (end is None) == isinstance(value, list) or (end is not None
+                        and len(value) != end - start):
+                raise ValueError('Result does not match the layout: %s' % name)
+            if end is None:
+                values.append(value)
+            else:
+                values.extend(value)
+        if len(result) != len(self.layout):
+            raise ValueError('Result does not match the layout')
+        return self.struct.pack(*values)
+
+    def unpack(self, data):
+        values = self.struct.unpack(data)
+        return {name:values[start] if end is None else list(values[start:end])
+                for name, start, end in self.layout}
+
+
+def hashKey(key, version):
+    ''' Returns the database key of a normalized scenario (see
+    service.normalize) for a version of the reference data.'''
+    text = version + repr(key)
+    return hashlib.sha256(text.encode()).digest()[:16]
+
+
+class ResultCache:
+    ''' The results of scenarios, stored in a SQLite file at path and
+    limited to about maxBytes of results. Each process (and thread) should
+    use its own ResultCache; they can all share the same file.'''
+
+    def __init__(self, path, maxBytes=256*1024*1024, timeout=30.0):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.version = getDataVersion()
+        # Results are stored packed as the service's results are laid out,
+        # and the layout is part of every key
+        self.packer = Packer(service.calculateKeys([service.normalize({})])[0])
+        self.prefix = self.version + self.packer.describe()
+        self.hits = 0
+        self.misses = 0
+        self.touched = {}   # {key: time} of hits not yet written (flushUsed)
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.transaction():
+            self.db.execute('CREATE TABLE IF NOT EXISTS results (key BLOB '
+                        'PRIMARY KEY, value BLOB, size INTEGER, used REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON '
+                        'results (used)')
+            # Total size of the results, kept up to date by put and evict
+            # so it doesn't have to be added up every time
+            self.db.execute('CREATE TABLE IF NOT EXISTS info (name TEXT '
+                        'PRIMARY KEY, value INTEGER)')
+            self.db.execute("INSERT OR IGNORE INTO info VALUES ('bytes', 0)")
+
+    def transaction(self):
+        ''' Returns a context manager for a write transaction. BEGIN
+        IMMEDIATE takes the write lock at the start, so two processes
+        can't both read the total size and then both change it.'''
+        return _Transaction(self.db)
+
+    def close(self):
+        if self.touched:
+            with self.transaction():
+                self.flushUsed()
+        self.db.close()
+
+    def get(self, keys):
+        ''' Returns a list with the result of each normalized scenario in
+        keys, or None where it isn't cached. The results found are marked
+        as recently used (in memory, see flushUsed, and only if they weren't
+        in the last TOUCH_AGE seconds), so this only reads.'''
+        hashed = [hashKey(k, self.prefix) for k in keys]
+        found = {}
+        now = time.time()
+        for i in range(0, len(hashed), SQL_CHUNK):
+            chunk = hashed[i:i+SQL_CHUNK]
+            for h, value, used in self.db.execute('SELECT key, value, used '
+                        'FROM results WHERE key IN (%s)' % ','.join(
+                        '?'*len(chunk)), chunk):
+                found[h] = value
+                if now - used > TOUCH_AGE:
+                    self.touched[h] = now
+        if len(self.touched) >= TOUCH_LIMIT:
+            with self.transaction():
+                self.flushUsed()
+        results = [found.get(h) for h in hashed]
+        self.hits += len(keys) - results.count(None)
+        self.misses += results.count(None)
+        return [None if r is None else self.packer.unpack(r) for r in results]
+
+    def put(self, keys, results):
+        ''' Stores the results of normalized scenarios, then evicts the
+        least recently used results if the cache is too big.'''
+        now = time.time()
+        rows = {}
+        for k, r in zip(keys, results):
+            value = self.packer.pack(r)
+            rows[hashKey(k, self.prefix)] = (value, len(value))
+        with self.transaction():
+            # So the least recently used are known before evicting
+            self.flushUsed()
+            # Results replaced by these no longer count towards the size
+            old = 0
+            hashed = list(rows)
+            for i in range(0, len(hashed), SQL_CHUNK):
+                chunk = hashed[i:i+SQL_CHUNK]
+                old += self.db.execute('SELECT TOTAL(size) FROM results WHERE '
+                            'key IN (%s)' % ','.join('?'*len(chunk)),
+                            chunk).fetchone()[0]
+            self.db.executemany('INSERT OR REPLACE INTO results VALUES '
+                        '(?, ?, ?, ?)', [(h, v, s, now)
+                        for h, (v, s) in rows.items()])
+            size = self.addBytes(sum(s for v, s in rows.values()) - int(old))
+            if size > self.maxBytes:
+                self.evict(size - int(EVICT_TO * self.maxBytes))
+
+    def flushUsed(self):
+        ''' Writes the times of the hits since the last flush. Must be
+        called inside a transaction.'''
+        if self.touched:
+            self.db.executemany('UPDATE results SET used = ? WHERE key = ?',
+                        [(t, h) for h, t in self.touched.items()])
+            self.touched = {}
+
+    def addBytes(self, change):
+        ''' Changes the total size of the results, and returns it.'''
+        self.db.execute("UPDATE info SET value = value + ? WHERE name = "
+                    "'bytes'", (change,))
+        return self.getBytes()
+
+    def getBytes(self):
+        return self.db.execute("SELECT value FROM info WHERE name = "
+                    "'bytes'").fetchone()[0]
+
+    def evict(self, nBytes):
+        ''' Deletes the least recently used results until at least nBytes
+        have been freed. Must be called inside a transaction.'''
+        freed = 0
+        keys = []
+        for key, size in self.db.execute('SELECT key, size FROM results '
+                    'ORDER BY used'):
+            if freed >= nBytes:
+                break
+            keys.append((key,))
+            freed += size
+        self.db.executemany('DELETE FROM results WHERE key = ?', keys)
+        self.addBytes(-freed)
+
+    def clear(self):
+        ''' Deletes every result.'''
+        with self.transaction():
+            self.db.execute('DELETE FROM results')
+            self.db.execute("UPDATE info SET value = 0 WHERE name = 'bytes'")
+        self.touched = {}
+
+    def getStats(self):
+        ''' Returns the size and hit counts of the cache (the hits and
+        misses of this ResultCache only).'''
+        lookups = self.hits + self.misses
+        count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return {'path':self.path, 'size':count, 'bytes':self.getBytes(),
+                'maxBytes':self.maxBytes, 'version':self.version,
+                'hits':self.hits, 'misses':self.misses,
+                'hitRate':self.hits / lookups if lookups else 0.0}
+
+
+class _Transaction:
+    ''' A write transaction on a SQLite connection (see
+    ResultCache.transaction).'''
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, excType, exc, tb):
+        self.db.execute('COMMIT' if excType is None else 'ROLLBACK')
+
+
+def calculateScenarios(scenarios, cache=None):
+    ''' Returns the results of a list of scenarios (dictionaries of
+    parameters, see service.DEFAULTS), like service.Service.calculate.
+    Results in the cache (a ResultCache, if given) are not worked out
+    again, and the ones worked out are added to it.'''
+    keys = [service.normalize(s) for s in scenarios]
+    results = cache.get(keys) if cache is not None else [None]*len(keys)
+    missing = {}    # {key: indexes of results}, so repeats are done once
+    for i, r in enumerate(results):
+        if r is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        calculated = service.calculateKeys(list(missing))
+        if cache is not None:
+            cache.put(list(missing), calculated)
+        for key, result in zip(missing, calculated):
+            for i in missing[key]:
+                results[i] = result
+    return results
+
+
+def readScenarios(lines, chunkSize=10000):
+    ''' Reads a CSV of scenarios (a header row naming any of the parameters
+    of service.DEFAULTS, and optionally 'name') from an iterable of lines,
+    and yields lists of (name, scenario dictionary), chunkSize at a time.
+    Empty values are left out, so the defaults are used for them.'''
+    chunk = []
+    for i, row in enumerate(csv.DictReader(lines)):
+        row = {k.strip():v.strip() for k, v in row.items() if k and v}
+        name = row.pop('name', None) or str(i)
+        chunk.append((name, row))
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def getHeader(modes=engine.MODES):
+    ''' Returns the header row of the output CSV.'''
+    header = ['name'] + list(service.DEFAULTS)
+    for name in ('time', 'cost', 'cal', 'CO2-mode'):
+        header.extend('%s[%s]' % (name, m) for m in modes)
+    return header + ['CO2', 'CO2-tree']
+
+
+def main(argv=None):
+    ''' Parses the command line, then works out the results of a CSV of
+    scenarios using the cache, or shows or clears the cache.'''
+    parser = argparse.ArgumentParser(description='Work out the results of a '
+                'CSV of scenarios, keeping them in a cache on disk.')
+    parser.add_argument('scenarios', nargs='?', help='CSV of scenarios')
+    parser.add_argument('--cache', default='results.db',
+                help='cache file (default: results.db)')
+    parser.add_argument('--max-mb', type=float, default=256,
+                help='size limit of the cache in MB (default: 256)')
+    parser.add_argument('-o', '--output', help='CSV file for the results '
+                '(default: stdout)')
+    parser.add_argument('--stats', action='store_true',
+                help='print the cache statistics')
+    parser.add_argument('--clear', action='store_true',
+                help='delete every result in the cache')
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.cache, int(args.max_mb * 1024 * 1024))
+    try:
+        if args.clear:
+            cache.clear()
+        if args.scenarios:
+            start = time.perf_counter()
+            out = sys.stdout if args.output is None else open(args.output,
+                        'w', newline='')
+            try:
+                writer = csv.writer(out)
+                writer.writerow(getHeader())
+                with open(args.scenarios, newline='') as f:
+                    for chunk in readScenarios(f):
+                        results = calculateScenarios([s for n, s in chunk],
+                                    cache)
+                        for (name, s), r in zip(chunk, results):
+                            key = service.normalize(s)
+                            writer.writerow([name] + list(key) + ['%.6g' % v
+                                for k in ('time', 'cost', 'cal', 'CO2-mode')
+                                for v in r[k]] + ['%.6g' % r['CO2'],
+                                '%.6g' % r['CO2-tree']])
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            print('%d scenarios in %.2f s' % (cache.hits + cache.misses,
+                  time.perf_counter() - start), file=sys.stderr)
+        if args.stats or args.scenarios:
+            print(json.dumps(cache.getStats(), indent=2), file=sys.stderr)
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
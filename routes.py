@@ -0,0 +1,234 @@
+'''
+routes.py
+Works out the time, cost, calorie burn, and CO2 figures for recorded routes
+instead of a distance picked on the slider. Routes are read from GPX files
+(each <trk> or <rte> is a trip) or CSV track files with a header row and
+these columns (others, like time or elevation, are ignored):
+    trip       - anything identifying the trip the point belongs to
+    lat, lon   - position in degrees (latitude/longitude also work)
+The points of a trip must be in order and next to each other. For example:
+    >> python3 routes.py rides.gpx commutes.csv -o trips.csv --cat minivan
+
+Files are parsed incrementally (GPX with iterparse, clearing elements once
+read), and the points are handed on in chunks of a fixed size. The length of
+every step is worked out for a whole chunk at once with the haversine
+formula and added up per trip, so memory use depends on the chunk size and
+the number of trips, not on the size of the files. The trip lengths are then
+passed to engine.calculateBatch.
+'''
+import argparse
+import csv
+import os
+import sys
+import xml.etree.ElementTree as ET
+import numpy as np
+import engine
+import triplog
+
+EARTH_RADIUS = 3958.8   # Mean radius of the earth (miles)
+
+# Names accepted for the columns of CSV track files
+LAT_COLUMNS = ('lat', 'latitude')
+LON_COLUMNS = ('lon', 'lng', 'long', 'longitude')
+
+# Per-mode values written for each trip (one column per mode)
+PER_MODE = ('time', 'cost', 'cal', 'time-mins', 'time-audio', 'cost-coffee')
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    ''' Returns the great-circle distance (miles) between points given in
+    degrees. Works element-wise on arrays.'''
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1)/2)**2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class TrackTotals:
+    ''' Adds up the length and number of points of every trip, from points
+    added a chunk at a time. The last point of each chunk is kept, so steps
+    that cross from one chunk to the next are counted too.'''
+
+    def __init__(self):
+        self.totals = triplog.GroupTotals(('miles', 'points'))
+        self.last = None    # (trip, lat, lon) of the last point added
+
+    def add(self, trips, lat, lon):
+        ''' Adds a chunk of points: arrays of their trips and positions.'''
+        trips = np.asarray(trips)
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        if not len(trips):
+            return
+        points = np.ones(len(trips))
+        if self.last is not None:
+            trips = np.concatenate([[self.last[0]], trips])
+            lat = np.concatenate([[self.last[1]], lat])
+            lon = np.concatenate([[self.last[2]], lon])
+            points = np.concatenate([[0.0], points])
+        # Each step counts towards the trip of the point it ends at, as
+        # long as it starts at a point of the same trip
+        miles = np.zeros(len(trips))
+        miles[1:] = np.where(trips[1:] == trips[:-1],
+                    haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]), 0.0)
+        self.totals.add(trips, {'miles':miles, 'points':points})
+        self.last = (trips[-1], lat[-1], lon[-1])
+
+    def items(self):
+        ''' Yields (trip, miles, number of points) for every trip.'''
+        for trip, totals in self.totals.items():
+            yield trip, totals['miles'], int(totals['points'])
+
+
+def readGPX(f, chunkSize=100000, names=None):
+    ''' Reads a GPX file (a path or file object) and yields chunks of its
+    points as (trip numbers, lats, lons). Trips are numbered from 0 in the
+    order they appear. If a dictionary is given as names, the names of the
+    tracks and routes that have one are put in it ({trip number: name}).'''
+    trips, lats, lons = [], [], []
+    trip = -1
+    inTrip = inPoint = False
+    root = None
+    for event, elem in ET.iterparse(f, ('start', 'end')):
+        tag = elem.tag.rpartition('}')[2]
+        if event == 'start':
+            if root is None:
+                root = elem
+            if tag in ('trk', 'rte'):
+                trip += 1
+                inTrip = True
+            elif tag in ('trkpt', 'rtept'):
+                inPoint = True
+            continue
+
+        if tag in ('trkpt', 'rtept'):
+            trips.append(trip)
+            lats.append(elem.get('lat'))
+            lons.append(elem.get('lon'))
+            inPoint = False
+            elem.clear()
+            if len(trips) >= chunkSize:
+                yield (np.array(trips), np.array(lats, dtype=float),
+                       np.array(lons, dtype=float))
+                trips, lats, lons = [], [], []
+        elif tag == 'name' and inTrip and not inPoint and names is not None:
+            names[trip] = (elem.text or '').strip()
+        elif tag in ('trk', 'rte'):
+            inTrip = False
+            # Drop what has been read so far, so the tree doesn't grow
+            root.clear()
+    if trips:
+        yield (np.array(trips), np.array(lats, dtype=float),
+               np.array(lons, dtype=float))
+
+
+def readCSV(lines, chunkSize=100000):
+    ''' Reads a CSV track file from an iterable of lines and yields chunks
+    of its points as (trips, lats, lons).'''
+    reader = csv.reader(lines)
+    header = [h.strip().lower() for h in next(reader)]
+    columns = []
+    for names in (('trip',), LAT_COLUMNS, LON_COLUMNS):
+        found = [header.index(n) for n in names if n in header]
+        if not found:
+            raise ValueError('Track file has no %s column' % names[0])
+        columns.append(found[0])
+    chunk = []
+    for row in reader:
+        if row:
+            chunk.append(row)
+        if len(chunk) >= chunkSize:
+            yield getColumns(chunk, columns)
+            chunk = []
+    if chunk:
+        yield getColumns(chunk, columns)
+
+
+def getColumns(rows, columns):
+    ''' Returns (trips, lats, lons) arrays from CSV rows.'''
+    trip, lat, lon = columns
+    return (np.array([r[trip] for r in rows]),
+            np.array([r[lat] for r in rows], dtype=float),
+            np.array([r[lon] for r in rows], dtype=float))
+
+
+def measureFile(path, chunkSize=100000):
+    ''' Reads a GPX or CSV track file and returns a list of (trip, miles,
+    number of points) for the trips in it. GPX trips are named by their
+    <name>, or by the file name and their number if they have none.'''
+    totals = TrackTotals()
+    names = {}
+    if path.lower().endswith('.gpx'):
+        for trips, lats, lons in readGPX(path, chunkSize, names):
+            totals.add(trips, lats, lons)
+        base = os.path.basename(path)
+        return [(names.get(t) or '%s:%d' % (base, t), miles, points)
+                for t, miles, points in sorted(totals.items())]
+    with open(path, newline='') as f:
+        for trips, lats, lons in readCSV(f, chunkSize):
+            totals.add(trips, lats, lons)
+    return list(totals.items())
+
+
+def evaluateRoutes(miles, trips=1, cat='average', bikeSpend=100.0,
+                   shoeSpend=37.5, sex='M'):
+    ''' Works out the results for routes of the given lengths (an array of
+    miles), each made trips times. Returns engine.calculateBatch's
+    dictionary of results.'''
+    return engine.calculateBatch(np.asarray(miles, dtype=float), trips, cat,
+                bikeSpend, shoeSpend, sex)
+
+
+def writeRoutes(out, path, routes, calc):
+    ''' Writes one CSV row per route (see measureFile) with its results.'''
+    writer = csv.writer(out)
+    for i, (trip, miles, points) in enumerate(routes):
+        row = [path, trip, points, '%.6g' % miles]
+        for name in PER_MODE:
+            row.extend('%.6g' % v for v in calc[name][i])
+        row.extend(['%.6g' % calc['CO2'][i], '%.6g' % calc['CO2-tree'][i]])
+        writer.writerow(row)
+
+
+def getHeader():
+    ''' Returns the header row of the output CSV.'''
+    header = ['file', 'trip', 'points', 'miles']
+    for name in PER_MODE:
+        header.extend('%s[%s]' % (name, m) for m in engine.MODES)
+    return header + ['CO2', 'CO2-tree']
+
+
+def main(argv=None):
+    ''' Parses the command line, measures the routes in every file, and
+    writes their results.'''
+    parser = argparse.ArgumentParser(description='Work out time, cost, '
+                'calories, and CO2 for the routes in GPX or CSV track files.')
+    parser.add_argument('files', nargs='+', help='GPX or CSV track files')
+    parser.add_argument('-o', '--output', help='CSV file for the results '
+                '(default: stdout)')
+    parser.add_argument('--trips', type=float, default=1,
+                help='times each route is made (default: 1)')
+    parser.add_argument('--cat', default='average', choices=engine.CATEGORIES,
+                help='car category')
+    parser.add_argument('--sex', choices=('M', 'F'), default='M')
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                help='points read and measured at a time (default: 100000)')
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output is None else open(args.output, 'w',
+                newline='')
+    try:
+        csv.writer(out).writerow(getHeader())
+        for path in args.files:
+            routes = measureFile(path, args.chunk_size)
+            if not routes:
+                continue
+            calc = evaluateRoutes([r[1] for r in routes], args.trips,
+                        args.cat, sex=args.sex)
+            writeRoutes(out, path, routes, calc)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
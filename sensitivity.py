@@ -0,0 +1,256 @@
+'''
+sensitivity.py
+Which inputs drive the results? For one scenario (distance, trips, car
+category, spending, sex), each of the model's parameters (the driver's
+yearly miles and spending on gas, maintenance, and tires, the biker's and
+walker's spending and miles, the speeds of the modes, and the person's
+weight, height, and age) is varied around its value in the modes module,
+and two measures are worked out for every calcDict value:
+    elasticity - one at a time: the % change of the value for a 1% change
+                 of the parameter (a central difference)
+    S1, ST     - variance-based (Sobol) indices: the share of the variance
+                 of the value caused by the parameter alone (S1), and by
+                 the parameter together with everything it interacts with
+                 (ST), when every parameter is drawn uniformly within
+                 +-range of its value
+For example:
+    >> python3 sensitivity.py --samples 200000 --dist 5 --trips 10 --range 0.2
+
+The Sobol indices use Saltelli's sampling (two random matrices, plus one
+per parameter with that parameter's column swapped), with the estimators
+of Saltelli (2010) for S1 and Jansen for ST. Samples are worked out in
+chunks with engine.evaluate, a whole chunk at a time, by a pool of
+processes (one per core by default). Each chunk only sends back sums, so
+the number of samples doesn't change the memory used. Only base units are
+analysed: the other units (minutes, coffees, trees, ...) are the same
+values scaled, so their indices are the same.
+'''
+import argparse
+import csv
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import engine
+import registry
+from modes import Driver, Biker, Walker
+
+# The parameters analysed, and what they are
+PARAMETERS = {
+    'driverMiles':'miles driven in a year (Driver.miles)',
+    'gasSpend':'$/year on gas (catDict gas cost x miles)',
+    'maintSpend':'$/year on maintenance (catDict maint cost x miles)',
+    'tireSpend':'$/year on tires (catDict tire cost x miles)',
+    'bikeSpend':'$/year on bike parts (Biker.spend)',
+    'bikeMiles':'miles biked in a year (Biker.miles)',
+    'shoeSpend':'$ for a pair of shoes (Walker.spend)',
+    'shoeMiles':'miles a pair of shoes lasts (Walker.miles)',
+    'driverMPH':'driving speed (Driver.MPH)',
+    'bikerMPH':'biking speed (Biker.MPH)',
+    'walkerMPH':'walking speed (Walker.MPH)',
+    'weight':'weight in lbs (Person.weight)',
+    'height':'height in inches (Person.height)',
+    'age':'age in years (Person.age)',
+}
+
+# The values analysed, per-mode ones as e.g. 'time[driver]'
+OUTPUTS = tuple('%s[%s]' % (k, m) for k in ('time', 'cost', 'cal', 'cal-hour')
+                for m in engine.MODES) + ('CO2',)
+
+
+def getNominal(cat='average', bikeSpend=100.0, shoeSpend=37.5, sex='M'):
+    ''' Returns {parameter: value} for a scenario, from the Driver, Biker,
+    Walker, and Person classes.'''
+    d, b, w = Driver(), Biker(), Walker()
+    d.setCat(cat)
+    b.setSpend(bikeSpend)
+    w.setSpend(shoeSpend)
+    d.person.setSex(sex, True)
+    gas, maint, tire = d.catDict[cat][:3]
+    return {'driverMiles':d.miles, 'gasSpend':gas * d.miles,
+            'maintSpend':maint * d.miles, 'tireSpend':tire * d.miles,
+            'bikeSpend':b.spend, 'bikeMiles':b.miles, 'shoeSpend':w.spend,
+            'shoeMiles':w.miles, 'driverMPH':d.getMPH(),
+            'bikerMPH':b.getMPH(), 'walkerMPH':w.getMPH(),
+            'weight':d.person.weight, 'height':d.person.height,
+            'age':d.person.age}
+
+
+def evaluateParameters(values, miles, male, CO2PerMile):
+    ''' Works out the results for arrays of parameters (a dictionary with
+    an array of n values for every name in PARAMETERS). Returns an array
+    with one row per sample and one column per name in OUTPUTS.'''
+    mph = np.column_stack([values['driverMPH'], values['bikerMPH'],
+                           values['walkerMPH']])
+    # The driver's costs as Driver.update works them out from yearly spending
+    perMile = np.column_stack([(values['gasSpend'] + values['maintSpend']
+                                + values['tireSpend']) / values['driverMiles'],
+                               values['bikeSpend'] / values['bikeMiles'],
+                               values['shoeSpend'] / values['shoeMiles']])
+    BMR = engine.getBMR(male, values['weight'], values['height'],
+                values['age'])
+    actMult = registry.getTables(engine.MODES)['actMult']
+    calHour = BMR[:, None] * actMult / 24
+    calc = engine.evaluate(np.full(len(mph), float(miles)), mph, perMile,
+                calHour, CO2PerMile)
+    return np.column_stack([calc[k] for k in ('time', 'cost', 'cal',
+                            'cal-hour')] + [calc['CO2']])
+
+
+def getElasticities(nominal, miles, male, CO2PerMile, step=0.01):
+    ''' Returns an array (parameters x outputs) of the elasticity of every
+    output to every parameter: a central difference with each parameter
+    moved by +-step (relative) on its own, all worked out in one batch.
+    nan where the output is 0.'''
+    names = list(PARAMETERS)
+    n = 2*len(names) + 1
+    values = {p:np.full(n, float(nominal[p])) for p in names}
+    for i, p in enumerate(names):
+        values[p][2*i] *= 1 + step
+        values[p][2*i + 1] *= 1 - step
+    y = evaluateParameters(values, miles, male, CO2PerMile)
+    base = y[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (y[0:-1:2] - y[1:-1:2]) / (2*step*base)
+
+
+def getSobolSums(seed, n, nominal, spread, miles, male, CO2PerMile):
+    ''' Works out one chunk of n Saltelli samples, and returns the sums
+    the indices are estimated from (see combineSums).'''
+    rng = np.random.default_rng(seed)
+    names = list(PARAMETERS)
+    k = len(names)
+    center = np.array([nominal[p] for p in names])
+    A = center * (1 + spread * rng.uniform(-1, 1, (n, k)))
+    B = center * (1 + spread * rng.uniform(-1, 1, (n, k)))
+    # Rows: A, B, then A with column i taken from B, for every i
+    rows = np.concatenate([A, B] + [np.where(np.arange(k) == i, B, A)
+                                   for i in range(k)])
+    y = evaluateParameters(dict(zip(names, rows.T)), miles, male, CO2PerMile)
+    yA, yB = y[:n], y[n:2*n]
+    yAB = y[2*n:].reshape(k, n, -1)
+    # Sums about the nominal results, which keeps the variance accurate
+    # (and the S1 estimate less noisy, as yAB - yA averages out to 0)
+    shift = evaluateParameters({p:np.array([float(nominal[p])])
+                for p in names}, miles, male, CO2PerMile)[0]
+    both = np.concatenate([yA, yB]) - shift
+    return {'n':n, 'sum':both.sum(axis=0), 'sumSq':(both**2).sum(axis=0),
+            'first':((yB - shift) * (yAB - yA)).sum(axis=1),
+            'total':((yA - yAB)**2).sum(axis=1)}
+
+
+def combineSums(chunks):
+    ''' Adds up the sums of every chunk and returns (S1, ST), arrays of
+    parameters x outputs (nan where an output doesn't vary).'''
+    n = sum(c['n'] for c in chunks)
+    if n < 1:
+        raise ValueError('No samples to combine')
+    total = sum(c['sum'] for c in chunks)
+    sumSq = sum(c['sumSq'] for c in chunks)
+    variance = (sumSq - total**2 / (2*n)) / (2*n - 1)
+    first = sum(c['first'] for c in chunks) / n
+    totalEffect = sum(c['total'] for c in chunks) / (2*n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.where(variance > 0, first / variance, np.nan),
+                np.where(variance > 0, totalEffect / variance, np.nan))
+
+
+def _sobolChunk(args):
+    ''' Runs getSobolSums in a worker process.'''
+    return getSobolSums(*args)
+
+
+def runAnalysis(nSamples=100000, dist=1, trips=1, cat='average',
+                bikeSpend=100.0, shoeSpend=37.5, sex='M', spread=0.2,
+                step=0.01, chunkSize=20000, workers=None, seed=None):
+    ''' Works out the elasticities and Sobol indices of every output to
+    every parameter for a scenario. nSamples Saltelli samples are drawn (so
+    nSamples*(parameters + 2) evaluations), chunkSize at a time, by a pool
+    of workers processes (default: one per core). Returns {'nominal':,
+    'elasticity':, 'S1':, 'ST':}, each array being parameters x outputs.'''
+    if nSamples <= 0:
+        raise ValueError('nSamples must be more than 0')
+    if chunkSize <= 0:
+        raise ValueError('chunkSize must be more than 0')
+    nominal = getNominal(cat, bikeSpend, shoeSpend, sex)
+    male = engine.isMale(sex)
+    d = Driver()
+    d.setCat(cat)
+    CO2PerMile = d.getCO2()
+    miles = dist*trips
+
+    sizes = [min(chunkSize, nSamples - lo) for lo in range(0, nSamples,
+             chunkSize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, n, nominal, spread, miles, male, CO2PerMile)
+             for s, n in zip(seeds, sizes)]
+    if workers == 1:
+        chunks = [getSobolSums(*t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            chunks = list(pool.map(_sobolChunk, tasks))
+    S1, ST = combineSums(chunks)
+    return {'nominal':nominal,
+            'elasticity':getElasticities(nominal, miles, male, CO2PerMile,
+                        step),
+            'S1':S1, 'ST':ST}
+
+
+def main(argv=None):
+    ''' Parses the command line, runs the analysis, and prints the most
+    important parameters of every output.'''
+    parser = argparse.ArgumentParser(description='Sensitivity of time, '
+                'cost, calories, and CO2 to the model parameters.')
+    parser.add_argument('--samples', type=int, default=100000,
+                help='Saltelli samples (default: 100000)')
+    parser.add_argument('--dist', type=float, default=1, help='miles per trip')
+    parser.add_argument('--trips', type=float, default=1, help='trips')
+    parser.add_argument('--cat', default='average', choices=engine.CATEGORIES,
+                help='car category')
+    parser.add_argument('--bike-spend', type=float, default=100.0)
+    parser.add_argument('--shoe-spend', type=float, default=37.5)
+    parser.add_argument('--sex', default='M', choices=('M', 'F'))
+    parser.add_argument('--range', type=float, default=0.2,
+                help='parameters are drawn within +-range of their value '
+                '(default: 0.2)')
+    parser.add_argument('--workers', type=int, default=None,
+                help='processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-o', '--output', help='CSV file for every index')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = runAnalysis(args.samples, args.dist, args.trips, args.cat,
+                args.bike_spend, args.shoe_spend, args.sex, args.range,
+                workers=args.workers, seed=args.seed)
+    seconds = time.perf_counter() - start
+    print('%d evaluations in %.2f s' % (args.samples * (len(PARAMETERS) + 2),
+          seconds), file=sys.stderr)
+
+    names = list(PARAMETERS)
+    print('%-16s %-12s %11s %8s %8s' % ('output', 'parameter', 'elasticity',
+          'S1', 'ST'))
+    for j, output in enumerate(OUTPUTS):
+        ST = results['ST'][:, j]
+        if np.all(np.isnan(ST)):
+            print('%-16s (constant)' % output)
+            continue
+        # The three parameters with the largest total effect
+        for rank, i in enumerate(np.argsort(-np.nan_to_num(ST))[:3]):
+            print('%-16s %-12s %11.4g %8.3f %8.3f' % (output if not rank
+                  else '', names[i], results['elasticity'][i, j],
+                  results['S1'][i, j], ST[i]))
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['output', 'parameter', 'nominal', 'elasticity',
+                        'S1', 'ST'])
+            for j, output in enumerate(OUTPUTS):
+                for i, p in enumerate(names):
+                    writer.writerow([output, p, '%.6g' % results['nominal'][p]]
+                                + ['%.6g' % results[k][i, j]
+                                   for k in ('elasticity', 'S1', 'ST')])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+'''
+service.py
+A small HTTP/JSON service that serves the numbers from RunSim.calculate
+(time, cost, calories, and CO2 for driving, biking, and walking), for web
+front ends that can't use the matplotlib window. It only needs the standard
+library and numpy:
+    >> python3 service.py --port 8080
+
+Requests (scenario parameters are the settings of the RunSim window, all
+optional: dist, trips, cat, bikeSpend, shoeSpend, sex):
+    GET  /calculate?dist=5&trips=10&cat=minivan     one scenario
+    POST /calculate  {"dist": 5, "trips": 10}        one scenario
+    POST /calculate  {"scenarios": [{...}, ...]}     many scenarios at once
+    GET  /stats                                      cache statistics
+A scenario's result has the same keys as calcDict. The per-mode values
+are lists of [driver, biker, walker].
+
+Parameters are normalized into a hashable key, and results are kept in a
+bounded LRU cache, so repeated scenarios are not worked out again. The
+scenarios of a request that aren't cached are worked out together with
+engine.calculateBatch. With --cache-dir, results are also kept on disk (see
+resultcache.py), so they survive restarts and are shared by every service
+using the same directory. The disk cache, and large batches, are worked on
+by a worker thread rather than the event loop, so a slow disk or another
+process holding the cache's lock doesn't hold up every connection; if the
+lock isn't given up within --cache-timeout seconds, the request gets a 503.
+loadtest.py measures the latency and throughput.
+'''
+import argparse
+import asyncio
+import collections
+import json
+import math
+import os
+import sqlite3
+import sys
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import engine
+
+# The parameters of a scenario, in the order of the cache key, with defaults
+DEFAULTS = {'dist':1.0, 'trips':1.0, 'cat':'average', 'bikeSpend':100.0,
+            'shoeSpend':37.5, 'sex':'M'}
+
+# Numbers are rounded to this many decimals in the cache key, so the same
+# scenario written two ways (5 and 5.0000000001) is only worked out once
+KEY_DECIMALS = 9
+
+MAX_BODY = 16 * 1024 * 1024     # Largest request body accepted (bytes)
+MAX_SCENARIOS = 100000          # Most scenarios in one request
+
+# Requests with at least this many scenarios to work out are worked out off
+# the event loop, so they don't hold up the other connections
+OFFLOAD_ROWS = 1000
+
+REASONS = {200:'OK', 400:'Bad Request', 404:'Not Found',
+           405:'Method Not Allowed', 413:'Payload Too Large',
+           503:'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    ''' An error to send back to the client, with its HTTP status.'''
+
+    def __init__(self, status, msg):
+        Exception.__init__(self, msg)
+        self.status = status
+
+
+class LRUCache:
+    ''' A dictionary that holds at most maxSize items, forgetting the least
+    recently used one when it is full. Counts hits and misses.'''
+
+    def __init__(self, maxSize=100000):
+        self.maxSize = maxSize
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        ''' Returns the value for key (and marks it as recently used), or
+        None if it isn't cached.'''
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        ''' Caches value for key, forgetting the oldest item if full.'''
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxSize:
+            self.items.popitem(last=False)
+
+    def getStats(self):
+        ''' Returns the size and hit counts of the cache.'''
+        lookups = self.hits + self.misses
+        return {'size':len(self.items), 'maxSize':self.maxSize,
+                'hits':self.hits, 'misses':self.misses,
+                'hitRate':self.hits / lookups if lookups else 0.0}
+
+
+def getNumber(scenario, name):
+    ''' Returns a parameter of a scenario as a finite, non-negative number.'''
+    value = scenario.get(name, DEFAULTS[name])
+    if isinstance(value, str) and value in engine.SPEND_BRACKETS:
+        value = engine.SPEND_BRACKETS[value]
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('%s must be a number' % name)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError('%s must be a number >= 0' % name)
+    return round(value, KEY_DECIMALS)
+
+
+def normalize(scenario):
+    ''' Returns the cache key of a scenario (a dictionary of parameters,
+    see DEFAULTS): a tuple of its values in a standard form. Raises
+    ValueError for unknown or invalid parameters.'''
+    if not isinstance(scenario, dict):
+        raise ValueError('A scenario must be a JSON object')
+    unknown = set(scenario) - set(DEFAULTS)
+    if unknown:
+        raise ValueError('Unknown parameters: %s' % ', '.join(sorted(unknown)))
+    cat = str(scenario.get('cat', DEFAULTS['cat']))
+    if cat not in engine.CATEGORIES:
+        raise ValueError('Unknown car category: %s' % cat)
+    sex = str(scenario.get('sex', DEFAULTS['sex'])).upper()
+    if sex not in ('M', 'F'):
+        raise ValueError('sex must be M or F')
+    return (getNumber(scenario, 'dist'), getNumber(scenario, 'trips'), cat,
+            getNumber(scenario, 'bikeSpend'), getNumber(scenario, 'shoeSpend'),
+            sex)
+
+
+def calculateKeys(keys):
+    ''' Works out the results of a list of cache keys in one batch, and
+    returns a list of result dictionaries (ready to be sent as JSON).'''
+    dist, trips, cat, bikeSpend, shoeSpend, sex = [np.array(c)
+                                                   for c in zip(*keys)]
+    calc = engine.calculateBatch(dist, trips, cat, bikeSpend, shoeSpend, sex)
+    calc = {k:v.tolist() for k, v in calc.items()}
+    return [{k:v[i] for k, v in calc.items()} for i in range(len(keys))]
+
+
+class Service:
+    ''' Answers requests, using an LRUCache of results, and a
+    resultcache.ResultCache if one is given as diskCache. The LRUCache is
+    only used by the event loop's thread; the ResultCache (which must be
+    made by the worker thread, see run) only by the worker thread.'''
+
+    def __init__(self, cacheSize=100000, diskCache=None):
+        self.cache = LRUCache(cacheSize)
+        self.diskCache = diskCache
+        self.requests = 0
+        self.scenarios = 0
+        # One thread, so the disk cache's connection is only ever used by it
+        self.executor = ThreadPoolExecutor(1)
+
+    def run(self, fn, *args):
+        ''' Runs fn(*args) in the worker thread, and returns an awaitable
+        of its result.'''
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn,
+                    *args)
+
+    def lookup(self, scenarios):
+        ''' Returns (keys, results, missing) for a list of scenarios:
+        their cache keys, their results in the LRUCache (None where they
+        aren't), and {key: indexes of results} of the ones that aren't.'''
+        keys = [normalize(s) for s in scenarios]
+        results = [self.cache.get(k) for k in keys]
+        missing = {}    # {key: index of results}, so repeats are done once
+        for i, r in enumerate(results):
+            if r is None:
+                missing.setdefault(keys[i], []).append(i)
+        self.scenarios += len(keys)
+        return keys, results, missing
+
+    def fetch(self, keys):
+        ''' Returns the results of a list of keys that aren't in the
+        LRUCache, from the disk cache if there is one, working out the rest
+        all together. Blocks on the disk cache.'''
+        found = (self.diskCache.get(keys) if self.diskCache is not None
+                 else [None]*len(keys))
+        missing = [k for k, r in zip(keys, found) if r is None]
+        if missing:
+            calculated = calculateKeys(missing)
+            if self.diskCache is not None:
+                self.diskCache.put(missing, calculated)
+            calculated = iter(calculated)
+            found = [next(calculated) if r is None else r for r in found]
+        return found
+
+    def fill(self, results, missing, fetched):
+        ''' Puts the fetched results of the keys in missing into results
+        and the LRUCache, and returns results.'''
+        for key, result in zip(missing, fetched):
+            self.cache.put(key, result)
+            for i in missing[key]:
+                results[i] = result
+        return results
+
+    def calculate(self, scenarios):
+        ''' Returns the results of a list of scenarios. Only the ones that
+        aren't cached are worked out, all together. Blocks on the disk
+        cache; the service itself uses calculateAsync.'''
+        keys, results, missing = self.lookup(scenarios)
+        return self.fill(results, missing, self.fetch(list(missing)))
+
+    async def calculateAsync(self, scenarios):
+        ''' The same as calculate, with the disk cache and batches of at
+        least OFFLOAD_ROWS scenarios handled by the worker thread.'''
+        keys, results, missing = self.lookup(scenarios)
+        if not missing:
+            return results
+        if self.diskCache is not None or len(missing) >= OFFLOAD_ROWS:
+            fetched = await self.run(self.fetch, list(missing))
+        else:
+            fetched = self.fetch(list(missing))
+        return self.fill(results, missing, fetched)
+
+    async def handle(self, method, target, body):
+        ''' Answers one request. Returns (status, object to send as JSON).'''
+        self.requests += 1
+        url = urllib.parse.urlsplit(target)
+        try:
+            if url.path == '/calculate':
+                if method == 'GET':
+                    query = dict(urllib.parse.parse_qsl(url.query))
+                    return 200, (await self.calculateAsync([query]))[0]
+                if method == 'POST':
+                    try:
+                        data = json.loads(body or b'{}')
+                    except ValueError:
+                        raise ValueError('The body is not valid JSON')
+                    if isinstance(data, dict) and 'scenarios' in data:
+                        scenarios = data['scenarios']
+                        if not isinstance(scenarios, list):
+                            raise ValueError('scenarios must be a list')
+                        if len(scenarios) > MAX_SCENARIOS:
+                            raise HTTPError(413, 'At most %d scenarios per '
+                                        'request' % MAX_SCENARIOS)
+                        return 200, {'results':await self.calculateAsync(
+                                    scenarios)}
+                    return 200, (await self.calculateAsync([data]))[0]
+                raise HTTPError(405, 'Use GET or POST')
+            if url.path == '/stats':
+                stats = {'requests':self.requests,
+                         'scenarios':self.scenarios,
+                         'cache':self.cache.getStats()}
+                if self.diskCache is not None:
+                    stats['diskCache'] = await self.run(
+                                self.diskCache.getStats)
+                return 200, stats
+            raise HTTPError(404, 'No such path: %s' % url.path)
+        except HTTPError as e:
+            return e.status, {'error':str(e)}
+        except ValueError as e:
+            return 400, {'error':str(e)}
+        except sqlite3.OperationalError as e:
+            # e.g. 'database is locked': another process kept the disk
+            # cache's write lock for longer than its timeout
+            return 503, {'error':'The disk cache is busy: %s' % e}
+
+    async def serveClient(self, reader, writer):
+        ''' Reads requests from one connection and answers them, for as
+        long as the client keeps the connection open.'''
+        try:
+            while True:
+                request = await readRequest(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, obj = await self.handle(method, target, body)
+                keepAlive = headers.get('connection', '').lower() != 'close'
+                writer.write(makeResponse(status, obj, keepAlive))
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except HTTPError as e:
+            writer.write(makeResponse(e.status, {'error':str(e)}, False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def readRequest(reader):
+    ''' Reads one HTTP/1.1 request. Returns (method, target, {header: value},
+    body), or None if the client closed the connection.'''
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, 'Bad request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, 'Bad Content-Length')
+    if length > MAX_BODY:
+        raise HTTPError(413, 'The body is too large')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def makeResponse(status, obj, keepAlive=True):
+    ''' Returns the bytes of an HTTP response holding obj as JSON.'''
+    body = json.dumps(obj).encode()
+    head = ('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+            'Content-Length: %d\r\nConnection: %s\r\n\r\n' % (status,
+            REASONS.get(status, ''), len(body),
+            'keep-alive' if keepAlive else 'close'))
+    return head.encode('latin-1') + body
+
+
+async def serve(host='127.0.0.1', port=8080, cacheSize=100000,
+                cacheDir=None, cacheMB=256, cacheTimeout=5.0):
+    ''' Runs the service until it is cancelled.'''
+    service = Service(cacheSize)
+    if cacheDir is not None:
+        import resultcache
+        os.makedirs(cacheDir, exist_ok=True)
+        # Made by the worker thread, which is the only one to use it
+        service.diskCache = await service.run(resultcache.ResultCache,
+                    os.path.join(cacheDir, 'results.db'),
+                    int(cacheMB * 1024 * 1024), cacheTimeout)
+    server = await asyncio.start_server(service.serveClient, host, port)
+    address = server.sockets[0].getsockname()
+    print('Serving on http://%s:%d' % address[:2], file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    ''' Parses the command line and runs the service.'''
+    parser = argparse.ArgumentParser(description='Serve time, cost, '
+                'calories, and CO2 results as JSON over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=100000,
+                help='scenarios kept in the result cache (default: 100000)')
+    parser.add_argument('--cache-dir', help='directory for a cache of '
+                'results on disk, shared with other processes')
+    parser.add_argument('--cache-mb', type=float, default=256,
+                help='size limit of the disk cache in MB (default: 256)')
+    parser.add_argument('--cache-timeout', type=float, default=5.0,
+                help='seconds to wait for the disk cache when another '
+                'process is writing to it, before answering 503 (default: 5)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size,
+                    args.cache_dir, args.cache_mb, args.cache_timeout))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
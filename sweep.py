@@ -0,0 +1,205 @@
+'''
+sweep.py
+Sensitivity sweeps over every combination of car category, bike spending
+bracket, shoe spending bracket, sex, distance, and number of trips. That is
+easily tens of millions of scenarios, so the grid is cut into blocks which
+are worked out with engine.calculateBatch by a pool of processes (one per
+core by default).
+
+Results go straight into memory-mapped .npy files in an output directory
+(one per calcDict value), which each worker writes its blocks into, so
+nothing is pickled back through the pool. The directory also holds the grid
+(sweep.json) and which blocks are finished (done.npy), so a sweep that was
+interrupted can be resumed by running it again with the same settings:
+    >> python3 sweep.py out/ --dist 0 100 1001 --trips 1 100 100
+
+loadSweep returns the results as arrays with one axis per grid setting.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import engine
+
+# The settings that make up the grid, in the order of the result axes
+AXES = ('cat', 'bikeSpend', 'shoeSpend', 'sex', 'dist', 'trips')
+
+# Values stored for every scenario. The per-mode ones have a last axis of
+# length 3 (driver, biker, walker, see engine.MODES)
+PER_MODE = ('time', 'cost', 'cal', 'time-mins', 'time-audio', 'cost-coffee',
+            'cal-hour')
+OUTPUTS = PER_MODE + ('CO2', 'CO2-tree')
+
+
+def makeGrid(dist, trips, cat=engine.CATEGORIES,
+             bikeSpend=tuple(engine.SPEND_BRACKETS.values()),
+             shoeSpend=tuple(engine.SPEND_BRACKETS.values()), sex=('M', 'F')):
+    ''' Returns a grid (a dictionary of lists, one per name in AXES). By
+    default every car category, every GUI spending bracket, and both sexes
+    are swept; dist and trips are the values to sweep for those.'''
+    engine.catCodes(cat)
+    engine.isMale(sex)
+    return {'cat':[str(c) for c in cat],
+            'bikeSpend':[float(b) for b in bikeSpend],
+            'shoeSpend':[float(s) for s in shoeSpend],
+            'sex':[str(s) for s in sex],
+            'dist':[float(d) for d in dist],
+            'trips':[float(t) for t in trips]}
+
+
+def getShape(grid):
+    ''' Returns the shape of the grid (its length along each of AXES).'''
+    return tuple(len(grid[a]) for a in AXES)
+
+
+def evaluateBlock(grid, start, stop):
+    ''' Works out scenarios start to stop (indexes into the flattened grid)
+    and returns engine.calculateBatch's dictionary of results.'''
+    index = np.unravel_index(np.arange(start, stop), getShape(grid))
+    cat, bikeSpend, shoeSpend, sex, dist, trips = [
+        np.asarray(grid[a])[i] for a, i in zip(AXES, index)]
+    return engine.calculateBatch(dist, trips, engine.catCodes(cat),
+                bikeSpend, shoeSpend, sex)
+
+
+def openOutputs(outDir, spec, mode):
+    ''' Opens (mode 'r+' or 'r') or creates (mode 'w+') the memory-mapped
+    result files in outDir and returns {name: flat memmap}.'''
+    n = int(np.prod(getShape(spec['grid'])))
+    outputs = {}
+    for name in spec['outputs']:
+        path = os.path.join(outDir, name + '.npy')
+        if mode == 'w+':
+            shape = (n, 3) if name in PER_MODE else (n,)
+            outputs[name] = np.lib.format.open_memmap(path, mode, spec['dtype'],
+                        shape)
+        else:
+            outputs[name] = np.load(path, mmap_mode=mode)
+    return outputs
+
+
+# Set in each worker process by initWorker
+_spec = None
+_outputs = None
+
+def initWorker(outDir, spec):
+    ''' Runs once in every worker process, to open the result files.'''
+    global _spec, _outputs
+    _spec = spec
+    _outputs = openOutputs(outDir, spec, 'r+')
+
+
+def runBlock(block):
+    ''' Works out one block of the grid and writes it to the result files.
+    The results are flushed to disk before the block is reported done.'''
+    start = block * _spec['blockSize']
+    stop = min(start + _spec['blockSize'], len(_outputs[_spec['outputs'][0]]))
+    calc = evaluateBlock(_spec['grid'], start, stop)
+    for name, out in _outputs.items():
+        out[start:stop] = calc[name]
+        out.flush()
+    return block
+
+
+def runSweep(outDir, grid, outputs=OUTPUTS, dtype='float32',
+             blockSize=1000000, workers=None, quiet=False):
+    ''' Works out every scenario in grid (see makeGrid) into outDir, using
+    a pool of workers processes (default: one per core). If outDir holds
+    an unfinished sweep with the same settings, only the blocks that
+    weren't finished are worked out. Returns the number of blocks done.'''
+    spec = {'grid':grid, 'outputs':list(outputs), 'dtype':dtype,
+            'blockSize':blockSize}
+    for name in spec['outputs']:
+        if name not in OUTPUTS:
+            raise ValueError('Unknown output: %s' % name)
+    n = int(np.prod(getShape(grid)))
+    nBlocks = -(-n // blockSize)
+    specPath = os.path.join(outDir, 'sweep.json')
+    donePath = os.path.join(outDir, 'done.npy')
+
+    if os.path.exists(specPath):
+        with open(specPath) as f:
+            if json.load(f) != spec:
+                raise ValueError('%s holds a sweep with different settings'
+                            % outDir)
+        done = np.load(donePath, mmap_mode='r+')
+    else:
+        os.makedirs(outDir, exist_ok=True)
+        openOutputs(outDir, spec, 'w+')
+        done = np.lib.format.open_memmap(donePath, 'w+', bool, (nBlocks,))
+        # Written last, so a sweep that is only partly set up starts over
+        with open(specPath, 'w') as f:
+            json.dump(spec, f)
+
+    todo = np.flatnonzero(~done).tolist()
+    start = time.perf_counter()
+
+    def finished(block, count):
+        done[block] = True
+        done.flush()
+        if not quiet:
+            print('\r%d/%d blocks done' % (nBlocks - len(todo) + count,
+                        nBlocks), end='', file=sys.stderr)
+
+    if workers == 1:
+        initWorker(outDir, spec)
+        for count, block in enumerate(todo, 1):
+            finished(runBlock(block), count)
+    else:
+        with ProcessPoolExecutor(workers, initializer=initWorker,
+                    initargs=(outDir, spec)) as pool:
+            futures = [pool.submit(runBlock, b) for b in todo]
+            for count, future in enumerate(as_completed(futures), 1):
+                finished(future.result(), count)
+
+    if not quiet:
+        seconds = time.perf_counter() - start
+        nDone = min(len(todo) * blockSize, n)
+        print('\n%d scenarios in %.2f s (%.0f scenarios/s)' % (nDone, seconds,
+                    nDone / seconds if seconds else 0), file=sys.stderr)
+    return len(todo)
+
+
+def loadSweep(outDir):
+    ''' Returns (grid, {name: results}) for the finished sweep in outDir.
+    The results are read-only memory maps with one axis per name in AXES
+    (plus one for the mode, for the per-mode values).'''
+    with open(os.path.join(outDir, 'sweep.json')) as f:
+        spec = json.load(f)
+    if not np.load(os.path.join(outDir, 'done.npy')).all():
+        raise ValueError('The sweep in %s is not finished' % outDir)
+    shape = getShape(spec['grid'])
+    outputs = openOutputs(outDir, spec, 'r')
+    return spec['grid'], {name: out.reshape(shape + out.shape[1:])
+                          for name, out in outputs.items()}
+
+
+def main(argv=None):
+    ''' Parses the command line and runs (or resumes) a sweep.'''
+    parser = argparse.ArgumentParser(description='Sweep every car category, '
+                'spending bracket, and sex over grids of distance and trips.')
+    parser.add_argument('outDir', help='directory for the results')
+    parser.add_argument('--dist', nargs=3, type=float, required=True,
+                metavar=('START', 'STOP', 'NUM'), help='distance grid (miles)')
+    parser.add_argument('--trips', nargs=3, type=float, required=True,
+                metavar=('START', 'STOP', 'NUM'), help='trips grid')
+    parser.add_argument('--outputs', nargs='+', choices=OUTPUTS,
+                default=list(OUTPUTS), help='values to store (default: all)')
+    parser.add_argument('--dtype', choices=('float32', 'float64'),
+                default='float32', help='type of the stored values')
+    parser.add_argument('--block-size', type=int, default=1000000,
+                help='scenarios per block (default: 1000000)')
+    parser.add_argument('--workers', type=int, default=None,
+                help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    grid = makeGrid(np.linspace(args.dist[0], args.dist[1], int(args.dist[2])),
+                np.linspace(args.trips[0], args.trips[1], int(args.trips[2])))
+    runSweep(args.outDir, grid, args.outputs, args.dtype, args.block_size,
+                args.workers)
+
+if __name__ == "__main__":
+    main()
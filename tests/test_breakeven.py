@@ -0,0 +1,52 @@
+'''
+test_breakeven.py
+Checks that breakeven.getSurface over the person's attributes gives the
+same values as solving each of its cells on its own, and as working the
+crossover out from the GUI's mode objects.
+'''
+import numpy as np
+import pytest
+import breakeven
+import engine
+from tests.test_engine import makeModes
+
+AXES = {'weight':[120.0, 180.0, 240.0], 'height':[60.0, 66.5, 73.0],
+        'age':[18.0, 40.0, 75.0]}
+PAIRS = [('weight', 'height'), ('height', 'age'), ('age', 'weight')]
+
+
+@pytest.mark.parametrize('xName,yName', PAIRS)
+@pytest.mark.parametrize('sex', ['M', 'F'])
+def test_surface_cells(xName, yName, sex):
+    kwargs = {'sex':sex, 'calValue':0.005, 'tripMinutes':{'biker':3.0},
+              'valueOfTime':10.0}
+    for metric in breakeven.METRICS:
+        surface = breakeven.getSurface(metric, ('biker', 'walker'), xName,
+                    AXES[xName], yName, AXES[yName], **dict(kwargs))
+        assert surface.shape == (len(AXES[yName]), len(AXES[xName]))
+        for row, y in enumerate(AXES[yName]):
+            for col, x in enumerate(AXES[xName]):
+                cell = breakeven.solve(metric, ('biker', 'walker'),
+                            **dict(kwargs, **{xName:x, yName:y}))
+                np.testing.assert_allclose(surface[row, col], cell[0],
+                            rtol=1e-12)
+
+
+@pytest.mark.parametrize('sex', ['M', 'F'])
+def test_surface_value_of_time(sex):
+    # The value of time at which the driver and walker cost the same per
+    # mile, worked out from calculate's results for 1 mile
+    calValue = 0.01
+    surface = breakeven.getSurface('valueOfTime', ('driver', 'walker'),
+                'weight', AXES['weight'], 'age', AXES['age'], sex=sex,
+                calValue=calValue)
+    for row, age in enumerate(AXES['age']):
+        for col, weight in enumerate(AXES['weight']):
+            calc = engine.calculate(*makeModes(sex=sex, weight=weight,
+                        age=age), 1.0, 1)
+            other = [c - calValue*cal for c, cal in zip(calc['cost'],
+                     calc['cal'])]
+            expected = (other[2] - other[0]) / (calc['time'][0]
+                        - calc['time'][2])
+            np.testing.assert_allclose(surface[row, col], expected,
+                        rtol=1e-12)
@@ -0,0 +1,97 @@
+'''
+test_engine.py
+Checks that engine.calculateBatch gives the same results as the scalar
+calculate/calculateModes used by the GUI, for scalar and broadcast inputs.
+'''
+import numpy as np
+import pytest
+import engine
+from modes import Driver, Biker, Walker, makeMode
+
+KEYS = ('time', 'cost', 'cal', 'cal-hour', 'CO2-mode', 'time-mins',
+        'time-audio', 'cost-coffee')
+
+
+def makeModes(cat='average', bikeSpend=100.0, shoeSpend=37.5, sex='M',
+              weight=None, height=None, age=None):
+    ''' Returns a driver, biker, and walker set up like the GUI would.'''
+    d, b, w = Driver(), Biker(), Walker()
+    d.setCat(cat)
+    b.setSpend(bikeSpend)
+    w.setSpend(shoeSpend)
+    for m in (d, b, w):
+        m.person.setSex(sex, True)
+        if weight is not None:
+            m.person.setWeight(weight)
+        if height is not None:
+            m.person.setHeight(height)
+        if age is not None:
+            m.person.setAge(age)
+    return d, b, w
+
+
+def checkRow(calc, i, expected):
+    ''' Checks row i of batch results against a scalar calcDict.'''
+    for key in KEYS:
+        np.testing.assert_allclose(calc[key][i], expected[key], rtol=1e-12)
+    np.testing.assert_allclose(calc['CO2'][i], expected['CO2'], rtol=1e-12)
+    np.testing.assert_allclose(calc['CO2-tree'][i], expected['CO2-tree'],
+                rtol=1e-12)
+
+
+@pytest.mark.parametrize('cat', engine.CATEGORIES)
+@pytest.mark.parametrize('sex', ('M', 'F'))
+def test_scalar(cat, sex):
+    expected = engine.calculate(*makeModes(cat, 75, 12.5, sex), 3.5, 4)
+    checkRow(engine.calculateBatch(3.5, 4, cat, 75, 12.5, sex), 0, expected)
+
+
+def test_calculateModes():
+    d = makeMode('driver')
+    modes = [d, makeMode('biker', d), makeMode('walker', d)]
+    expected = engine.calculateModes(modes, 2.0, 3)
+    checkRow(engine.calculateBatch(2.0, 3), 0, expected)
+
+
+def test_person():
+    expected = engine.calculate(*makeModes(sex='F', weight=140.5,
+                height=61.25, age=44.5), 1.5, 2)
+    calc = engine.calculateBatch(1.5, 2, sex='F', weight=140.5, height=61.25,
+                age=44.5)
+    checkRow(calc, 0, expected)
+
+
+def test_broadcast():
+    rng = np.random.default_rng(0)
+    n = 40
+    rows = {'dist':rng.uniform(0.1, 20, n), 'trips':rng.integers(1, 10, n),
+            'cat':rng.choice(engine.CATEGORIES, n),
+            'bikeSpend':rng.choice(list(engine.SPEND_BRACKETS.values()), n),
+            'shoeSpend':rng.uniform(10, 100, n), 'sex':rng.choice(['M', 'F'], n),
+            'weight':rng.uniform(100, 250, n), 'height':rng.uniform(55, 75, n),
+            'age':rng.uniform(18, 80, n)}
+    calc = engine.calculateBatch(**rows)
+    for i in range(n):
+        row = {k:v[i] for k, v in rows.items()}
+        expected = engine.calculate(*makeModes(row['cat'], row['bikeSpend'],
+                    row['shoeSpend'], row['sex'], row['weight'], row['height'],
+                    row['age']), row['dist'], row['trips'])
+        checkRow(calc, i, expected)
+
+
+@pytest.mark.parametrize('name', ('weight', 'height', 'age'))
+def test_person_array_scalar_dist(name):
+    # A per-row person attribute with every other parameter a scalar
+    values = {'weight':[100.0, 150.0, 200.0], 'height':[60.0, 66.0, 72.0],
+              'age':[20.0, 45.5, 70.0]}[name]
+    calc = engine.calculateBatch(1.0, sex='F', **{name:np.array(values)})
+    assert calc['cal'].shape == (3, len(engine.MODES))
+    for i, v in enumerate(values):
+        expected = engine.calculate(*makeModes(sex='F', **{name:v}), 1.0, 1)
+        checkRow(calc, i, expected)
+
+
+def test_mpg():
+    calc = engine.calculateBatch(1.0, mpg=np.array([20.0, 40.0]))
+    np.testing.assert_allclose(calc['CO2'], Driver.LBS_CO2_PER_GAL
+                / np.array([20.0, 40.0]))
@@ -0,0 +1,54 @@
+'''
+test_population.py
+Checks Population against the Person class it stores in columns.
+'''
+import numpy as np
+import pytest
+from modes import Person
+from population import Population
+
+
+def makePerson(sex, weight=None, height=None, age=None, actLevel='no'):
+    person = Person('driver')
+    person.setSex(sex, True)
+    for value, setter in ((weight, person.setWeight),
+                          (height, person.setHeight), (age, person.setAge)):
+        if value is not None:
+            setter(value)
+    person.setActLevel(actLevel)
+    return person
+
+
+def test_bmr():
+    # Weight and height are float32, so they agree within its precision
+    sexes = ['M', 'F', 'M', 'F']
+    weights = [195.5, 162.9, 140.25, 210.0]
+    heights = [69.3, 63.8, 61.5, 74.0]
+    ages = [30.5, 41.25, 21, 67.75]
+    acts = ['no', 'light', 'moderate', 'heavy']
+    pop = Population(sexes, weights, heights, ages, acts)
+    people = [makePerson(*row) for row in zip(sexes, weights, heights, ages,
+              acts)]
+    np.testing.assert_allclose(pop.getBMR(), [p.getBMR() for p in people],
+                rtol=1e-6)
+    np.testing.assert_allclose(pop.getCal(), [p.getCal() for p in people],
+                rtol=1e-6)
+
+
+def test_defaults():
+    pop = Population(['M', 'F'])
+    np.testing.assert_allclose(pop.getBMR(), [makePerson('M').getBMR(),
+                makePerson('F').getBMR()], rtol=1e-6)
+
+
+def test_fractional_age():
+    pop = Population('M', age=[30.5, 31.0])
+    assert pop.age.tolist() == [30.5, 31.0]
+    assert pop.getBMR()[0] != pop.getBMR()[1]
+
+
+@pytest.mark.parametrize('kwargs', ({'age':-1}, {'age':np.nan},
+                         {'weight':0}, {'height':-60}, {'weight':np.inf}))
+def test_out_of_range(kwargs):
+    with pytest.raises(ValueError):
+        Population('M', **kwargs)
@@ -0,0 +1,131 @@
+'''
+test_streaming.py
+Checks that the tools reading files in chunks (triplog, routes, fleet) give
+the same totals whatever the chunk size, and that a trip log converted with
+tripstore gives the same totals as the CSV. Also checks fleet's handling of
+electric vehicles and bad miles.
+'''
+import numpy as np
+import pytest
+import engine
+import fleet
+import routes
+import triplog
+import tripstore
+
+CHUNK_SIZES = (1, 7, 100, 10**6)
+
+
+def makeLog(n=500, seed=0):
+    ''' Returns the lines of a random trip log. Distances are multiples of
+    1/8 mile, so storing them doesn't round them.'''
+    rng = np.random.default_rng(seed)
+    cats = list(engine.CATEGORIES) + ['']
+    lines = ['user,distance,mode,category,trips\n']
+    for i in range(n):
+        lines.append('u%d,%g,%s,%s,%d\n' % (rng.integers(20),
+                     rng.integers(1, 160) / 8, rng.choice(['drive', 'bike',
+                     'walk']), rng.choice(cats), rng.integers(1, 5)))
+    return lines
+
+
+def getTotals(groups):
+    ''' Returns {grouping: {key: {name: total}}} from GroupTotals.'''
+    return {g:dict(totals.items()) for g, totals in groups.items()}
+
+
+def assertSame(a, b, rtol=1e-9):
+    assert a.keys() == b.keys()
+    for g in a:
+        assert a[g].keys() == b[g].keys()
+        for key in a[g]:
+            for name, value in a[g][key].items():
+                np.testing.assert_allclose(value, b[g][key][name], rtol=rtol,
+                            err_msg='%s %s %s' % (g, key, name))
+
+
+def test_triplog_chunks():
+    lines = makeLog()
+    expected, nRows = triplog.aggregate(lines, chunkSize=10**6)
+    assert nRows == 500
+    for size in CHUNK_SIZES:
+        groups, n = triplog.aggregate(lines, chunkSize=size)
+        assert n == nRows
+        assertSame(getTotals(groups), getTotals(expected))
+
+
+@pytest.mark.parametrize('outputs', (True, False))
+def test_tripstore_parity(tmp_path, outputs):
+    lines = makeLog()
+    expected = getTotals(triplog.aggregate(lines)[0])
+    assert tripstore.convert(lines, str(tmp_path), chunkSize=64,
+                outputs=outputs) == 500
+    for size in (13, 10**6):
+        groups, n = tripstore.aggregateStore(str(tmp_path), chunkSize=size)
+        assert n == 500
+        # Stored totals are float32
+        assertSame(getTotals(groups), expected, 1e-6 if outputs else 1e-9)
+
+
+def writeTracks(path, gpx):
+    ''' Writes three tracks of random points to path, as GPX or CSV.'''
+    rng = np.random.default_rng(1)
+    tracks = [(40 + rng.normal(0, 0.01, 25).cumsum() * 0.1,
+               -75 + rng.normal(0, 0.01, 25).cumsum() * 0.1)
+              for i in range(3)]
+    with open(path, 'w') as f:
+        if gpx:
+            f.write('<?xml version="1.0"?>\n<gpx version="1.1" '
+                    'xmlns="http://www.topografix.com/GPX/1/1">\n')
+            for i, (lat, lon) in enumerate(tracks):
+                f.write('<trk><name>t%d</name><trkseg>\n' % i)
+                for a, o in zip(lat, lon):
+                    f.write('<trkpt lat="%.7f" lon="%.7f"/>\n' % (a, o))
+                f.write('</trkseg></trk>\n')
+            f.write('</gpx>\n')
+        else:
+            f.write('trip,lat,lon\n')
+            for i, (lat, lon) in enumerate(tracks):
+                for a, o in zip(lat, lon):
+                    f.write('t%d,%.7f,%.7f\n' % (i, a, o))
+
+
+@pytest.mark.parametrize('gpx', (True, False))
+def test_routes_chunks(tmp_path, gpx):
+    path = str(tmp_path / ('tracks.gpx' if gpx else 'tracks.csv'))
+    writeTracks(path, gpx)
+    expected = routes.measureFile(path, 10**6)
+    assert [r[0] for r in expected] == ['t0', 't1', 't2']
+    assert [r[2] for r in expected] == [25, 25, 25]
+    for size in CHUNK_SIZES:
+        measured = routes.measureFile(path, size)
+        assert [r[0] for r in measured] == [r[0] for r in expected]
+        np.testing.assert_allclose([r[1] for r in measured],
+                    [r[1] for r in expected], rtol=1e-12)
+
+
+def test_fleet_chunks():
+    lines = list(fleet.makeRegistry(np.random.default_rng(2), 300))
+    expected, nRows = fleet.inventory(lines, ('fuel', 'owner'), 10**6)
+    assert nRows == 300
+    for size in CHUNK_SIZES:
+        groups, n = fleet.inventory(lines, ('fuel', 'owner'), size)
+        assert n == nRows
+        assertSame(getTotals(groups), getTotals(expected))
+
+
+def test_fleet_electric():
+    # Electric vehicles count their miles, but no gallons or CO2
+    lines = ['model,miles,fuel\n', 'Unknown Car,1000,gasoline\n',
+             'Unknown Car,1000,electric\n']
+    totals = getTotals(fleet.inventory(lines)[0])['fuel']
+    assert totals['electric']['miles'] == totals['gasoline']['miles'] == 1000
+    assert totals['electric']['gallons'] == totals['electric']['CO2'] == 0
+    assert totals['gasoline']['gallons'] > 0
+
+
+@pytest.mark.parametrize('miles', ['-5', 'nan', 'inf'])
+def test_fleet_bad_miles(miles):
+    lines = ['model,miles\n', 'Unknown Car,%s\n' % miles]
+    with pytest.raises(ValueError):
+        fleet.inventory(lines)
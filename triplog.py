@@ -0,0 +1,243 @@
+'''
+triplog.py
+Command line tool for working out the time, cost, calorie burn, and CO2
+figures for every trip in a (possibly multi-GB) CSV trip log, and adding
+them up per user and per car category. For example:
+    >> python3 triplog.py trips.csv --by user --by category -o totals.csv
+
+The log needs a header row with these columns (others are ignored):
+    user      - anything identifying the traveller
+    distance  - miles travelled
+    mode      - drive, bike, or walk (driver, biker, walker also work)
+    category  - car category from Driver.catDict (blank means 'average')
+    trips     - optional, number of times the trip was made (default 1)
+
+The log is read in chunks of a fixed number of rows, and each chunk is
+worked out with engine.calculateBatch, so memory use depends on the chunk
+size and the number of groups, not on the size of the log. The number of
+rows per second and the peak memory use are reported when it finishes.
+
+A log converted with tripstore.py (a directory) can be given instead of
+the CSV, which skips parsing it.
+'''
+import argparse
+import csv
+import os
+import sys
+import time
+import numpy as np
+import engine
+import units
+
+# Values in the mode column, and the column of engine results they refer to
+MODE_CODES = {'drive':0, 'driver':0, 'car':0, 'bike':1, 'biker':1,
+              'walk':2, 'walker':2}
+
+# The totals kept for each group, in output order. 'CO2' is what the driven
+# trips emitted, 'CO2-saved' is what the biked or walked trips would have
+# emitted had they been driven. Each is also given in trees planted.
+TOTALS = ('trips', 'miles', 'time', 'time-mins', 'time-audio', 'cost',
+          'cost-coffee', 'cal', 'CO2', 'CO2-tree', 'CO2-saved',
+          'CO2-saved-tree')
+
+# The columns that can be grouped by, and the log column they come from
+GROUPS = {'user':'user', 'category':'category'}
+
+
+class GroupTotals:
+    ''' Keeps running totals of several values for each key of a grouping
+    (e.g. for each user). Keys are given an index the first time they are
+    seen, and the totals are kept in arrays indexed by it, so adding a chunk
+    only loops in python over the keys that appear in the chunk.'''
+
+    def __init__(self, names):
+        ''' names are the names of the totals to keep.'''
+        self.names = names
+        self.index = {}     # {key: row in self.sums}
+        self.sums = np.zeros((0, len(names)))
+
+    def add(self, keys, values):
+        ''' Accepts an array of keys (one per row) and a dictionary of
+        arrays of values (one array per total, one value per row), and
+        adds the values onto the totals for their keys.'''
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        rows = np.array([self.index.setdefault(k, len(self.index))
+                        for k in uniq.tolist()], dtype=np.intp)
+        if len(self.index) > len(self.sums):
+            grown = np.zeros((max(len(self.index), 2*len(self.sums)),
+                        len(self.names)))
+            grown[:len(self.sums)] = self.sums
+            self.sums = grown
+        inverse = inverse.ravel()
+        for i, name in enumerate(self.names):
+            self.sums[rows, i] += np.bincount(inverse, weights=values[name],
+                        minlength=len(uniq))
+
+    def items(self):
+        ''' Yields (key, {name: total}) for every key, in order of the keys.'''
+        for key in sorted(self.index, key=str):
+            row = self.sums[self.index[key]]
+            yield key, dict(zip(self.names, row))
+
+
+def readChunks(lines, chunkSize, need=('user', 'distance', 'mode'),
+               what='Trip log'):
+    ''' Reads a CSV trip log (or another CSV with the columns in need, named
+    what in errors) from an iterable of lines and yields it as dictionaries
+    of columns (lists of strings), chunkSize rows at a time. Raises
+    ValueError for rows with fewer columns than the header.'''
+    reader = csv.reader(lines)
+    header = [h.strip().lower() for h in next(reader)]
+    for name in need:
+        if name not in header:
+            raise ValueError('%s has no %s column' % (what, name))
+    chunk = []
+    for row in reader:
+        if not row:
+            continue
+        # A short row would cut every column of its chunk to its length
+        if len(row) < len(header):
+            raise ValueError('%s line %d has %d columns, the header has %d'
+                             % (what, reader.line_num, len(row), len(header)))
+        chunk.append(row)
+        if len(chunk) >= chunkSize:
+            yield dict(zip(header, zip(*chunk)))
+            chunk = []
+    if chunk:
+        yield dict(zip(header, zip(*chunk)))
+
+
+def parseChunk(chunk):
+    ''' Returns the arrays of a chunk of the log: (distance, trips, car
+    category names, mode codes (see MODE_CODES)).'''
+    dist = np.array(chunk['distance'], dtype=float)
+    n = len(dist)
+    trips = np.array(chunk['trips'], dtype=float) if 'trips' in chunk else 1.0
+    cat = np.array(chunk['category'] if 'category' in chunk else ['']*n)
+    # (np.where, as assigning into cat would cut 'average' to its width)
+    cat = np.where(cat == '', 'average', cat)
+
+    modeNames = np.char.lower(np.char.strip(np.array(chunk['mode'])))
+    names, inverse = np.unique(modeNames, return_inverse=True)
+    try:
+        mode = np.array([MODE_CODES[m] for m in names.tolist()])[inverse.ravel()]
+    except KeyError as e:
+        raise ValueError('Unknown mode: %s' % e.args[0])
+    return dist, trips, cat, mode
+
+
+def evaluateChunk(chunk, sex='M'):
+    ''' Works out the totals (see TOTALS) for every trip in a chunk, using
+    the mode each trip was actually made by. Returns a dictionary of
+    arrays with one value per trip.'''
+    return evaluateTrips(*parseChunk(chunk), sex=sex)
+
+
+def evaluateTrips(dist, trips, cat, mode, sex='M'):
+    ''' The same as evaluateChunk, for arrays of distances, trips, car
+    categories (names or codes), and mode codes.'''
+    n = len(dist)
+    calc = engine.calculateBatch(dist, trips, cat, sex=sex)
+    rows = np.arange(n)
+    driven = (mode == 0)
+    # The other units of TOTALS are converted from these when asked for
+    totals = units.Results({'trips':np.broadcast_to(trips, (n,)).astype(float),
+              'miles':dist*trips,
+              'CO2':np.where(driven, calc['CO2'], 0.0),
+              'CO2-saved':np.where(driven, 0.0, calc['CO2'])})
+    for name in ('time', 'cost', 'cal'):
+        totals[name] = calc[name][rows, mode]
+    return totals
+
+
+def aggregate(lines, groupBy=('user', 'category'), chunkSize=100000, sex='M'):
+    ''' Reads a trip log from an iterable of lines and returns
+    ({grouping: GroupTotals}, number of rows read).'''
+    groups = {g:GroupTotals(TOTALS) for g in groupBy}
+    nRows = 0
+    for chunk in readChunks(lines, chunkSize):
+        totals = evaluateChunk(chunk, sex)
+        for g in groupBy:
+            if GROUPS[g] in chunk:
+                keys = np.array(chunk[GROUPS[g]])
+            else:
+                keys = np.full(len(totals['miles']), 'average')
+            if g == 'category':
+                keys = np.where(keys == '', 'average', keys)
+            groups[g].add(keys, totals)
+        nRows += len(totals['miles'])
+    return groups, nRows
+
+
+def writeTotals(groups, out, names=TOTALS):
+    ''' Writes the totals (names) of every grouping as CSV rows, with the
+    name of the grouping and the key in the first two columns.'''
+    writer = csv.writer(out)
+    writer.writerow(('groupBy', 'key') + tuple(names))
+    for g, totals in groups.items():
+        for key, values in totals.items():
+            writer.writerow([g, key] + ['%.6g' % values[n] for n in names])
+
+
+def getPeakRSS():
+    ''' Returns the peak resident memory of this process in MB, or None
+    where the resource module isn't available (e.g. Windows).'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def main(argv=None):
+    ''' Parses the command line, aggregates the log, writes the totals,
+    and reports throughput on stderr.'''
+    parser = argparse.ArgumentParser(description='Add up time, cost, '
+                'calories, and CO2 of the trips in a CSV trip log.')
+    parser.add_argument('log', help="CSV trip log ('-' for stdin), or a "
+                'directory made by tripstore.py')
+    parser.add_argument('--by', action='append', choices=sorted(GROUPS),
+                help='grouping to total by (repeatable, default: user and '
+                'category)')
+    parser.add_argument('-o', '--output', help='CSV file for the totals '
+                '(default: stdout)')
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                help='rows read and evaluated at a time (default: 100000)')
+    parser.add_argument('--sex', choices=('M', 'F'), default='M',
+                help='sex used for calorie burn (default: M)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if os.path.isdir(args.log):
+        import tripstore
+        groups, nRows = tripstore.aggregateStore(args.log, args.by or (
+                    'user', 'category'), args.chunk_size, args.sex)
+    else:
+        logFile = sys.stdin if args.log == '-' else open(args.log, newline='')
+        try:
+            groups, nRows = aggregate(logFile, args.by or ('user',
+                        'category'), args.chunk_size, args.sex)
+        finally:
+            if logFile is not sys.stdin:
+                logFile.close()
+
+    out = sys.stdout if args.output is None else open(args.output, 'w',
+                newline='')
+    try:
+        writeTotals(groups, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    seconds = time.perf_counter() - start
+    msg = '%d rows in %.2f s (%.0f rows/s)' % (nRows, seconds,
+                nRows / seconds if seconds else 0)
+    peak = getPeakRSS()
+    if peak is not None:
+        msg += ', peak RSS %.1f MB' % peak
+    print(msg, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+'''
+tripstore.py
+Converts a CSV trip log (see triplog.py) into a directory of binary columns,
+one file per column, so it only has to be parsed once:
+    >> python3 tripstore.py trips.csv trips/
+    >> python3 triplog.py trips/ --by user -o totals.csv
+
+The directory holds the inputs of every trip (distance, trips, mode, car
+category, and user, the last three as small integer codes), and, unless
+--no-outputs is given, the totals of every trip (see triplog.TOTALS) worked
+out when converting. store.json describes the columns and users.json lists
+the users, in the order of their codes. Column files are raw little-endian
+arrays, opened with np.memmap, so opening a store takes no time whatever
+its size, nothing is copied until it is used, and processes reading the
+same store share its pages through the OS's file cache.
+
+The stored totals are used as long as they were worked out with the same
+reference data (see resultcache.getDataVersion) and sex as asked for;
+otherwise they are worked out again from the stored inputs, a chunk at a
+time, with engine.calculateBatch.
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import engine
+import resultcache
+import triplog
+
+# The input columns and their types
+INPUTS = {'distance':'<f8', 'trips':'<f4', 'mode':'i1', 'category':'i1',
+          'user':'<i4'}
+# Type of the stored totals
+OUTPUT_DTYPE = '<f4'
+
+
+def convert(lines, outDir, chunkSize=100000, sex='M', outputs=True):
+    ''' Reads a CSV trip log from an iterable of lines and writes it to
+    outDir as binary columns (with the totals of every trip, worked out for
+    sex, if outputs is True). Returns the number of rows written.'''
+    os.makedirs(outDir, exist_ok=True)
+    specPath = os.path.join(outDir, 'store.json')
+    if os.path.exists(specPath):
+        # Removed first, so a store that is only partly rewritten can't be
+        # opened
+        os.remove(specPath)
+    columns = dict(INPUTS)
+    if outputs:
+        columns.update((name, OUTPUT_DTYPE) for name in triplog.TOTALS)
+    files = {name:open(os.path.join(outDir, name + '.bin'), 'wb')
+             for name in columns}
+    users = {}      # {user: code}
+    nRows = 0
+    try:
+        for chunk in triplog.readChunks(lines, chunkSize):
+            dist, trips, cat, mode = triplog.parseChunk(chunk)
+            n = len(dist)
+            names, inverse = np.unique(np.array(chunk['user']),
+                        return_inverse=True)
+            codes = np.array([users.setdefault(u, len(users))
+                        for u in names.tolist()])[inverse.ravel()]
+            values = {'distance':dist, 'trips':np.broadcast_to(trips, (n,)),
+                      'mode':mode, 'category':engine.catCodes(cat),
+                      'user':codes}
+            if outputs:
+                values.update(triplog.evaluateTrips(dist, trips, cat, mode,
+                            sex))
+            for name, f in files.items():
+                f.write(np.ascontiguousarray(values[name],
+                            dtype=columns[name]).tobytes())
+            nRows += n
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(os.path.join(outDir, 'users.json'), 'w') as f:
+        json.dump(list(users), f)
+    spec = {'rows':nRows, 'columns':columns, 'categories':engine.CATEGORIES,
+            'outputs':{'sex':sex, 'version':resultcache.getDataVersion()}
+                       if outputs else None}
+    # Written last, so the store can only be opened once it is complete
+    with open(specPath, 'w') as f:
+        json.dump(spec, f, indent=1)
+    return nRows
+
+
+def openStore(path):
+    ''' Returns (spec, {column: read-only memory map}) for the store in the
+    directory path.'''
+    with open(os.path.join(path, 'store.json')) as f:
+        spec = json.load(f)
+    if tuple(spec['categories']) != engine.CATEGORIES:
+        raise ValueError('%s was written with other car categories' % path)
+    columns = {}
+    for name, dtype in spec['columns'].items():
+        if spec['rows']:
+            columns[name] = np.memmap(os.path.join(path, name + '.bin'),
+                        dtype, 'r', shape=(spec['rows'],))
+        else:
+            columns[name] = np.empty(0, dtype)
+    return spec, columns
+
+
+def readUsers(path):
+    ''' Returns the list of users of the store in the directory path,
+    indexed by their codes.'''
+    with open(os.path.join(path, 'users.json')) as f:
+        return json.load(f)
+
+
+def hasOutputs(spec, sex='M'):
+    ''' Returns True if the store's totals can be used for sex.'''
+    outputs = spec['outputs']
+    return (outputs is not None and outputs['sex'] == sex
+            and outputs['version'] == resultcache.getDataVersion())
+
+
+def readChunks(path, chunkSize=1000000, sex='M'):
+    ''' Yields (columns, totals) for the store in the directory path,
+    chunkSize rows at a time: dictionaries of the input columns and of the
+    totals of every trip (see triplog.TOTALS). Columns are slices of the
+    memory maps; totals are too if the stored ones can be used.'''
+    spec, columns = openStore(path)
+    stored = hasOutputs(spec, sex)
+    for lo in range(0, spec['rows'], chunkSize):
+        chunk = {name:columns[name][lo:lo+chunkSize] for name in INPUTS}
+        if stored:
+            totals = {name:columns[name][lo:lo+chunkSize]
+                      for name in triplog.TOTALS}
+        else:
+            totals = triplog.evaluateTrips(chunk['distance'], chunk['trips'],
+                        chunk['category'], chunk['mode'], sex)
+        yield chunk, totals
+
+
+def aggregateStore(path, groupBy=('user', 'category'), chunkSize=1000000,
+                   sex='M'):
+    ''' The same as triplog.aggregate, for the store in the directory path.
+    Returns ({grouping: triplog.GroupTotals}, number of rows read).'''
+    groups = {g:triplog.GroupTotals(triplog.TOTALS) for g in groupBy}
+    nRows = 0
+    for chunk, totals in readChunks(path, chunkSize, sex):
+        for g in groupBy:
+            groups[g].add(chunk[triplog.GROUPS[g]], totals)
+        nRows += len(chunk['distance'])
+    # Turn the codes back into names
+    names = {'user':readUsers(path), 'category':engine.CATEGORIES}
+    for g, totals in groups.items():
+        totals.index = {names[g][k]:row for k, row in totals.index.items()}
+    return groups, nRows
+
+
+def main(argv=None):
+    ''' Parses the command line and converts a CSV trip log.'''
+    parser = argparse.ArgumentParser(description='Convert a CSV trip log '
+                'into binary columns for triplog.py.')
+    parser.add_argument('log', help="CSV trip log ('-' for stdin)")
+    parser.add_argument('store', help='directory to write the columns into')
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                help='rows read and converted at a time (default: 100000)')
+    parser.add_argument('--sex', choices=('M', 'F'), default='M',
+                help='sex used for the stored calorie burn (default: M)')
+    parser.add_argument('--no-outputs', action='store_true',
+                help="don't work out and store the totals of every trip")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    logFile = sys.stdin if args.log == '-' else open(args.log, newline='')
+    try:
+        nRows = convert(logFile, args.store, args.chunk_size, args.sex,
+                    not args.no_outputs)
+    finally:
+        if logFile is not sys.stdin:
+            logFile.close()
+    seconds = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(args.store, f))
+               for f in os.listdir(args.store))
+    print('%d rows in %.2f s, %.1f MB' % (nRows, seconds, size / 2**20),
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+'''
+units.py
+The units results can be shown in. Results are only worked out in their
+base units (hours, dollars, calories, lbs of CO2); every other unit is a
+conversion of one of those, declared here and done when the value is asked
+for, so nothing is worked out for units that aren't shown. For example, a
+new unit only needs:
+    units.registerUnit('time-podcasts', 'time', per=0.75)
+and then results['time-podcasts'] works for the results of
+engine.calculate, calculateModes, and calculateBatch.
+
+Conversions work on numbers, lists (of the scalar calcDict), and numpy
+arrays (of the batch results), so they are vectorized for batches.
+'''
+from collections.abc import MutableMapping
+
+# Unit conversions used by RunSim.calculate
+HOURS_PER_AUDIOBOOK = 12.59  # Avg length of 25 bestsellers on Audible.com
+DOLLARS_PER_COFFEE = 2.60    # Fancy coffee drink
+LBS_CO2_PER_TREE = 911       # CO2 sequestered by a tree (americanforests.org)
+
+
+class Unit:
+    ''' A unit that values of base (the name of a base result, e.g. 'time')
+    can be converted to: base values times scale, divided by per, or
+    passed to func (which must work on numbers and arrays).'''
+
+    def __init__(self, name, base, scale=None, per=None, func=None):
+        if [scale, per, func].count(None) != 2:
+            raise ValueError('Give one of scale, per, or func for %s' % name)
+        self.name = name
+        self.base = base
+        self.scale = scale
+        self.per = per
+        self.func = func
+
+    def convert(self, value):
+        ''' Returns value (in the base unit) in this unit.'''
+        if isinstance(value, list):
+            return [self.convert(v) for v in value]
+        if self.scale is not None:
+            return value * self.scale
+        if self.per is not None:
+            return value / self.per
+        return self.func(value)
+
+    def describe(self):
+        ''' Returns the unit as text, e.g. "time / 12.59".'''
+        if self.scale is not None:
+            return '%s * %r' % (self.base, self.scale)
+        if self.per is not None:
+            return '%s / %r' % (self.base, self.per)
+        return '%s(%s)' % (getattr(self.func, '__name__', 'func'), self.base)
+
+
+# The registered units, in the order they were registered ({name: Unit})
+_units = {}
+
+
+def registerUnit(name, base, scale=None, per=None, func=None, replace=False):
+    ''' Adds a unit (see Unit). Raises ValueError if a unit with the same
+    name is registered, unless replace is True.'''
+    if name in _units and not replace:
+        raise ValueError('Unit already registered: %s' % name)
+    _units[name] = Unit(name, base, scale, per, func)
+
+
+def getUnit(name):
+    ''' Returns the Unit called name. Raises KeyError if there isn't one.'''
+    return _units[name]
+
+
+def getNames():
+    ''' Returns the names of the registered units, in order.'''
+    return tuple(_units)
+
+
+class Results(MutableMapping):
+    ''' A dictionary of results that holds values in their base units only.
+    Asking for a registered unit of a base value held (e.g. 'time-mins' of
+    'time') converts it then; the converted value isn't kept, so changing
+    the base value changes it too. Iterating over the keys gives the base
+    keys, then the units that can be converted to.'''
+
+    def __init__(self, base=None):
+        self.base = dict(base or {})
+
+    def __getitem__(self, key):
+        if key in self.base:
+            return self.base[key]
+        unit = _units.get(key)
+        if unit is None or unit.base not in self.base:
+            raise KeyError(key)
+        return unit.convert(self.base[unit.base])
+
+    def __setitem__(self, key, value):
+        self.base[key] = value
+
+    def __delitem__(self, key):
+        del self.base[key]
+
+    def __iter__(self):
+        yield from self.base
+        for name, unit in _units.items():
+            if name not in self.base and unit.base in self.base:
+                yield name
+
+    def __len__(self):
+        return sum(1 for k in self)
+
+    def __contains__(self, key):
+        return key in self.base or (key in _units
+                                    and _units[key].base in self.base)
+
+    def __repr__(self):
+        return 'Results(%r)' % self.base
+
+
+# The units of RunSim's radio buttons
+registerUnit('time-mins', 'time', scale=60)
+# Avg length of an audiobook, from a sample of 25 bestsellers on Audible.com
+registerUnit('time-audio', 'time', per=HOURS_PER_AUDIOBOOK)
+# Cost in terms of coffee at blue Mondays
+registerUnit('cost-coffee', 'cost', per=DOLLARS_PER_COFFEE)
+# A single tree planted thru americanforests.org sequesters 911 pounds of
+# CO2, so this is the number of trees one should plant to sequester it
+registerUnit('CO2-tree', 'CO2', per=LBS_CO2_PER_TREE)
+# The same for CO2 saved by not driving (e.g. the totals of triplog.py)
+registerUnit('CO2-saved-tree', 'CO2-saved', per=LBS_CO2_PER_TREE)
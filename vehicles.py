@@ -0,0 +1,170 @@
+'''
+vehicles.py
+A table of individual car models and their fuel economy (MPG), loaded from
+data/carMPG.csv (the 2014 models sampled from fueleconomy.gov to get the MPG
+of each category in Driver.catDict). Models can be looked up by name in
+constant time, found by prefix or by a close (fuzzy) match, and looked up
+for whole arrays of names at once for batch calculations.
+
+The CSV is parsed once and the table is saved next to it (carMPG.npz), so
+later runs load the compiled table instead of parsing the CSV again. The
+saved table is rebuilt whenever the CSV changes.
+'''
+import bisect
+import csv
+import difflib
+import os
+import numpy as np
+import engine
+from modes import Driver
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                        'carMPG.csv')
+
+# Car types used in the CSV, and the Driver.catDict category they belong to
+TYPE_CATEGORIES = {'small':'smallSedan', 'medium':'mediumSedan',
+                   'large':'largeSedan', '4wd':'4wdSport', 'minivan':'minivan'}
+
+# Loaded tables, so each process only loads a file once ({path: table})
+_tables = {}
+
+
+def normalize(model):
+    ''' Returns the form of a model name used for looking it up: lower
+    case, with runs of whitespace (even newlines) made single spaces.'''
+    return ' '.join(str(model).lower().split())
+
+
+class VehicleTable:
+    ''' Car models with their MPG and category. Each attribute is an array
+    (or list) with one entry per model:
+        models - model names, as written in the CSV
+        mpg    - fuel economy (miles/gal)
+        cat    - category code (an index into engine.CATEGORIES)
+    '''
+
+    def __init__(self, models, mpg, cat):
+        ''' Accepts lists of model names, MPGs, and categories (names from
+        Driver.catDict or codes) and builds the lookup indexes.'''
+        self.models = [' '.join(str(m).split()) for m in models]
+        self.mpg = np.asarray(mpg, dtype=float)
+        self.cat = engine.catCodes(np.asarray(cat))
+        keys = [normalize(m) for m in self.models]
+        self.index = {k:i for i, k in enumerate(keys)}
+        self.sortedKeys = sorted(self.index)
+
+    @classmethod
+    def fromCSV(cls, path=CSV_PATH):
+        ''' Parses a CSV laid out like data/carMPG.csv: rows with a car type
+        (Small, Medium, ...), a model name, and its MPG in the second, third,
+        and fourth columns. Other rows (notes, averages) are skipped.'''
+        models, mpg, cat = [], [], []
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 4:
+                    continue
+                carType = row[1].strip().lower()
+                if carType not in TYPE_CATEGORIES or not row[2].strip():
+                    continue
+                models.append(row[2])
+                mpg.append(float(row[3]))
+                cat.append(TYPE_CATEGORIES[carType])
+        return cls(models, mpg, cat)
+
+    def save(self, path, stamp):
+        ''' Saves the table as a .npz file, along with a stamp identifying
+        the version of the CSV it came from. The file is written under a
+        temporary name and then renamed, so other processes never see a
+        half-written table.'''
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, models=np.array(self.models), mpg=self.mpg,
+                     cat=np.array(engine.CATEGORIES)[self.cat], stamp=stamp)
+        os.replace(tmpPath, path)
+
+    def __len__(self):
+        return len(self.models)
+
+    def find(self, model):
+        ''' Returns the row of a model (the name is not case sensitive).
+        Raises KeyError if the model isn't in the table.'''
+        return self.index[normalize(model)]
+
+    def getMPG(self, model):
+        ''' Returns the MPG of a model.'''
+        return self.mpg[self.find(model)]
+
+    def getCO2(self, model):
+        ''' Returns the CO2 emitted driving a model, in lbs/mile.'''
+        return Driver.LBS_CO2_PER_GAL / self.getMPG(model)
+
+    def getCat(self, model):
+        ''' Returns the Driver.catDict category of a model.'''
+        return engine.CATEGORIES[self.cat[self.find(model)]]
+
+    def search(self, prefix):
+        ''' Returns the names of all models starting with prefix.'''
+        prefix = normalize(prefix)
+        i = bisect.bisect_left(self.sortedKeys, prefix)
+        found = []
+        while i < len(self.sortedKeys) and self.sortedKeys[i].startswith(prefix):
+            found.append(self.models[self.index[self.sortedKeys[i]]])
+            i += 1
+        return found
+
+    def fuzzy(self, model, n=5, cutoff=0.6):
+        ''' Returns the names of up to n models whose names are closest to
+        model (e.g. for misspellings), best match first.'''
+        keys = difflib.get_close_matches(normalize(model), self.sortedKeys, n,
+                    cutoff)
+        return [self.models[self.index[k]] for k in keys]
+
+    def lookup(self, models):
+        ''' Accepts an array of model names and returns an array of their
+        rows. Only the unique names are looked up, so this is cheap for large
+        arrays. Raises KeyError for a model that isn't in the table.'''
+        names, inverse = np.unique(np.asarray(models), return_inverse=True)
+        rows = np.array([self.find(m) for m in names.tolist()], dtype=np.intp)
+        return rows[inverse].reshape(np.shape(models))
+
+    def getMPGs(self, models):
+        ''' Returns an array of the MPG of each model in an array.'''
+        return self.mpg[self.lookup(models)]
+
+    def getCO2s(self, models):
+        ''' Returns an array of the CO2 (lbs/mile) of each model in an array.'''
+        return Driver.LBS_CO2_PER_GAL / self.getMPGs(models)
+
+
+def getStamp(path):
+    ''' Returns something that changes whenever the file at path does.'''
+    info = os.stat(path)
+    return np.array([info.st_mtime_ns, info.st_size])
+
+
+def loadVehicles(path=CSV_PATH, cachePath=None):
+    ''' Returns the VehicleTable for a CSV. Within a process the table is
+    only loaded once. Across processes, the compiled table saved at
+    cachePath (default: the CSV's path ending in .npz) is used if it is
+    up to date; otherwise the CSV is parsed and the compiled table saved
+    (if the directory can be written to).'''
+    if path in _tables:
+        return _tables[path]
+    if cachePath is None:
+        cachePath = os.path.splitext(path)[0] + '.npz'
+    stamp = getStamp(path)
+
+    table = None
+    if os.path.exists(cachePath):
+        with np.load(cachePath) as saved:
+            if np.array_equal(saved['stamp'], stamp):
+                table = VehicleTable(saved['models'], saved['mpg'],
+                            saved['cat'])
+    if table is None:
+        table = VehicleTable.fromCSV(path)
+        try:
+            table.save(cachePath, stamp)
+        except OSError:
+            pass    # Can't write there; parse again next time
+    _tables[path] = table
+    return table
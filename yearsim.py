@@ -0,0 +1,244 @@
+'''
+yearsim.py
+Simulates a whole year of daily commutes for many users at once, instead of
+multiplying a single trip with the trips slider. Each user has a one-way
+distance, a number of trips per commute day, and a weekly schedule of modes,
+and on bad-weather days their biking and walking days become a fallback
+mode (driving, by default). For example:
+    >> python3 yearsim.py --users 100000 --bad-weather 0.25 -o totals.csv
+    >> python3 yearsim.py users.csv --weather weather.csv -o totals.csv
+
+A users CSV has a header row and these columns (only dist and schedule are
+required):
+    user       - anything identifying the user
+    dist       - one-way miles
+    schedule   - the mode on each day of the week, Monday first, e.g.
+                 'DBDBW--' (D drive, B bike, W walk, - no commute)
+    trips      - trips per commute day (default 2, there and back)
+    fallback   - D, B, or W, used on bad-weather days instead of B or W
+    cat, sex, bikeSpend, shoeSpend - as for engine.calculateBatch
+A weather CSV has one row per day of the year with a 'bad' column (1 or 0).
+
+The (users x days) matrix of modes is built for a chunk of users at a time
+with numpy indexing, and the results for each user come from the per-trip
+values of engine.calculateBatch (the formulas of RunSim.calculate) times
+the number of days spent in each mode. Totals per user use the names of
+triplog.TOTALS, and the running totals over the year are kept for everyone
+together.
+'''
+import argparse
+import csv
+import sys
+import time
+import numpy as np
+import engine
+import triplog
+
+DAYS = 365
+
+# Letters of the weekly schedules, and the mode (column of engine.MODES)
+SCHEDULE_CODES = {'D':0, 'B':1, 'W':2, '-':-1}
+
+
+def parseSchedules(schedules):
+    ''' Accepts a list (or array) of weekly schedule strings and returns an
+    array of mode codes with one row per schedule and one column per day of
+    the week (-1 where there's no commute).'''
+    names, inverse = np.unique(np.asarray(schedules), return_inverse=True)
+    table = np.empty((len(names), 7), dtype=np.int8)
+    for i, s in enumerate(names.tolist()):
+        s = s.strip().upper()
+        if len(s) != 7 or any(c not in SCHEDULE_CODES for c in s):
+            raise ValueError('Bad schedule: %r (needs 7 of %s)' % (s,
+                        ''.join(SCHEDULE_CODES)))
+        table[i] = [SCHEDULE_CODES[c] for c in s]
+    return table[inverse.ravel()]
+
+
+def makeWeather(rng, badChance, days=DAYS):
+    ''' Returns a random array of bad-weather days (True where bad). badChance
+    is the chance of a bad day, either one number or 12 (one per month).'''
+    badChance = np.asarray(badChance, dtype=float)
+    if badChance.ndim:
+        month = np.minimum(np.arange(days) * 12 // days, 11)
+        badChance = badChance[month]
+    return rng.random(days) < badChance
+
+
+def simulateYear(dist, schedule, weather=None, fallback=0, tripsPerDay=2,
+                 cat='average', bikeSpend=100.0, shoeSpend=37.5, sex='M',
+                 startWeekday=0, days=DAYS, chunkSize=20000):
+    ''' Simulates days days of commuting for every user. The parameters may
+    be scalars or arrays with one value per user:
+        dist         - one-way miles
+        schedule     - array of mode codes (users x 7, see parseSchedules),
+                       or one row for everyone
+        weather      - bad-weather days: None, an array of days, or an
+                       array of users x days
+        fallback     - mode code used instead of biking or walking on
+                       bad-weather days
+        tripsPerDay  - trips on each commute day
+        cat, bikeSpend, shoeSpend, sex - as for engine.calculateBatch
+    startWeekday is the day of the week of the first day (0 = Monday).
+    Returns (totals, daily, modeDays): totals is {name: array with one
+    value per user} for every name in triplog.TOTALS, daily is {name: array
+    of the running total of everyone over the days}, and modeDays has one
+    row per user with the days spent in each mode.'''
+    dist = np.atleast_1d(np.asarray(dist, dtype=float))
+    schedule = np.atleast_2d(np.asarray(schedule, dtype=np.int8))
+    n = max(len(dist), len(schedule))
+    params = np.broadcast_arrays(dist, fallback, tripsPerDay,
+                engine.catCodes(cat), bikeSpend, shoeSpend, engine.isMale(sex))
+    dist, fallback, tripsPerDay, cat, bikeSpend, shoeSpend, male = [
+        np.broadcast_to(p, (n,)) for p in params]
+    schedule = np.broadcast_to(schedule, (n, 7))
+    if weather is not None:
+        weather = np.asarray(weather, dtype=bool)
+    weekday = (startWeekday + np.arange(days)) % 7
+
+    totals = {name:np.zeros(n) for name in triplog.TOTALS}
+    daily = np.zeros((days, len(triplog.TOTALS)))
+    modeDays = np.zeros((n, 3), dtype=np.int32)
+
+    for lo in range(0, n, chunkSize):
+        hi = min(lo + chunkSize, n)
+        modes = schedule[lo:hi][:, weekday]     # users x days
+        if weather is not None:
+            bad = weather[lo:hi] if weather.ndim == 2 else weather
+            modes = np.where(bad & (modes > 0), fallback[lo:hi, None],
+                        modes).astype(np.int8)
+
+        # Results of one day's commute in each mode
+        perDay = engine.calculateBatch(dist[lo:hi], tripsPerDay[lo:hi],
+                    cat[lo:hi], bikeSpend[lo:hi], shoeSpend[lo:hi],
+                    male[lo:hi])
+        perDay['trips'] = np.repeat(tripsPerDay[lo:hi, None], 3, axis=1)
+        perDay['miles'] = perDay['trips'] * dist[lo:hi, None]
+        CO2 = perDay['CO2']
+        zero = np.zeros_like(CO2)
+        perDay['CO2'] = np.column_stack([CO2, zero, zero])
+        perDay['CO2-saved'] = np.column_stack([zero, CO2, CO2])
+
+        for k in range(3):
+            inMode = (modes == k)
+            modeDays[lo:hi, k] = inMode.sum(axis=1)
+            values = np.column_stack([perDay[name][:, k]
+                                      for name in triplog.TOTALS])
+            # Everyone's total for each day, without a users x days array
+            # of values: (days x users) @ (users x totals)
+            daily += inMode.T.astype(np.float32) @ values.astype(np.float32)
+        for name in triplog.TOTALS:
+            totals[name][lo:hi] = (perDay[name] * modeDays[lo:hi]).sum(axis=1)
+
+    daily = np.cumsum(daily, axis=0)
+    return totals, {name:daily[:, i] for i, name in
+                    enumerate(triplog.TOTALS)}, modeDays
+
+
+def makeUsers(rng, n):
+    ''' Returns random users (a dictionary of columns, as read from a users
+    CSV), for trying out the simulation.'''
+    letters = np.array(list('DBW-'))
+    week = rng.choice(letters[:3], size=(n, 7), p=(0.5, 0.3, 0.2))
+    week[:, 5:] = np.where(rng.random((n, 2)) < 0.8, '-', week[:, 5:])
+    return {'user':np.arange(n).astype(str),
+            'dist':np.round(rng.gamma(2.0, 3.0, n), 2),
+            'schedule':np.array([''.join(w) for w in week]),
+            'cat':rng.choice(engine.CATEGORIES, n),
+            'sex':rng.choice(['M', 'F'], n)}
+
+
+def readUsers(path):
+    ''' Reads a users CSV and returns a dictionary of its columns.'''
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader)]
+        rows = [r for r in reader if r]
+    columns = dict(zip(header, (np.array(c) for c in zip(*rows))))
+    for need in ('dist', 'schedule'):
+        if need not in columns:
+            raise ValueError('Users file has no %s column' % need)
+    if 'user' not in columns:
+        columns['user'] = np.arange(len(rows)).astype(str)
+    return columns
+
+
+def readWeather(path, days=DAYS):
+    ''' Reads a weather CSV and returns its array of bad-weather days.'''
+    with open(path, newline='') as f:
+        bad = [r['bad'].strip().lower() in ('1', 'true', 'yes')
+               for r in csv.DictReader(f)]
+    if len(bad) < days:
+        raise ValueError('Weather file has %d days, needs %d' % (len(bad), days))
+    return np.array(bad[:days])
+
+
+def runUsers(users, weather=None, startWeekday=0, days=DAYS):
+    ''' Runs simulateYear for a dictionary of user columns.'''
+    kwargs = {}
+    for name in ('cat', 'bikeSpend', 'shoeSpend', 'sex'):
+        if name in users:
+            kwargs[name] = users[name]
+    for name in ('bikeSpend', 'shoeSpend'):
+        if name in kwargs:
+            kwargs[name] = kwargs[name].astype(float)
+    if 'trips' in users:
+        kwargs['tripsPerDay'] = users['trips'].astype(float)
+    if 'fallback' in users:
+        kwargs['fallback'] = np.array([SCHEDULE_CODES[c.strip().upper()]
+                                       for c in users['fallback']])
+    return simulateYear(users['dist'].astype(float),
+                parseSchedules(users['schedule']), weather,
+                startWeekday=startWeekday, days=days, **kwargs)
+
+
+def main(argv=None):
+    ''' Parses the command line, runs the simulation, writes the totals of
+    every user, and prints the totals of everyone.'''
+    parser = argparse.ArgumentParser(description='Simulate a year of daily '
+                'commutes for many users.')
+    parser.add_argument('users', nargs='?', help='users CSV (default: '
+                'random users, see --users)')
+    parser.add_argument('--users', type=int, default=100000, dest='nUsers',
+                help='number of random users if no CSV is given')
+    parser.add_argument('--weather', help='weather CSV (one row per day)')
+    parser.add_argument('--bad-weather', type=float, nargs='+', default=None,
+                help='chance of a bad-weather day (one, or 12 by month), if '
+                'there is no weather CSV')
+    parser.add_argument('--start-weekday', type=int, default=0,
+                help='day of the week of January 1st (0 = Monday)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-o', '--output', help='CSV file for the totals of '
+                'every user')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    users = readUsers(args.users) if args.users else makeUsers(rng, args.nUsers)
+    weather = None
+    if args.weather:
+        weather = readWeather(args.weather)
+    elif args.bad_weather:
+        weather = makeWeather(rng, args.bad_weather[0]
+                    if len(args.bad_weather) == 1 else args.bad_weather)
+
+    start = time.perf_counter()
+    totals, daily, modeDays = runUsers(users, weather, args.start_weekday)
+    seconds = time.perf_counter() - start
+    n = len(users['dist'])
+    print('%d users x %d days in %.2f s' % (n, DAYS, seconds), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['user', 'days[driver]', 'days[biker]',
+                        'days[walker]'] + list(triplog.TOTALS))
+            for i in range(n):
+                writer.writerow([users['user'][i]] + modeDays[i].tolist()
+                            + ['%.6g' % totals[t][i] for t in triplog.TOTALS])
+
+    print('%-16s %16s' % ('total', 'everyone'))
+    for name in triplog.TOTALS:
+        print('%-16s %16.6g' % (name, daily[name][-1]))
+
+if __name__ == "__main__":
+    main()